@@ -18,6 +18,23 @@ class JavaType(_enum.Enum):
 	long = 11
 jtype = JavaType # alternate name
 
+class RootKind(_enum.Enum):
+	unknown         = 0xff
+	jni_global      = 0x01
+	jni_local       = 0x02
+	java_frame      = 0x03
+	native_stack    = 0x04
+	sticky_class    = 0x05
+	thread_block    = 0x06
+	monitor_used    = 0x07
+	thread_object   = 0x08
+	interned_string = 0x89
+	debugger        = 0x8b
+	vm_internal     = 0x8d
+	jni_monitor     = 0x8e
+
 from ._parsing import open, parse
+from ._scan import scan, Visitor
+from ._histogram import histogram, diff
 
-from .heap import cast
+from .heap import cast, as_ndarray
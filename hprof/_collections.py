@@ -0,0 +1,212 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+from . import heap as _heap
+from .error import FormatError
+
+class CollectionView(object):
+	''' The contents of a Java collection object, see Heap.collection_view().
+
+	kind is 'map', 'set' or 'list'. Iterating over a map gives (key, value)
+	pairs; over a set or list, its elements. size is the number of entries
+	or elements, and capacity is the length of the internal array (0 if it
+	has not been allocated). empty_slots is the number of unused slots in
+	that array. '''
+
+	__slots__ = ('heap', 'collection', 'kind', 'capacity', 'empty_slots', '_size', '_iter')
+
+	def __init__(self, heap, collection, kind, size, capacity, empty_slots, it):
+		self.heap = heap
+		self.collection = collection
+		self.kind = kind
+		self.capacity = capacity
+		self.empty_slots = empty_slots
+		self._size = size # None if it must be counted
+		self._iter = it
+
+	@property
+	def size(self):
+		if self._size is None:
+			self._size = sum(1 for entry in self._iter())
+		return self._size
+
+	def __len__(self):
+		return self.size
+
+	def __iter__(self):
+		return self._iter()
+
+	@property
+	def fill_ratio(self):
+		''' size / capacity, or None if there is no internal array. '''
+		if not self.capacity:
+			return None
+		return self.size / self.capacity
+
+	@property
+	def wasted_bytes(self):
+		''' the size of the empty slots in the internal array. '''
+		return self.empty_slots * self.heap._idsize
+
+	def __repr__(self):
+		return '<%s of %r size=%d capacity=%d>' % (type(self).__name__, self.collection, self.size, self.capacity)
+
+
+_required = object()
+
+class _Reader(object):
+	''' Reads instance fields by name, with the indices into the values from
+	Heap._field_values() looked up once per class. '''
+
+	def __init__(self, heap):
+		self.heap = heap
+		self._ixs = {} # (class, field name) -> value index, or None
+
+	def index(self, cls, name):
+		key = (cls, name)
+		try:
+			return self._ixs[key]
+		except KeyError:
+			pass
+		ix = None
+		t = cls
+		while t is not _heap.JavaObject:
+			if name in t._hprof_ifieldix:
+				ix = _heap._field_index(t, name)
+				break
+			t, = t.__bases__
+		self._ixs[key] = ix
+		return ix
+
+	def has(self, cls, name):
+		return self.index(cls, name) is not None
+
+	def get(self, cls, vals, name, default=_required):
+		ix = self.index(cls, name)
+		if ix is None:
+			if default is _required:
+				raise FormatError('%s has no %s field' % (cls, name))
+			return default
+		return vals[ix]
+
+	def obj(self, val):
+		''' the object for a reference field value. '''
+		if type(val) is int:
+			return self.heap._deref(val)
+		return val
+
+	def elements(self, arr):
+		''' the elements of an object array, or () for null. '''
+		if _isnull(arr):
+			return ()
+		return self.heap._array_elements(_unref(arr))
+
+def _isnull(val):
+	return val is None or val == 0
+
+def _unref(val):
+	''' an id, or the object if val is not one. '''
+	if type(val) is _heap.Ref:
+		return _heap.Ref._target.__get__(val)
+	return val
+
+
+def _hashmap(reader, cls, vals):
+	''' java.util.HashMap and ConcurrentHashMap, which chain nodes from a
+	table array; also the HashMap of older Android versions. '''
+	table = reader.elements(reader.get(cls, vals, 'table'))
+	size = reader.get(cls, vals, 'size', None)
+	nullentry = reader.get(cls, vals, 'entryForNullKey', None) # old Android
+	def entries():
+		if not _isnull(nullentry):
+			yield from _chain(reader, nullentry, 0, 1)
+		n = len(table)
+		for ix, node in enumerate(table):
+			if not _isnull(node):
+				yield from _chain(reader, node, ix, n)
+	return 'map', size, len(table), table.count(0) + table.count(None), entries
+
+def _chain(reader, node, ix, n):
+	''' the entries of bin ix in a table of n bins. '''
+	obj = reader.obj
+	while not _isnull(node):
+		ncls, nvals = reader.heap._field_values(_unref(node))
+		if reader.has(ncls, 'first'):
+			# a ConcurrentHashMap TreeBin; its nodes are also in a list.
+			node = reader.get(ncls, nvals, 'first')
+			continue
+		if reader.has(ncls, 'nextTable'):
+			# a ConcurrentHashMap ForwardingNode, while resizing; the
+			# entries of this bin were moved to the bins of the next table
+			# that it was split into, leaving only this node behind.
+			nexttable = reader.elements(reader.get(ncls, nvals, 'nextTable'))
+			m = len(nexttable)
+			if m <= n:
+				raise FormatError('ForwardingNode to a table of %d bins, from one of %d' % (m, n))
+			for nix in range(ix, m, n):
+				yield from _chain(reader, nexttable[nix], nix, m)
+			return
+		value = 'value' if reader.has(ncls, 'value') else 'val'
+		yield obj(reader.get(ncls, nvals, 'key')), obj(reader.get(ncls, nvals, value))
+		node = reader.get(ncls, nvals, 'next')
+
+def _hashset(reader, cls, vals):
+	''' java.util.HashSet, which keeps its elements as the keys of a map. '''
+	mapref = reader.get(cls, vals, 'map')
+	if _isnull(mapref):
+		return 'set', 0, 0, 0, lambda: iter(())
+	mapcls, mapvals = reader.heap._field_values(_unref(mapref))
+	kind, size, capacity, empty, entries = _decoder(mapcls)(reader, mapcls, mapvals)
+	def keys():
+		for key, value in entries():
+			yield key
+	return 'set', size, capacity, empty, keys
+
+def _arraylist(reader, cls, vals):
+	''' java.util.ArrayList; the array is called array on older Android
+	versions. '''
+	name = 'elementData' if reader.has(cls, 'elementData') else 'array'
+	elems = reader.elements(reader.get(cls, vals, name))
+	size = reader.get(cls, vals, 'size')
+	def elements():
+		obj = reader.obj
+		for ix in range(size):
+			yield obj(elems[ix])
+	return 'list', size, len(elems), len(elems) - size, elements
+
+_decoders = {
+	'java.util.HashMap': _hashmap,
+	'java.util.concurrent.ConcurrentHashMap': _hashmap,
+	'java.util.HashSet': _hashset,
+	'java.util.ArrayList': _arraylist,
+}
+
+def _decoder(cls):
+	t = cls
+	while t is not _heap.JavaObject:
+		try:
+			return _decoders[str(t)]
+		except KeyError:
+			t, = t.__bases__
+	raise TypeError('%s is not a supported collection class' % cls)
+
+def view(heap, obj, reader=None):
+	if reader is None:
+		reader = _Reader(heap)
+	obj = _unref(obj)
+	if isinstance(obj, _heap.JavaClass) or isinstance(type(obj), _heap.JavaArrayClass):
+		raise TypeError('%r is not a supported collection' % (obj,))
+	cls, vals = heap._field_values(obj)
+	kind, size, capacity, empty, it = _decoder(cls)(reader, cls, vals)
+	return CollectionView(heap, obj, kind, size, capacity, empty, it)
+
+def report(heap):
+	reader = _Reader(heap)
+	out = []
+	for name in _decoders:
+		for cls in heap.classes.get(name, ()):
+			for obj in heap.all_instances(cls):
+				v = view(heap, obj, reader)
+				out.append((obj, v.size, v.capacity, v.fill_ratio, v.wasted_bytes))
+	out.sort(key=lambda row: -row[4])
+	return out
@@ -0,0 +1,367 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import heapq
+
+from array import array
+from bisect import bisect_left
+
+from . import heap as _heap
+from ._heap_parsing import DeferredRef, _layout
+
+class ObjectGraph(object):
+	''' The references between all objects in a heap. Objects are numbered
+	densely, in object id order; the outgoing references of object number ix
+	are targets[offsets[ix]:offsets[ix+1]], also as object numbers. This
+	compressed sparse row layout needs a few bytes per reference, rather
+	than a Python object or two.
+
+	References to objects that are not in the heap are left out. '''
+
+	__slots__ = ('ids', 'offsets', 'targets', 'sizes', 'classids')
+
+	def __init__(self, ids):
+		self.ids = ids
+		self.offsets = array('Q', (0,))
+		self.targets = array('I')
+		self.sizes = array('Q') # shallow size of each object, see Heap.shallow_size()
+		self.classids = {} # JavaClass -> object id
+
+	def __len__(self):
+		return len(self.ids)
+
+	def index(self, objid):
+		''' returns the object number of objid. '''
+		ids = self.ids
+		ix = bisect_left(ids, objid)
+		if ix < len(ids) and ids[ix] == objid:
+			return ix
+		raise KeyError(objid)
+
+	def _add(self, refids, size):
+		ids = self.ids
+		n = len(ids)
+		targets = self.targets
+		for refid in refids:
+			if refid:
+				ix = bisect_left(ids, refid)
+				if ix < n and ids[ix] == refid:
+					targets.append(ix)
+		self.offsets.append(len(targets))
+		self.sizes.append(size)
+
+
+def build_graph(heap, progress_callback=None):
+	''' returns the ObjectGraph of all objects in heap. Indexed heaps are
+	read straight from the file data, without creating any objects. '''
+	classids = {
+		obj: objid
+		for objid, obj in dict.items(heap)
+		if isinstance(obj, _heap.JavaClass)
+	}
+	if heap._table is None:
+		objects = heap._objects
+		if not objects._sorted:
+			objects._sort()
+		clspairs = sorted((objid, cls) for cls, objid in classids.items())
+		graph = ObjectGraph(array('Q', heapq.merge(map(_first, clspairs), objects.ids)))
+		pairs = heapq.merge(clspairs, zip(objects.ids, objects.objs), key=_first)
+		references = _object_references
+	else:
+		pairs = ((objid, row) for row, objid in enumerate(heap._table.ids))
+		graph = ObjectGraph(heap._table.ids)
+		references = _row_references
+	graph.classids = classids
+
+	total = len(graph)
+	if progress_callback:
+		progress_callback('building object graph', 0, total)
+	refcache = {}
+	for ix, (objid, obj) in enumerate(pairs):
+		if progress_callback and ix & 0xffff == 0:
+			progress_callback('building object graph', ix, total)
+		refids, size = references(heap, obj, classids, refcache)
+		graph._add(refids, size)
+	if progress_callback:
+		progress_callback('building object graph', total, total)
+	return graph
+
+def _first(pair):
+	return pair[0]
+
+def _refid(val, classids):
+	''' the object id of a reference field value, which may be resolved. '''
+	if val is None:
+		return 0
+	if type(val) is int or type(val) is DeferredRef:
+		return val
+	if isinstance(val, _heap.JavaClass):
+		return classids.get(val, 0)
+	return _heap.JavaObject._hprof_id.__get__(val)
+
+def _superclass(cls):
+	bases = cls.__bases__
+	if len(bases) == 2:
+		return bases[1 - bases.index(_heap.JavaArray)]
+	return bases[0]
+
+def _class_references(cls, classids):
+	refids = [classids.get(_superclass(cls), 0)]
+	for val in cls._hprof_sfields.values():
+		if type(val) is DeferredRef or isinstance(val, (_heap.JavaObject, _heap.JavaClass)):
+			refids.append(_refid(val, classids))
+	return refids, 0
+
+def _object_references(heap, obj, classids, refcache):
+	''' the ids of the objects that obj refers to (including its class), and
+	its shallow size. '''
+	if isinstance(obj, _heap.JavaClass):
+		return _class_references(obj, classids)
+	cls = type(obj)
+	refids = [classids[cls]]
+	if isinstance(cls, _heap.JavaArrayClass):
+		data = obj._hprof_array_data
+		if type(data) is _heap._RefArrayData:
+			if data.objs is None:
+				refids.extend(data._decoded())
+			else:
+				refids.extend(_refid(val, classids) for val in data.objs)
+			return refids, heap._array_size(len(data) * heap._idsize)
+		return refids, heap._array_size(len(data.bytes))
+	try:
+		ixs, size = refcache[cls]
+	except KeyError:
+		ixs = _heap._reference_fields(cls)
+		size = heap._instance_size(cls)
+		refcache[cls] = ixs, size
+	vals = _heap.JavaObject._hprof_ifieldvals.__get__(obj)
+	for ix in ixs:
+		refids.append(_refid(vals[ix], classids))
+	return refids, size
+
+def _row_references(heap, row, classids, refcache):
+	''' like _object_references(), but reading object table row of an
+	indexed heap from the file data. '''
+	table = heap._table
+	kind = table.kinds[row]
+	if kind == 0x20:
+		return _class_references(heap[table.ids[row]], classids)
+	idsize = heap._idsize
+	clsid = table.clsids[row]
+	offset = table.offsets[row]
+	end = offset + table.lengths[row]
+	if kind == 0x23:
+		return (clsid,), heap._array_size(end - offset - idsize - 9)
+	data = heap._data[offset + 2 * idsize + 8 : end]
+	if kind == 0x22:
+		refids = [clsid]
+		refids.extend(_heap._decode_ids(data, idsize))
+		return refids, heap._array_size(len(data))
+	try:
+		layout, ixs, size = refcache[clsid]
+	except KeyError:
+		cls = heap[clsid]
+		layout = _layout(heap, cls, idsize)
+		ixs = _heap._reference_fields(cls)
+		size = heap._instance_size(cls)
+		refcache[clsid] = layout, ixs, size
+	vals = layout.unpack(data)
+	refids = [clsid]
+	refids.extend(vals[ix] for ix in ixs)
+	return refids, size
+
+
+def dominator_tree(graph, roots, progress_callback=None, preds=None):
+	''' computes the dominator tree of graph, whose entry is a virtual node
+	referring to each of the object numbers in roots, using the
+	Lengauer-Tarjan algorithm (the simple version, with path compression).
+	preds is the result of reverse_edges(graph), if it is already known.
+
+	Returns the immediate dominator of each object, as an object number or
+	-1 if it is the virtual node, or -2 for objects that cannot be reached,
+	and the retained size of each object. '''
+	n = len(graph)
+	offsets, targets = graph.offsets, graph.targets
+	if progress_callback:
+		progress_callback('computing dominators', 0, 3)
+
+	# depth first search from the virtual node, numbering nodes in preorder.
+	# Preorder number 0 is the virtual node.
+	dfnum = array('l', (-1,)) * n
+	vertex = array('l', (-1,))
+	parent = array('l', (-1,))
+	isroot = bytearray(n)
+	stack = array('l')
+	stackparent = array('l')
+	for ix in reversed(roots):
+		isroot[ix] = 1
+		stack.append(ix)
+		stackparent.append(0)
+	while stack:
+		ix = stack.pop()
+		p = stackparent.pop()
+		if dfnum[ix] >= 0:
+			continue
+		num = dfnum[ix] = len(vertex)
+		vertex.append(ix)
+		parent.append(p)
+		for t in reversed(targets[offsets[ix] : offsets[ix+1]]):
+			if dfnum[t] < 0:
+				stack.append(t)
+				stackparent.append(num)
+	del stack, stackparent
+	if progress_callback:
+		progress_callback('computing dominators', 1, 3)
+
+	if preds is None:
+		preds = reverse_edges(graph)
+	poffsets, psources = preds
+	m = len(vertex)
+	semi = array('l', range(m))
+	label = array('l', range(m))
+	ancestor = array('l', (-1,)) * m
+	idom = array('l', (0,)) * m
+	bucket = array('l', (-1,)) * m # first node in each bucket
+	nextinbucket = array('l', (-1,)) * m
+	path = []
+
+	def evaluate(v):
+		if ancestor[v] < 0:
+			return v
+		# path compression, without recursion
+		x = v
+		while ancestor[ancestor[x]] >= 0:
+			path.append(x)
+			x = ancestor[x]
+		while path:
+			x = path.pop()
+			a = ancestor[x]
+			if semi[label[a]] < semi[label[x]]:
+				label[x] = label[a]
+			ancestor[x] = ancestor[a]
+		return label[v]
+
+	for w in range(m - 1, 0, -1):
+		ix = vertex[w]
+		s = semi[w]
+		if isroot[ix]:
+			s = 0
+		for pred in psources[poffsets[ix] : poffsets[ix+1]]:
+			v = dfnum[pred]
+			if v >= 0:
+				u = semi[evaluate(v)]
+				if u < s:
+					s = u
+		semi[w] = s
+		nextinbucket[w] = bucket[s]
+		bucket[s] = w
+		p = parent[w]
+		ancestor[w] = p
+		v = bucket[p]
+		while v >= 0:
+			u = evaluate(v)
+			idom[v] = u if semi[u] < semi[v] else p
+			v = nextinbucket[v]
+		bucket[p] = -1
+	del preds, poffsets, psources, label, ancestor, bucket, nextinbucket
+	for w in range(1, m):
+		if idom[w] != semi[w]:
+			idom[w] = idom[idom[w]]
+	if progress_callback:
+		progress_callback('computing dominators', 2, 3)
+
+	# in preorder, dominators come before the nodes they dominate.
+	sizes = graph.sizes
+	retained = array('Q', (sizes[ix] for ix in vertex[1:]))
+	retained.insert(0, 0)
+	for w in range(m - 1, 0, -1):
+		retained[idom[w]] += retained[w]
+	outidom = array('l', (-2,)) * n
+	outretained = array('Q', (0,)) * n
+	for w in range(1, m):
+		ix = vertex[w]
+		outidom[ix] = vertex[idom[w]]
+		outretained[ix] = retained[w]
+	if progress_callback:
+		progress_callback('computing dominators', 3, 3)
+	return outidom, outretained
+
+def mark_reachable(graph, roots, progress_callback=None):
+	''' returns a bytearray with a 1 for each object number in graph that can
+	be reached from the object numbers in roots. '''
+	n = len(graph)
+	offsets, targets = graph.offsets, graph.targets
+	if progress_callback:
+		progress_callback('marking reachable objects', 0, 1)
+	marked = bytearray(n)
+	stack = array('l')
+	for ix in roots:
+		if not marked[ix]:
+			marked[ix] = 1
+			stack.append(ix)
+	while stack:
+		ix = stack.pop()
+		for t in targets[offsets[ix] : offsets[ix+1]]:
+			if not marked[t]:
+				marked[t] = 1
+				stack.append(t)
+	if progress_callback:
+		progress_callback('marking reachable objects', 1, 1)
+	return marked
+
+def path_to_root(preds, start, isroot, skip=None):
+	''' finds a shortest path from start back to an object number where
+	isroot is set, by a breadth first search through preds, the result of
+	reverse_edges(). References from src to t are not followed if skip(src, t)
+	is true.
+
+	Returns the object numbers along the path, from the root to start, or
+	None if there is none. '''
+	poffsets, psources = preds
+	visited = bytearray(len(poffsets) - 1)
+	queue = array('l', (start,))
+	parents = array('l', (-1,)) # queue position of the node that found each one
+	visited[start] = 1
+	pos = 0
+	while pos < len(queue):
+		t = queue[pos]
+		if isroot[t]:
+			path = []
+			while pos >= 0:
+				path.append(queue[pos])
+				pos = parents[pos]
+			return path
+		for src in psources[poffsets[t] : poffsets[t+1]]:
+			if not visited[src] and (skip is None or not skip(src, t)):
+				visited[src] = 1
+				queue.append(src)
+				parents.append(pos)
+		pos += 1
+	return None
+
+def reverse_edges(graph, progress_callback=None):
+	''' returns the offsets and sources of the incoming references of each
+	object in graph, in the same layout as its outgoing references. The
+	sources of each object are sorted. '''
+	n = len(graph)
+	if progress_callback:
+		progress_callback('indexing referrers', 0, 2)
+	targets = graph.targets
+	counts = array('Q', (0,)) * (n + 1)
+	for t in targets:
+		counts[t + 1] += 1
+	for ix in range(n):
+		counts[ix + 1] += counts[ix]
+	offsets = counts
+	if progress_callback:
+		progress_callback('indexing referrers', 1, 2)
+	fill = array('Q', offsets)
+	sources = array('I', (0,)) * len(targets)
+	goffsets = graph.offsets
+	for ix in range(n):
+		for t in targets[goffsets[ix] : goffsets[ix+1]]:
+			sources[fill[t]] = ix
+			fill[t] += 1
+	if progress_callback:
+		progress_callback('indexing referrers', 2, 2)
+	return offsets, sources
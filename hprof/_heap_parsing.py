@@ -2,34 +2,61 @@
 # Licensed under the LICENSE.
 
 import hprof
+import struct
 
 from .error import *
 
 from . import jtype
 
+from array import array
 from collections import OrderedDict
+from contextlib import contextmanager
 
 class DeferredRef(int):
 	__slots__ = ()
 
 record_parsers = {}
 
-# TODO: useful stuff in these.
-record_parsers[0xff] = lambda f, h, r: (r.id())
-record_parsers[0x01] = lambda f, h, r: (r.id(), r.id())
-record_parsers[0x02] = lambda f, h, r: (r.id(), r.u4(), r.u4())
-record_parsers[0x03] = lambda f, h, r: (r.id(), r.u4(), r.u4())
-record_parsers[0x04] = lambda f, h, r: (r.id(), r.u4())
-record_parsers[0x05] = lambda f, h, r: (r.id())
-record_parsers[0x06] = lambda f, h, r: (r.id(), r.u4())
-record_parsers[0x07] = lambda f, h, r: (r.id())
-record_parsers[0x08] = lambda f, h, r: (r.id(), r.u4(), r.u4())
-record_parsers[0x89] = lambda f, h, r: (r.id())
-record_parsers[0x8b] = lambda f, h, r: (r.id())
-record_parsers[0x8d] = lambda f, h, r: (r.id())
-record_parsers[0x8e] = lambda f, h, r: (r.id(), r.u4(), r.u4())
-
-record_parsers[0xfe] = lambda f, h, r: (r.u4(), r.id())
+def _root_parser(kind, read):
+	def parse_root(hf, heap, reader):
+		objid = reader.id()
+		thread, frame = read(reader)
+		heap._roots.append(kind, objid, thread, frame)
+	return parse_root
+
+def _jni_global(reader):
+	reader.id() # the JNI global ref id
+	return 0, -1
+
+def _thread_object(reader):
+	thread = reader.u4()
+	reader.u4() # stacktrace serial
+	return thread, -1
+
+_nothing      = lambda r: (0, -1)
+_thread       = lambda r: (r.u4(), -1)
+_thread_frame = lambda r: (r.u4(), r.i4())
+
+# GC roots; the thread serial and frame number are kept where there are any.
+record_parsers[0xff] = _root_parser(0xff, _nothing)
+record_parsers[0x01] = _root_parser(0x01, _jni_global)
+record_parsers[0x02] = _root_parser(0x02, _thread_frame)
+record_parsers[0x03] = _root_parser(0x03, _thread_frame)
+record_parsers[0x04] = _root_parser(0x04, _thread)
+record_parsers[0x05] = _root_parser(0x05, _nothing)
+record_parsers[0x06] = _root_parser(0x06, _thread)
+record_parsers[0x07] = _root_parser(0x07, _nothing)
+record_parsers[0x08] = _root_parser(0x08, _thread_object)
+record_parsers[0x89] = _root_parser(0x89, _nothing)
+record_parsers[0x8b] = _root_parser(0x8b, _nothing)
+record_parsers[0x8d] = _root_parser(0x8d, _nothing)
+record_parsers[0x8e] = _root_parser(0x8e, _thread_frame)
+
+def parse_heap_info(hf, heap, reader):
+	reader.u4() # heap type
+	reader.id() # heap name
+	heap._android = True # only ART writes these.
+record_parsers[0xfe] = parse_heap_info
 
 def parse_class(hf, heap, reader):
 	objid   = reader.id()
@@ -58,6 +85,8 @@ def parse_class(hf, heap, reader):
 		name = hf.names[nameid]
 		t = reader.jtype()
 		val = t.read(reader)
+		if t is jtype.object:
+			val = DeferredRef(val)
 		staticattrs[name] = val
 
 	instanceattrs = OrderedDict()
@@ -69,6 +98,8 @@ def parse_class(hf, heap, reader):
 		instanceattrs[name] = vtype
 
 	load = hf.classloads_by_id[objid]
+	if '.' in load.class_name:
+		heap._android = True # HotSpot names classes like java/lang/Object
 	if superid == 0:
 		supercls = None
 	else:
@@ -77,22 +108,26 @@ def parse_class(hf, heap, reader):
 		except KeyError:
 			if superid not in heap._deferred_classes:
 				heap._deferred_classes[superid] = []
-			heap._deferred_classes[superid].append((objid, load.class_name, staticattrs, instanceattrs))
+			heap._deferred_classes[superid].append((objid, load.class_name, objsize, staticattrs, instanceattrs))
 			return
 
-	def create(objid, cname, supercls, staticattrs, instanceattrs):
+	def create(objid, cname, objsize, supercls, staticattrs, instanceattrs):
 		clsname, cls = hprof.heap._create_class(heap.classtree, cname, supercls, staticattrs, instanceattrs)
+		cls._hprof_objsize = objsize
 		heap._instances[cls] = []
+		if isinstance(cls, hprof.heap.JavaArrayClass):
+			heap._array_nbytes[cls] = array('L')
 		if clsname not in heap.classes:
 			heap.classes[clsname] = []
 		heap.classes[clsname].append(cls)
+		cls._hprof_heap = heap
 		heap[objid] = cls
 		if objid in heap._deferred_classes:
 			deferred = heap._deferred_classes.pop(objid)
-			for objid, cname, staticattrs, instanceattrs in deferred:
-				create(objid, cname, cls, staticattrs, instanceattrs)
+			for objid, cname, objsize, staticattrs, instanceattrs in deferred:
+				create(objid, cname, objsize, cls, staticattrs, instanceattrs)
 
-	create(objid, load.class_name, supercls, staticattrs, instanceattrs)
+	create(objid, load.class_name, objsize, supercls, staticattrs, instanceattrs)
 record_parsers[0x20] = parse_class
 
 def parse_instance(hf, heap, reader):
@@ -104,29 +139,77 @@ def parse_instance(hf, heap, reader):
 	heap._deferred_objects.append((objid, strace, clsid, bytes))
 record_parsers[0x21] = parse_instance
 
+class InstanceLayout(object):
+	''' Decodes all instance field values of a class, including the ones
+	inherited from its super classes, with a single struct unpack. '''
+	__slots__ = ('struct', 'fixups')
+
+	def __init__(self, cls, idsize):
+		if idsize == 4:
+			idfmt = 'I'
+		elif idsize == 8:
+			idfmt = 'Q'
+		else:
+			idfmt = '%ds' % idsize
+		fmt = ['>']
+		fixups = []
+		ix = 0
+		while cls is not hprof.heap.JavaObject:
+			for atype in cls._hprof_ifields.values():
+				if atype is jtype.object:
+					fmt.append(idfmt)
+					if idsize not in (4, 8):
+						fixups.append((ix, _int_from_bytes))
+				elif atype is jtype.char:
+					fmt.append('H')
+					fixups.append((ix, chr))
+				else:
+					fmt.append(atype.packfmt)
+				ix += 1
+			cls, = cls.__bases__
+		self.struct = struct.Struct(''.join(fmt))
+		self.fixups = tuple(fixups)
+
+	def unpack(self, bytes):
+		vals = self.struct.unpack(bytes)
+		if self.fixups:
+			vals = list(vals)
+			for ix, fixup in self.fixups:
+				vals[ix] = fixup(vals[ix])
+			vals = tuple(vals)
+		return vals
+
+def _int_from_bytes(bytes):
+	return int.from_bytes(bytes, 'big')
+
+def _layout(heap, cls, idsize):
+	try:
+		return heap._layouts[cls]
+	except KeyError:
+		layout = heap._layouts[cls] = InstanceLayout(cls, idsize)
+		return layout
+
+def _create_instance(heap, cls, objid, bytes, idsize):
+	layout = _layout(heap, cls, idsize)
+	try:
+		vals = layout.unpack(bytes)
+	except struct.error as e:
+		raise FormatError('bad instance size for object 0x%x' % objid) from e
+	obj = cls(objid)
+	hprof.heap.JavaObject._hprof_ifieldvals.__set__(obj, vals)
+	return obj
+
 def create_instances(heap, idsize, progress):
-	from ._parsing import PrimitiveReader
 	until_report = 0
 	for ix, (objid, strace, clsid, bytes) in enumerate(heap._deferred_objects):
 		if until_report == 0:
 			until_report = 4096
 			progress(ix)
 		until_report -= 1
-		reader = PrimitiveReader(bytes, idsize)
-		exactcls = cls = heap[clsid]
-		obj = cls(objid)
-		while cls is not hprof.heap.JavaObject:
-			vals = tuple(
-					atype.read(reader)
-					for ix, (aname, atype)
-					in enumerate(cls._hprof_ifields.items())
-			)
-			assert len(vals) == len(cls._hprof_ifieldix), (len(vals), len(cls._hprof_ifieldix))
-			cls._hprof_ifieldvals.__set__(obj, vals)
-			cls, = cls.__bases__
-		assert reader._pos == len(bytes), (reader._pos, len(bytes))
-		heap._instances[exactcls].append(obj)
-		heap[objid] = obj
+		cls = heap[clsid]
+		obj = _create_instance(heap, cls, objid, bytes, idsize)
+		heap._instances[cls].append(obj)
+		heap._objects.add(objid, obj)
 	heap._deferred_objects.clear()
 
 def parse_object_array(hf, heap, reader):
@@ -134,7 +217,8 @@ def parse_object_array(hf, heap, reader):
 	strace = reader.u4()
 	length = reader.u4()
 	clsid = reader.id()
-	elems = tuple(reader.id() for ix in range(length))
+	idsize = reader._idsize
+	elems = hprof.heap._DeferredArrayData(jtype.object, reader.bytes(length * idsize), idsize)
 	heap._deferred_objarrays.append((objid, strace, clsid, elems))
 record_parsers[0x22] = parse_object_array
 
@@ -147,9 +231,10 @@ def create_objarrays(heap, progress):
 		until_report -= 1
 		cls = heap[clsid]
 		arr = cls(objid)
-		arr._hprof_array_data = elems
+		arr._hprof_array_data = hprof.heap._RefArrayData(heap, elems)
 		heap._instances[cls].append(arr)
-		heap[objid] = arr
+		heap._array_nbytes[cls].append(len(elems.bytes))
+		heap._objects.add(objid, arr)
 	heap._deferred_objarrays.clear()
 
 def parse_primitive_array(hf, heap, reader):
@@ -179,10 +264,12 @@ def create_primarrays(heap, progress):
 		arr = cls(objid)
 		arr._hprof_array_data = data
 		heap._instances[cls].append(arr)
-		heap[objid] = arr
+		heap._array_nbytes[cls].append(len(data.bytes))
+		heap._objects.add(objid, arr)
 	heap._deferred_primarrays.clear()
 
 def parse_heap(hf, heap, reader, progresscb):
+	parsers = record_parsers if heap._table is None else index_parsers
 	lastreport = 0
 	while True:
 		try:
@@ -193,49 +280,219 @@ def parse_heap(hf, heap, reader, progresscb):
 			lastreport = reader._pos
 			progresscb(lastreport)
 		try:
-			parser = record_parsers[rtype]
+			parser = parsers[rtype]
 		except KeyError as e:
 			# impossible to handle; we don't know how long this record type is.
 			raise FormatError('unrecognized heap record type 0x%x' % rtype) from e
 		parser(hf, heap, reader)
 
-def resolve_heap_references(heap, progresscb):
-	def lookup(addr):
-		if not addr:
-			return None
+# When scanning, objects are only recorded in the heap's object table. In
+# index mode, instances and arrays are created from the file data when they
+# are first accessed. Scanning does not touch the HprofFile, so that it can
+# be done by worker processes; class dumps are parsed by finish_scan().
+
+def index_class(hf, heap, reader):
+	start = reader._pos
+	objid = reader.id()
+	# stacktrace serial, super class, loader, signer, protection domain,
+	# two reserved ids, instance size
+	reader.skip(4 + 6 * reader._idsize + 4)
+	for i in range(reader.u2()): # constant pool
+		reader.u2()
+		reader.jtype().read(reader)
+	for i in range(reader.u2()): # static fields
+		reader.id()
+		reader.jtype().read(reader)
+	reader.skip(reader.u2() * (reader._idsize + 1)) # instance fields
+	heap._table.append(objid, 0, 0x20, reader._base + start, reader._pos - start)
+
+def index_instance(hf, heap, reader):
+	start = reader._pos
+	objid = reader.id()
+	strace = reader.u4()
+	clsid = reader.id()
+	reader.skip(reader.u4())
+	heap._table.append(objid, clsid, 0x21, reader._base + start, reader._pos - start)
+
+def index_object_array(hf, heap, reader):
+	start = reader._pos
+	objid = reader.id()
+	strace = reader.u4()
+	length = reader.u4()
+	clsid = reader.id()
+	reader.skip(length * reader._idsize)
+	heap._table.append(objid, clsid, 0x22, reader._base + start, reader._pos - start)
+
+def index_primitive_array(hf, heap, reader):
+	start = reader._pos
+	objid = reader.id()
+	strace = reader.u4()
+	length = reader.u4()
+	t = reader.jtype()
+	reader.skip(length * t.size)
+	# there's no class id in the record; finish_index() will replace the type.
+	heap._table.append(objid, t.value, 0x23, reader._base + start, reader._pos - start)
+
+index_parsers = dict(record_parsers)
+index_parsers[0x20] = index_class
+index_parsers[0x21] = index_instance
+index_parsers[0x22] = index_object_array
+index_parsers[0x23] = index_primitive_array
+
+def finish_index(heap, data, idsize):
+	''' sort the object table of an indexed heap, and group its rows by class. '''
+	table = heap._table
+	heap._data = data
+	heap._idsize = idsize
+	remap = not table._sorted # tables from a sidecar index are already finished
+	if remap:
+		table.finish()
+
+	classids = {}
+	for objid, kind in zip(table.ids, table.kinds):
+		if kind == 0x20:
+			classids[heap[objid]] = objid
+	primclsids = {}
+	for t in jtype:
+		clsname = t.name + '[]'
+		if t is not jtype.object and clsname in heap.classes:
+			cls, = heap.classes[clsname]
+			primclsids[t.value] = classids[cls]
+
+	rows = {}
+	clsids = table.clsids
+	for row, kind in enumerate(table.kinds):
+		if kind == 0x20:
+			continue
+		clsid = clsids[row]
+		if kind == 0x23 and remap:
+			try:
+				clsid = clsids[row] = primclsids[clsid]
+			except KeyError as e:
+				raise FormatError('class %s[] not found' % jtype(clsid).name) from e
 		try:
-			return heap[addr]
-		except KeyError as e:
-			raise hprof.error.MissingObject(hex(addr)) from e
+			rows[clsid].append(row)
+		except KeyError:
+			rows[clsid] = array('L', (row,))
+	heap._instance_rows = {heap[clsid]: clsrows for clsid, clsrows in rows.items()}
+
+def scan_segment(data, offset, length, idsize):
+	''' scan the heap records in data[offset:offset+length].
+
+	Returns the columns of the resulting object and root tables, and whether
+	the segment had any ART heap info records. '''
+	from ._index import ObjectTable
+	from ._parsing import PrimitiveReader
+	heap = hprof.heap.Heap()
+	table = heap._table = ObjectTable()
+	parse_heap(None, heap, PrimitiveReader(data[offset : offset + length], idsize, offset), None)
+	roots = heap._roots
+	return (
+		tuple(getattr(table, name) for name in table._columns),
+		tuple(getattr(roots, name) for name in roots._columns),
+		heap._android,
+	)
+
+# the file data, shared with forked worker processes while parsing in parallel.
+_worker_data = None
+
+def _worker_scan(offset, length, idsize):
+	return scan_segment(_worker_data, offset, length, idsize)
+
+@contextmanager
+def worker_pool(data, nworkers):
+	''' a process pool that scans heap segments of data, or None if worker
+	processes cannot share the data with this one. '''
+	global _worker_data
+	import multiprocessing
+	try:
+		ctx = multiprocessing.get_context('fork')
+	except ValueError:
+		yield None
+		return
+	_worker_data = data
+	try:
+		with ctx.Pool(nworkers) as pool:
+			yield pool
+	finally:
+		_worker_data = None
+
+def scan_in_worker(pool, heap, reader):
+	''' have a worker process scan the heap segment in reader. '''
+	args = (reader._base, len(reader._bytes), reader._idsize)
+	heap._scans.append(pool.apply_async(_worker_scan, args))
+
+def finish_scan(hf, heap, data, idsize):
+	''' collect the results of any worker scans into the heap's object
+	table, then parse the class dumps it lists, in file order. '''
+	from ._parsing import PrimitiveReader
+	table = heap._table
+	for scan in heap._scans:
+		columns, rootcolumns, android = scan.get()
+		table.extend(columns)
+		heap._roots.extend(rootcolumns)
+		heap._android |= android
+	heap._scans.clear()
+	classes = sorted(
+		(offset, length)
+		for kind, offset, length in zip(table.kinds, table.offsets, table.lengths)
+		if kind == 0x20
+	)
+	# detach the table while parsing, so only the classes themselves are found
+	heap._table = None
+	try:
+		for offset, length in classes:
+			parse_class(hf, heap, PrimitiveReader(data[offset : offset + length], idsize, offset))
+	finally:
+		heap._table = table
+
+def defer_scanned(heap, data, idsize):
+	''' queue the objects in a scanned heap's object table for creation, just
+	like the regular record parsers would have, and drop the table. '''
+	table = heap._table
+	heap._table = None
+	hdrsize = 2 * idsize + 8
+	for objid, clsid, kind, offset, length in zip(table.ids, table.clsids, table.kinds, table.offsets, table.lengths):
+		end = offset + length
+		# the stacktrace serials are not in the table.
+		if kind == 0x21:
+			heap._deferred_objects.append((objid, None, clsid, data[offset + hdrsize : end]))
+		elif kind == 0x22:
+			elems = hprof.heap._DeferredArrayData(jtype.object, data[offset + hdrsize : end], idsize)
+			heap._deferred_objarrays.append((objid, None, clsid, elems))
+		elif kind == 0x23:
+			# before finish_index(), the class id column holds the element type.
+			elems = hprof.heap._DeferredArrayData(jtype(clsid), data[offset + idsize + 9 : end])
+			heap._deferred_primarrays.append((objid, None, elems))
+
+def materialize(heap, row):
+	''' create the object described by a row in an indexed heap's object table. '''
+	from ._parsing import PrimitiveReader
+	table = heap._table
+	objid = table.ids[row]
+	kind = table.kinds[row]
+	if kind not in (0x21, 0x22, 0x23):
+		raise FormatError('cannot create object 0x%x from record kind 0x%x' % (objid, kind))
+	cls = heap[table.clsids[row]]
+	offset = table.offsets[row]
+	idsize = heap._idsize
+	reader = PrimitiveReader(heap._data[offset : offset + table.lengths[row]], idsize)
+	reader.id()  # object id
+	reader.u4()  # stacktrace serial
+	if kind == 0x21:
+		reader.id() # class id
+		obj = _create_instance(heap, cls, objid, reader.bytes(reader.u4()), idsize)
+	elif kind == 0x22:
+		length = reader.u4()
+		reader.id() # class id
+		elems = hprof.heap._DeferredArrayData(jtype.object, reader.bytes(length * idsize), idsize)
+		obj = cls(objid)
+		obj._hprof_array_data = hprof.heap._RefArrayData(heap, elems)
+	else:
+		length = reader.u4()
+		t = reader.jtype()
+		obj = cls(objid)
+		obj._hprof_array_data = hprof.heap._DeferredArrayData(t, reader.bytes(length * t.size))
+	dict.__setitem__(heap, objid, obj)
+	return obj
 
-	lastreport = 0
-	if progresscb:
-		progresscb(0)
-	for progress, obj in enumerate(heap.values()):
-		if progresscb and progress - lastreport >= 10000:
-			progresscb(progress)
-			lastreport = progress
-		cls = type(obj)
-		if isinstance(obj, hprof.heap.JavaArray):
-			# it's an array; is it an *object* array?
-			old = obj._hprof_array_data
-			# TODO: this check is probably a bit too fragile
-			if type(old) is not hprof.heap._DeferredArrayData:
-				obj._hprof_array_data = tuple(lookup(addr) for addr in old)
-		elif isinstance(obj, hprof.heap.JavaClass):
-			for name, val in obj._hprof_sfields.items():
-				if type(val) is DeferredRef:
-					obj._hprof_sfields[name] = lookup(val)
-		else:
-			# TODO: if/when we have fast per-class instance lookups, it may be faster to do
-			#       this one class at a time, rather than walking the hierarchy of each obj
-			while cls is not hprof.heap.JavaObject:
-				old = cls._hprof_ifieldvals.__get__(obj)
-				new = tuple(
-					lookup(old[ix]) if atype is hprof.jtype.object else old[ix]
-					for ix, (aname, atype) in enumerate(cls._hprof_ifields.items())
-				)
-				cls._hprof_ifieldvals.__set__(obj, new)
-				cls, = cls.__bases__
-	if progresscb:
-		progresscb(len(heap))
@@ -0,0 +1,183 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+from array import array
+from itertools import islice
+
+from . import jtype
+from .error import *
+from ._scan import Visitor, scan
+
+def histogram(path, progress_callback=None):
+	''' count the instances of each class in an hprof file, and their total
+	shallow size (see Heap.shallow_size()), like `jmap -histo` does.
+
+	The file is walked with scan(), which only reads the headers of instance
+	and array records; no heap is built, and no objects are created. The counts of all heaps in the file are added up.
+
+	Returns a list of (class name, instance count, total size) tuples,
+	largest total size first. The class names are the ones in Heap.classes. '''
+	return _scan_histogram(path, progress_callback, False).result
+
+def diff(a, b, progress_callback=None):
+	''' compare the hprof files at paths a and b, typically two dumps of the
+	same process taken some time apart. Like histogram(), no heap is built;
+	the files are scanned one after the other.
+
+	Returns a HeapDiff. '''
+	hista = _scan_histogram(a, progress_callback, True)
+	histb = _scan_histogram(b, progress_callback, True)
+	out = HeapDiff()
+	totals = {} # name -> [count in a, size in a, count in b, size in b]
+	for col, hist in ((0, hista), (2, histb)):
+		for name, count, size in hist.result:
+			entry = totals.setdefault(name, [0, 0, 0, 0])
+			entry[col] += count
+			entry[col + 1] += size
+	out.classes = sorted(
+		((name,) + tuple(entry) for name, entry in totals.items()),
+		key=lambda row: (row[2] - row[4], row[0]),
+	)
+	if progress_callback:
+		progress_callback('comparing', None, None)
+	out.removed, out.new = _merge_join(_sorted(hista.ids), _sorted(histb.ids))
+	return out
+
+class HeapDiff(object):
+	''' The differences between two hprof files, see diff().
+
+	classes holds (class name, instance count in a, total size in a,
+	instance count in b, total size in b) tuples for every class with
+	instances in either file, the class whose total size grew the most
+	first. Classes with the same name are counted together.
+
+	new and removed hold the sorted ids of objects that are only in b and
+	only in a, respectively. This is only meaningful if object ids survive
+	between the dumps; ids are usually memory addresses, which change when
+	the garbage collector moves objects. '''
+
+	__slots__ = ('classes', 'new', 'removed')
+
+	def __init__(self):
+		self.classes = []
+		self.new = array('Q')
+		self.removed = array('Q')
+
+def _scan_histogram(path, progresscb, withids):
+	hist = _Histogram()
+	if withids:
+		hist.ids = array('Q')
+	scan(path, hist, progresscb)
+	hist.result = hist.rows()
+	return hist
+
+def _sorted(ids):
+	if any(x > y for x, y in zip(ids, islice(ids, 1, None))):
+		return array('Q', sorted(ids))
+	return ids
+
+def _merge_join(a, b):
+	''' returns the ids that are only in a and only in b, both sorted. '''
+	onlya = array('Q')
+	onlyb = array('Q')
+	ia = ib = 0
+	na, nb = len(a), len(b)
+	while ia < na and ib < nb:
+		x, y = a[ia], b[ib]
+		if x == y:
+			ia += 1
+			ib += 1
+		elif x < y:
+			onlya.append(x)
+			ia += 1
+		else:
+			onlyb.append(y)
+			ib += 1
+	onlya.extend(a[ia:])
+	onlyb.extend(b[ib:])
+	return onlya, onlyb
+
+class _Histogram(Visitor):
+	''' counts the instances of each class while the file is scanned. '''
+	def __init__(self):
+		self.idsize = None
+		self.mask = None # alignment mask for shallow sizes, see Heap.object_alignment
+		self.names = {} # name id -> name
+		self.loads = {} # class id -> name id
+		self.objsizes = {} # class id -> instance size from the class dump
+		self.instances = {} # class id -> count
+		self.arrays = {} # class id, or jtype for primitive arrays -> count
+		self.arraysizes = {} # like arrays, but the total shallow size
+		self.ids = None # array of the ids of all counted objects, if wanted
+		self.android = False # whether the file is from ART, see Heap._instance_size()
+		self.result = None
+
+	def header(self, version, idsize, timestamp):
+		from .heap import Heap
+		self.idsize = idsize
+		self.mask = Heap.object_alignment - 1
+
+	def name(self, nameid, name):
+		self.names[nameid] = name
+
+	def class_load(self, serial, clsid, strace, nameid):
+		self.loads[clsid] = nameid
+
+	def class_dump(self, clsid, strace, superid, loaderid, instance_size, constants, statics, fields):
+		self.objsizes[clsid] = instance_size
+
+	def heap_info(self, heapid, nameid):
+		self.android = True # only ART writes these.
+
+	def instance(self, objid, strace, clsid, data):
+		self.instances[clsid] = self.instances.get(clsid, 0) + 1
+		if self.ids is not None:
+			self.ids.append(objid)
+
+	def object_array(self, objid, strace, clsid, elements):
+		self._array(objid, clsid, elements)
+
+	def primitive_array(self, objid, strace, elemtype, elements):
+		self._array(objid, elemtype, elements)
+
+	def _array(self, objid, key, elements):
+		mask = self.mask
+		size = (2 * self.idsize + 4 + len(elements.data) + mask) & ~mask
+		self.arrays[key] = self.arrays.get(key, 0) + 1
+		self.arraysizes[key] = self.arraysizes.get(key, 0) + size
+		if self.ids is not None:
+			self.ids.append(objid)
+
+	def rawname(self, clsid):
+		''' the class name from the class load record of clsid. '''
+		try:
+			return self.names[self.loads[clsid]]
+		except KeyError as e:
+			raise MissingObject('no class load record for class 0x%x' % clsid) from e
+
+	def name_of(self, clsid):
+		from .heap import _class_name
+		return _class_name(self.rawname(clsid))
+
+	def rows(self):
+		mask = self.mask
+		android = self.android or any(
+			'.' in self.rawname(clsid)
+			for clsid, nameid in self.loads.items() if nameid in self.names
+		)
+		hdrsize = 0 if android else 2 * self.idsize # ART counts it in objsize
+		out = []
+		for clsid, count in self.instances.items():
+			try:
+				objsize = self.objsizes[clsid]
+			except KeyError as e:
+				raise MissingObject('no class dump for class 0x%x' % clsid) from e
+			out.append((self.name_of(clsid), count, count * ((hdrsize + objsize + mask) & ~mask)))
+		for key, count in self.arrays.items():
+			if type(key) is jtype:
+				name = key.name + '[]'
+			else:
+				name = self.name_of(key)
+			out.append((name, count, self.arraysizes[key]))
+		out.sort(key=lambda row: (-row[2], row[0]))
+		return out
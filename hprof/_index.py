@@ -0,0 +1,302 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import hashlib
+import heapq
+import os
+import struct
+import sys
+
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from operator import itemgetter
+
+class ObjectTable(object):
+	''' Array-backed columns describing every object in a heap: its id, the id
+	of its class, the kind of heap record it came from, and the file offset
+	and length of that record (not counting the record type byte). '''
+
+	__slots__ = ('ids', 'clsids', 'kinds', 'offsets', 'lengths', '_sorted')
+
+	_columns = ('ids', 'clsids', 'kinds', 'offsets', 'lengths')
+
+	def __init__(self):
+		self.ids     = array('Q')
+		self.clsids  = array('Q')
+		self.kinds   = array('B')
+		self.offsets = array('Q')
+		self.lengths = array('L')
+		self._sorted = False
+
+	def __len__(self):
+		return len(self.ids)
+
+	def append(self, objid, clsid, kind, offset, length):
+		self.ids.append(objid)
+		self.clsids.append(clsid)
+		self.kinds.append(kind)
+		self.offsets.append(offset)
+		self.lengths.append(length)
+
+	def extend(self, columns):
+		''' append the rows in a tuple of columns, like the ones of another table. '''
+		for name, col in zip(self._columns, columns):
+			getattr(self, name).extend(col)
+
+	def finish(self):
+		''' sort all rows by object id, which makes find() usable. '''
+		ids = self.ids
+		if any(a > b for a, b in zip(ids, islice(ids, 1, None))):
+			order = sorted(range(len(ids)), key=ids.__getitem__)
+			for name in self._columns:
+				col = getattr(self, name)
+				setattr(self, name, array(col.typecode, map(col.__getitem__, order)))
+		self._sorted = True
+
+	def find(self, objid):
+		''' returns the row number of the object with id objid. '''
+		ids = self.ids
+		if self._sorted:
+			row = bisect_left(ids, objid)
+			if row < len(ids) and ids[row] == objid:
+				return row
+		raise KeyError(objid)
+
+
+class ObjectIndex(object):
+	''' Maps object ids to objects, as an array of ids and a list of the
+	objects in the same order. A lot smaller than a dict with the same
+	contents; lookups are binary searches, sorting the ids first if needed. '''
+
+	__slots__ = ('ids', 'objs', '_sorted')
+
+	def __init__(self):
+		self.ids = array('Q')
+		self.objs = []
+		self._sorted = True
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __contains__(self, objid):
+		try:
+			self.find(objid)
+		except KeyError:
+			return False
+		return True
+
+	def add(self, objid, obj):
+		ids = self.ids
+		if ids and ids[-1] >= objid:
+			# heap dumps are mostly in address order, so this is rare.
+			self._sorted = False
+		ids.append(objid)
+		self.objs.append(obj)
+
+	def _sort(self):
+		ids, objs = self.ids, self.objs
+		breaks = [ix for ix in range(1, len(ids)) if ids[ix - 1] > ids[ix]]
+		if len(breaks) < 64:
+			# a few sorted runs (typically one per record kind); merge them
+			# rather than sorting, which needs a lot of temporary memory.
+			bounds = zip([0] + breaks, breaks + [len(ids)])
+			runs = [_run(ids, objs, start, end) for start, end in bounds]
+			self.ids = array('Q')
+			self.objs = []
+			for objid, obj in heapq.merge(*runs, key=itemgetter(0)):
+				self.ids.append(objid)
+				self.objs.append(obj)
+		else:
+			order = sorted(range(len(ids)), key=ids.__getitem__)
+			self.ids = array('Q', map(ids.__getitem__, order))
+			self.objs = list(map(objs.__getitem__, order))
+		self._sorted = True
+
+	def find(self, objid):
+		''' returns the object with id objid. '''
+		if not self._sorted:
+			self._sort()
+		ids = self.ids
+		ix = bisect_left(ids, objid)
+		if ix < len(ids) and ids[ix] == objid:
+			return self.objs[ix]
+		raise KeyError(objid)
+
+def _run(ids, objs, start, end):
+	for ix in range(start, end):
+		yield ids[ix], objs[ix]
+
+
+class RootTable(object):
+	''' Array-backed columns describing the GC roots of a heap: the root
+	kind (its heap record type), the object id, and the thread serial and
+	frame number, where the kind has them (otherwise 0 and -1). '''
+
+	__slots__ = ('kinds', 'ids', 'threads', 'frames')
+
+	_columns = ('kinds', 'ids', 'threads', 'frames')
+
+	def __init__(self):
+		self.kinds   = array('B')
+		self.ids     = array('Q')
+		self.threads = array('I')
+		self.frames  = array('i')
+
+	def __len__(self):
+		return len(self.ids)
+
+	def append(self, kind, objid, thread, frame):
+		self.kinds.append(kind)
+		self.ids.append(objid)
+		self.threads.append(thread)
+		self.frames.append(frame)
+
+	def extend(self, columns):
+		''' append the rows in a tuple of columns, like the ones of another table. '''
+		for name, col in zip(self._columns, columns):
+			getattr(self, name).extend(col)
+
+
+class RecordTable(object):
+	''' The type, file offset and length of top-level hprof records. '''
+
+	__slots__ = ('rtypes', 'offsets', 'lengths')
+
+	_columns = ('rtypes', 'offsets', 'lengths')
+
+	def __init__(self):
+		self.rtypes  = array('B')
+		self.offsets = array('Q')
+		self.lengths = array('L')
+
+	def __len__(self):
+		return len(self.rtypes)
+
+	def append(self, rtype, offset, length):
+		self.rtypes.append(rtype)
+		self.offsets.append(offset)
+		self.lengths.append(length)
+
+
+# A sidecar index file lets an indexed dump be reopened without parsing it
+# again. It holds all names, the location of the other non-heap records
+# (class loads, stack traces...), and the object and root tables of each heap. Class
+# dumps are parsed again from the offsets in the object table; that is cheap
+# compared to a full parse.
+
+SIDECAR_SUFFIX = '.pyhprof-idx'
+
+_magic = b'pyhprof-idx\0'
+_version = 2
+_hashed_bytes = 1 << 16
+_header = struct.Struct('<12sHBBQQQ32s')
+_count = struct.Struct('<Q')
+_column = struct.Struct('<cB')
+
+def sidecar_path(path):
+	return path + SIDECAR_SUFFIX
+
+def _source_header(path, mview, idsize):
+	st = os.stat(path)
+	digest = hashlib.sha256(mview[:_hashed_bytes]).digest()
+	byteorder = 0 if sys.byteorder == 'little' else 1
+	return _header.pack(_magic, _version, byteorder, idsize, st.st_size, st.st_mtime_ns, len(mview), digest)
+
+def _write_array(f, col):
+	f.write(_column.pack(col.typecode.encode('ascii'), col.itemsize))
+	col.tofile(f)
+
+def _read_array(f, n):
+	typecode, itemsize = _column.unpack(f.read(_column.size))
+	col = array(typecode.decode('ascii'))
+	if col.itemsize != itemsize:
+		raise ValueError('item size %d, expected %d' % (itemsize, col.itemsize))
+	col.fromfile(f, n)
+	return col
+
+def _write_columns(f, table):
+	f.write(_count.pack(len(table)))
+	for name in table._columns:
+		_write_array(f, getattr(table, name))
+
+def _read_columns(f, table):
+	n, = _count.unpack(f.read(_count.size))
+	for name in table._columns:
+		setattr(table, name, _read_array(f, n))
+
+def _write_names(f, names):
+	ids = array('Q', (nameid for nameid, name in names.items() if name is not None))
+	encoded = [names[nameid].encode('utf8', 'surrogatepass') for nameid in ids]
+	blob = b''.join(encoded)
+	f.write(_count.pack(len(ids)))
+	_write_array(f, ids)
+	_write_array(f, array('L', map(len, encoded)))
+	f.write(_count.pack(len(blob)))
+	f.write(blob)
+
+def _read_names(f):
+	n, = _count.unpack(f.read(_count.size))
+	ids = _read_array(f, n)
+	lengths = _read_array(f, n)
+	size, = _count.unpack(f.read(_count.size))
+	blob = f.read(size)
+	if len(blob) != size:
+		raise EOFError()
+	names = {}
+	end = 0
+	for nameid, length in zip(ids, lengths):
+		start = end
+		end += length
+		names[nameid] = blob[start:end].decode('utf8', 'surrogatepass')
+	return names
+
+def write_sidecar(hf, path, records, idsize):
+	''' write a sidecar index for an indexed HprofFile, opened from path. '''
+	out = sidecar_path(path)
+	tmp = out + '.tmp'
+	with open(tmp, 'wb') as f:
+		f.write(_source_header(path, hf._data, idsize))
+		_write_names(f, hf.names)
+		_write_columns(f, records)
+		f.write(_count.pack(len(hf.heaps)))
+		for heap in hf.heaps:
+			_write_columns(f, heap._table)
+			_write_columns(f, heap._roots)
+	os.replace(tmp, out)
+
+def read_sidecar(path, mview):
+	''' read the sidecar index of path, whose contents are in mview.
+
+	Returns the id size, the names, the other top-level records and the
+	object and root tables, or None if there is no sidecar index or it does
+	not match the file. '''
+	try:
+		f = open(sidecar_path(path), 'rb')
+	except FileNotFoundError:
+		return None
+	with f:
+		hdr = f.read(_header.size)
+		if len(hdr) != _header.size:
+			return None
+		idsize = hdr[15]
+		if hdr != _source_header(path, mview, idsize):
+			return None
+		try:
+			names = _read_names(f)
+			records = RecordTable()
+			_read_columns(f, records)
+			nheaps, = _count.unpack(f.read(_count.size))
+			tables = []
+			roots = []
+			for i in range(nheaps):
+				table = ObjectTable()
+				_read_columns(f, table)
+				table._sorted = True # it was written after finish()
+				tables.append(table)
+				heaproots = RootTable()
+				_read_columns(f, heaproots)
+				roots.append(heaproots)
+		except (EOFError, ValueError, struct.error):
+			return None
+	return idsize, names, records, tables, roots
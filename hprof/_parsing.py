@@ -24,6 +24,11 @@ class HprofFile(object):
 		self.classloads_by_id = {}
 		self.heaps = []
 		self._pending_heap = None
+		self._mode = 'full'
+		self._data = None
+		self._source_path = None # set when a sidecar index should be used
+		self._workers = None
+		self._pool = None # process pool for scanning heap segments
 
 	def __enter__(self):
 		return self
@@ -34,6 +39,7 @@ class HprofFile(object):
 			self._context = None
 			# drop the heaps and force a GC to eliminate refs into file mappings
 			self.heaps = None
+			self._data = None
 			gc.collect()
 			return ctx.__exit__(exc_type, exc_val, tb)
 
@@ -61,51 +67,84 @@ class ClassLoad(object):
 			return False
 
 
-def open(path, progress_callback=None):
+_modes = ('full', 'index')
+
+def _check_options(mode, workers):
+	if mode not in _modes:
+		raise ValueError('unknown mode %r' % mode)
+	if workers is not None and workers < 1:
+		raise ValueError('need at least one worker, not %r' % workers)
+
+def open(path, progress_callback=None, mode='full', sidecar=False, workers=None):
+	''' open and parse an hprof file.
+
+	In 'full' mode, every object in the heap is created up front. In 'index'
+	mode, only classes are; other objects are recorded in a compact table
+	and created from the file data when they are first accessed.
+
+	If sidecar is true (index mode only), the index is saved next to the
+	file, as path + '.pyhprof-idx'. Opening the same, unmodified file again
+	reads the index from there instead of parsing the whole file.
+
+	If workers is more than 1, heap dump segments are scanned by that many
+	worker processes. This needs fork(); elsewhere, it has no effect. '''
+	_check_options(mode, workers)
+	if sidecar and mode != 'index':
+		raise ValueError('sidecar index files require index mode')
 	hf = HprofFile()
+	hf._mode = mode
+	hf._workers = workers
+	if sidecar:
+		hf._source_path = path
 	hf._context = _open_cm(hf, path, progress_callback)
 	hf._context.__enter__()
 	return hf
 
 @contextmanager
-def _open_cm(hf, path, progress_callback):
+def _open_cm(hf, path, progress_callback, parsefn=None):
 	if progress_callback:
 		progress_callback('opening', None, None)
 	if path.endswith('.bz2'):
 		import bz2
 		with bz2.open(path, 'rb') as f:
-			with _parse_cm(hf, f, progress_callback):
+			with _parse_cm(hf, f, progress_callback, parsefn):
 				yield hf
 	elif path.endswith('.gz'):
 		import gzip
 		with gzip.open(path, 'rb') as f:
-			with _parse_cm(hf, f, progress_callback):
+			with _parse_cm(hf, f, progress_callback, parsefn):
 				yield hf
 	elif path.endswith('.xz'):
 		import lzma
 		with lzma.open(path, 'rb') as f:
-			with _parse_cm(hf, f, progress_callback):
+			with _parse_cm(hf, f, progress_callback, parsefn):
 				yield hf
 	else:
 		import builtins
 		with builtins.open(path, 'rb') as f:
-			with _parse_cm(hf, f, progress_callback):
+			with _parse_cm(hf, f, progress_callback, parsefn):
 				yield hf
 
-def parse(data, progress_callback=None):
+def parse(data, progress_callback=None, mode='full', workers=None):
+	''' parse hprof data from a bytes-like or file object. See open(). '''
+	_check_options(mode, workers)
 	hf = HprofFile()
+	hf._mode = mode
+	hf._workers = workers
 	hf._context = _parse_cm(hf, data, progress_callback)
 	hf._context.__enter__()
 	return hf
 
 @contextmanager
-def _parse_cm(hf, data, progress_callback):
+def _parse_cm(hf, data, progress_callback, parsefn=None):
+	if parsefn is None:
+		parsefn = _parse
 	failures = []
 
 	# is it a bytes-like?
 	try:
 		with memoryview(data) as mview:
-			_parse(hf, mview, progress_callback)
+			parsefn(hf, mview, progress_callback)
 			yield hf
 			return
 	except (HprofError, BufferError):
@@ -124,7 +163,7 @@ def _parse_cm(hf, data, progress_callback):
 		fsize = os.fstat(fno).st_size
 		with mmap(fno, fsize, access=ACCESS_READ) as mapped:
 			with memoryview(mapped) as mview:
-				_parse(hf, mview, progress_callback)
+				parsefn(hf, mview, progress_callback)
 				yield hf
 				return
 
@@ -150,7 +189,7 @@ def _parse_cm(hf, data, progress_callback):
 				progress_callback('extracting', insize, insize)
 			with mmap(f.fileno(), fsize) as mapped:
 				with memoryview(mapped) as mview:
-					_parse(hf, mview, progress_callback)
+					parsefn(hf, mview, progress_callback)
 					yield hf
 					return
 	except BufferError as e:
@@ -193,9 +232,10 @@ codecs.register_error('hprof-mutf8', hprof_mutf8_error_handler)
 
 
 class PrimitiveReader(object):
-	def __init__(self, bytes, idsize):
+	def __init__(self, bytes, idsize, base=0):
 		self._bytes = bytes
 		self._pos = 0
+		self._base = base # file offset of bytes[0]
 		self._set_idsize(idsize)
 
 	def _set_idsize(self, idsize):
@@ -222,6 +262,12 @@ class PrimitiveReader(object):
 		self._pos += nbytes
 		return out
 
+	def skip(self, nbytes):
+		''' skip n bytes of data '''
+		if self.remaining < nbytes:
+			raise UnexpectedEof('tried to skip %d bytes, only %d available' % (nbytes, self.remaining))
+		self._pos += nbytes
+
 	def ascii(self):
 		''' read a zero-terminated ASCII string '''
 		end = self._pos
@@ -369,7 +415,7 @@ class PrimitiveReader(object):
 		try:
 			return jtype(typeval)
 		except ValueError as e:
-			raise FormatError() from e
+			raise FormatError('unknown value type 0x%x' % typeval) from e
 
 	def jboolean(self):
 		return self.u1() != 0
@@ -483,7 +529,13 @@ def parse_heap_record_segment(hf, reader, progresscb):
 	from . import _heap_parsing
 	if hf._pending_heap is None:
 		hf._pending_heap = heap.Heap()
-	_heap_parsing.parse_heap(hf, hf._pending_heap, reader, progresscb)
+		if hf._mode == 'index' or hf._pool is not None:
+			from ._index import ObjectTable
+			hf._pending_heap._table = ObjectTable()
+	if hf._pool is not None:
+		_heap_parsing.scan_in_worker(hf._pool, hf._pending_heap, reader)
+	else:
+		_heap_parsing.parse_heap(hf, hf._pending_heap, reader, progresscb)
 record_parsers[0x1c] = parse_heap_record_segment
 
 def parse_heap_record_seg_end(hf, reader, progresscb):
@@ -503,6 +555,7 @@ def _parse(hf, data, progresscb):
 
 def _parse_hprof(hf, mview, progresscb):
 	reader = PrimitiveReader(mview, None)
+	hf._data = mview
 	if progresscb:
 		progresscb('parsing', 0, len(mview))
 	hdr = reader.ascii()
@@ -511,6 +564,46 @@ def _parse_hprof(hf, mview, progresscb):
 	idsize = reader.u4()
 	reader._set_idsize(idsize)
 	reader.u8() # timestamp; ignore.
+
+	records = None
+	if hf._source_path is not None:
+		from . import _index
+		if progresscb:
+			progresscb('loading index', None, None)
+		loaded = _index.read_sidecar(hf._source_path, mview)
+		if loaded is not None:
+			_load_indexed(hf, mview, *loaded)
+			_instantiate(hf, idsize, progresscb)
+			_resolve_references(hf, progresscb)
+			return
+		records = _index.RecordTable()
+
+	with _worker_pool(hf, mview):
+		_parse_records(hf, reader, records, progresscb)
+		_instantiate(hf, idsize, progresscb)
+	_resolve_references(hf, progresscb)
+	if records is not None:
+		try:
+			_index.write_sidecar(hf, hf._source_path, records, idsize)
+		except OSError:
+			pass # the index is only a cache; we can do without it.
+
+@contextmanager
+def _worker_pool(hf, mview):
+	if hf._workers is None or hf._workers <= 1:
+		yield
+		return
+	from . import _heap_parsing
+	with _heap_parsing.worker_pool(mview, hf._workers) as pool:
+		hf._pool = pool
+		try:
+			yield
+		finally:
+			hf._pool = None
+
+def _parse_records(hf, reader, records, progresscb):
+	mview = reader._bytes
+	idsize = reader._idsize
 	lastreport = -1<<32
 	def innerprogress(pos):
 		progresscb('parsing', innerprogress.base + pos, len(mview))
@@ -528,24 +621,54 @@ def _parse_hprof(hf, mview, progresscb):
 				progresscb('parsing', reader._pos, len(mview))
 		micros = reader.u4()
 		datasize = reader.u4()
+		base = reader._pos
 		data = reader.bytes(datasize)
-		try:
-			parser = record_parsers[rtype]
-		except KeyError as e:
-			hf.unhandled[rtype] = hf.unhandled.get(rtype, 0) + 1
-		else:
-			parser(hf, PrimitiveReader(data, idsize), innerprogress)
+		if records is not None and rtype not in _unindexed_record_types:
+			records.append(rtype, base, datasize)
+		_dispatch(hf, rtype, PrimitiveReader(data, idsize, base), innerprogress)
 	if progresscb:
 		progresscb('parsing', len(mview), len(mview))
-	_instantiate(hf, reader._idsize, progresscb)
-	_resolve_references(hf, progresscb)
+
+# name and heap records; the sidecar index stores their contents separately.
+_unindexed_record_types = (0x01, 0x0c, 0x1c, 0x2c)
+
+def _dispatch(hf, rtype, reader, progresscb):
+	try:
+		parser = record_parsers[rtype]
+	except KeyError as e:
+		hf.unhandled[rtype] = hf.unhandled.get(rtype, 0) + 1
+	else:
+		parser(hf, reader, progresscb)
+
+def _load_indexed(hf, mview, idsize, names, records, tables, roots):
+	hf.names.update(names)
+	for rtype, offset, length in zip(records.rtypes, records.offsets, records.lengths):
+		_dispatch(hf, rtype, PrimitiveReader(mview[offset : offset + length], idsize, offset), None)
+	for table, heaproots in zip(tables, roots):
+		h = heap.Heap()
+		h._table = table
+		h._roots = heaproots
+		hf.heaps.append(h)
 
 def _instantiate(hf, idsize, progresscb):
 	from . import _heap_parsing
 	for heapix, heap in enumerate(hf.heaps, start=1):
+		heap._idsize = idsize
+		if heap._table is not None:
+			if progresscb:
+				progresscb('indexing heap %d/%d' % (heapix, len(hf.heaps)), None, None)
+			_heap_parsing.finish_scan(hf, heap, hf._data, idsize)
+
 		if heap._deferred_classes:
 			raise FormatError('some class dumps never found their super class', heap._deferred_classes)
 
+		if hf._mode == 'index':
+			_heap_parsing.finish_index(heap, hf._data, idsize)
+			heap._index_classes()
+			continue
+		if heap._table is not None:
+			_heap_parsing.defer_scanned(heap, hf._data, idsize)
+
 		def remaining():
 			return (
 				len(heap._deferred_objects)
@@ -569,6 +692,7 @@ def _instantiate(hf, idsize, progresscb):
 		_heap_parsing.create_primarrays(heap, localprogress)
 		done = total - remaining()
 		localprogress(0)
+		heap._index_classes()
 
 def _resolve_references(hf, progresscb):
 	''' Some objects can have forward references. In those cases, we've saved
@@ -581,14 +705,6 @@ def _resolve_references(hf, progresscb):
 		except KeyError as e:
 			msg = 'ClassLoad of %s refers to stacktrace 0x%x, which cannot be found'
 			raise FormatError(msg % (load.class_name, load.stacktrace)) from e
-	from . import _heap_parsing
 	if hf._pending_heap is not None:
 		raise FormatError('unfinished segmented heap')
-	for heapix, heap in enumerate(hf.heaps, start=1):
-		n = len(heap)
-		label = 'resolving heap %d/%d' % (heapix, len(hf.heaps))
-		def innerprogress(pos):
-			progresscb(label, pos, n)
-		if not progresscb:
-			innerprogress = None
-		_heap_parsing.resolve_heap_references(heap, innerprogress)
+	# heap objects resolve their references when they are accessed.
@@ -0,0 +1,380 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import gc
+import traceback
+
+from . import jtype
+from .error import *
+from ._parsing import PrimitiveReader, _open_cm
+
+class Elements(object):
+	''' The elements of an array record, decoded when first accessed. '''
+	__slots__ = ('jtype', 'data', 'idsize', '_decoded')
+
+	def __init__(self, jtype, data, idsize=None):
+		self.jtype = jtype
+		self.data = data # raw big-endian bytes
+		self.idsize = idsize
+		self._decoded = None
+
+	def decode(self):
+		''' returns all elements as a sequence. '''
+		if self._decoded is None:
+			from .heap import _DeferredArrayData
+			self._decoded = _DeferredArrayData(self.jtype, self.data, self.idsize).toarray()
+		return self._decoded
+
+	def __len__(self):
+		if self.jtype is jtype.object:
+			return len(self.data) // self.idsize
+		return len(self.data) // self.jtype.size
+
+	def __getitem__(self, ix):
+		return self.decode()[ix]
+
+	def __iter__(self):
+		return iter(self.decode())
+
+
+class Visitor(object):
+	''' Base class for scan() visitors.
+
+	Override the methods for the records you are interested in. Records
+	without an overridden method are skipped as cheaply as possible. Duck
+	typed visitors work too; any method they lack is treated as not
+	overridden.
+
+	Object ids are passed as plain ints. Memoryview and Elements arguments
+	refer into the file data, and are only valid during the call. '''
+
+	def header(self, version, idsize, timestamp):
+		''' called first, with the format version string (like "JAVA PROFILE
+		1.0.2"), the size of object ids, and the dump time in milliseconds. '''
+		pass
+
+	# top-level records
+
+	def name(self, nameid, name):
+		pass
+
+	def class_load(self, serial, clsid, strace, nameid):
+		pass
+
+	def class_unload(self, serial):
+		pass
+
+	def stack_frame(self, frameid, methodid, signatureid, sourcefileid, clsserial, line):
+		pass
+
+	def stack_trace(self, serial, thread, frameids):
+		pass
+
+	def heap_segment(self):
+		''' called when a HEAP DUMP or HEAP DUMP SEGMENT record starts. '''
+		pass
+
+	def heap_end(self):
+		''' called at the end of a heap; after a HEAP DUMP record, or for a HEAP DUMP END. '''
+		pass
+
+	def other_record(self, rtype, data):
+		''' called for top-level records without a method of their own. '''
+		pass
+
+	# heap records
+
+	def class_dump(self, clsid, strace, superid, loaderid, instance_size, constants, statics, fields):
+		''' constants holds (index, jtype, value) tuples, statics holds
+		(nameid, jtype, value), and fields holds (nameid, jtype). '''
+		pass
+
+	def instance(self, objid, strace, clsid, data):
+		''' data is a memoryview of the encoded field values. '''
+		pass
+
+	def object_array(self, objid, strace, clsid, elements):
+		pass
+
+	def primitive_array(self, objid, strace, elemtype, elements):
+		pass
+
+	def heap_info(self, heapid, nameid):
+		pass
+
+	def root_unknown(self, objid):
+		pass
+
+	def root_jni_global(self, objid, refid):
+		pass
+
+	def root_jni_local(self, objid, thread, frame):
+		pass
+
+	def root_java_frame(self, objid, thread, frame):
+		pass
+
+	def root_native_stack(self, objid, thread):
+		pass
+
+	def root_sticky_class(self, objid):
+		pass
+
+	def root_thread_block(self, objid, thread):
+		pass
+
+	def root_monitor_used(self, objid):
+		pass
+
+	def root_thread_object(self, objid, thread, strace):
+		pass
+
+	def root_interned_string(self, objid):
+		pass
+
+	def root_debugger(self, objid):
+		pass
+
+	def root_vm_internal(self, objid):
+		pass
+
+	def root_jni_monitor(self, objid, thread, frame):
+		pass
+
+
+def scan(path, visitor, progress_callback=None):
+	''' walk through all records in an hprof file, calling the matching
+	methods of visitor (see Visitor) for each of them. No heap is built, and
+	nothing is kept between calls. Returns the visitor. '''
+	with _open_cm(visitor, path, progress_callback, _scan):
+		pass
+	return visitor
+
+def _method(visitor, name):
+	''' returns the bound method visitor.name, or None if it is missing or
+	not overridden. '''
+	fn = getattr(visitor, name, None)
+	if fn is None or getattr(type(visitor), name, None) is getattr(Visitor, name):
+		return None
+	return fn
+
+def _scan(visitor, data, progresscb):
+	try:
+		_scan_hprof(visitor, data, progresscb)
+	except Exception as e:
+		_clear_frames(e)
+		if isinstance(e, HprofError):
+			raise
+		raise UnhandledError() from e
+	finally:
+		# readers are cyclic; collect them to release their views into data,
+		# so that the file mapping can be closed.
+		gc.collect()
+
+def _clear_frames(e):
+	''' drop the locals of the frames in e's traceback (and those of its
+	causes); they hold views into the file data. '''
+	while e is not None:
+		traceback.clear_frames(e.__traceback__)
+		e = e.__cause__ or e.__context__
+
+def _scan_hprof(visitor, mview, progresscb):
+	reader = PrimitiveReader(mview, None)
+	if progresscb:
+		progresscb('scanning', 0, len(mview))
+	hdr = reader.ascii()
+	if hdr not in ('JAVA PROFILE 1.0.1', 'JAVA PROFILE 1.0.2', 'JAVA PROFILE 1.0.3'):
+		raise FormatError('unknown header "%s"' % hdr)
+	idsize = reader.u4()
+	reader._set_idsize(idsize)
+	timestamp = reader.u8()
+	header = _method(visitor, 'header')
+	if header is not None:
+		header(hdr, idsize, timestamp)
+
+	toplevel = {}
+	for rtype, (name, read) in _record_readers.items():
+		fn = _method(visitor, name)
+		if fn is not None:
+			toplevel[rtype] = (fn, read)
+	other = _method(visitor, 'other_record')
+	heap_segment = _method(visitor, 'heap_segment')
+	heap_end = _method(visitor, 'heap_end')
+	heapreaders = {}
+	for rtype, (name, read, skip) in _heap_readers.items():
+		fn = _method(visitor, name)
+		heapreaders[rtype] = (fn, skip if fn is None else read)
+
+	lastreport = -1<<32
+	while True:
+		try:
+			rtype = reader.u1()
+		except UnexpectedEof:
+			break # not unexpected.
+		if progresscb and reader._pos - lastreport >= 1<<20:
+			lastreport = reader._pos
+			progresscb('scanning', reader._pos, len(mview))
+		micros = reader.u4()
+		datasize = reader.u4()
+		base = reader._pos
+		data = reader.bytes(datasize)
+		if rtype in (0x0c, 0x1c):
+			if heap_segment is not None:
+				heap_segment()
+			_scan_heap(heapreaders, PrimitiveReader(data, idsize, base))
+			if rtype == 0x0c and heap_end is not None:
+				heap_end()
+		elif rtype == 0x2c:
+			if heap_end is not None:
+				heap_end()
+		elif rtype in toplevel:
+			fn, read = toplevel[rtype]
+			fn(*read(PrimitiveReader(data, idsize, base)))
+		elif rtype not in _record_readers and other is not None:
+			other(rtype, data)
+	if progresscb:
+		progresscb('scanning', len(mview), len(mview))
+
+def _scan_heap(readers, reader):
+	while True:
+		try:
+			rtype = reader.u1()
+		except UnexpectedEof:
+			break # nope, it's a normal eof
+		try:
+			fn, read = readers[rtype]
+		except KeyError as e:
+			# impossible to handle; we don't know how long this record type is.
+			raise FormatError('unrecognized heap record type 0x%x' % rtype) from e
+		if fn is None:
+			read(reader) # skips the record
+		else:
+			fn(*read(reader))
+
+def _read_name(r):
+	return r.id(), r.utf8(r.remaining)
+
+def _read_stack_trace(r):
+	serial = r.u4()
+	thread = r.u4()
+	return serial, thread, tuple(r.id() for i in range(r.u4()))
+
+_record_readers = {
+	0x01: ('name',         _read_name),
+	0x02: ('class_load',   lambda r: (r.u4(), r.id(), r.u4(), r.id())),
+	0x03: ('class_unload', lambda r: (r.u4(),)),
+	0x04: ('stack_frame',  lambda r: (r.id(), r.id(), r.id(), r.id(), r.u4(), r.i4())),
+	0x05: ('stack_trace',  _read_stack_trace),
+}
+
+def _read_class_dump(r):
+	clsid = r.id()
+	strace = r.u4()
+	superid = r.id()
+	loaderid = r.id()
+	r.skip(4 * r._idsize) # signer, protection domain, reserved 1 & 2
+	instance_size = r.u4()
+	constants = []
+	for i in range(r.u2()):
+		ix = r.u2()
+		t = r.jtype()
+		constants.append((ix, t, t.read(r)))
+	statics = []
+	for i in range(r.u2()):
+		nameid = r.id()
+		t = r.jtype()
+		statics.append((nameid, t, t.read(r)))
+	fields = tuple((r.id(), r.jtype()) for i in range(r.u2()))
+	return clsid, strace, superid, loaderid, instance_size, tuple(constants), tuple(statics), fields
+
+def _skip_class_dump(r):
+	idsize = r._idsize
+	r.skip(7 * idsize + 8)
+	for i in range(r.u2()): # constant pool
+		r.skip(2)
+		t = r.jtype()
+		r.skip(idsize if t is jtype.object else t.size)
+	for i in range(r.u2()): # static fields
+		r.skip(idsize)
+		t = r.jtype()
+		r.skip(idsize if t is jtype.object else t.size)
+	r.skip(r.u2() * (idsize + 1)) # instance fields
+
+def _read_instance(r):
+	objid = r.id()
+	strace = r.u4()
+	clsid = r.id()
+	return objid, strace, clsid, r.bytes(r.u4())
+
+def _skip_instance(r):
+	r.skip(2 * r._idsize + 4)
+	r.skip(r.u4())
+
+def _read_object_array(r):
+	objid = r.id()
+	strace = r.u4()
+	length = r.u4()
+	clsid = r.id()
+	return objid, strace, clsid, Elements(jtype.object, r.bytes(length * r._idsize), r._idsize)
+
+def _skip_object_array(r):
+	r.skip(r._idsize + 4)
+	r.skip((r.u4() + 1) * r._idsize)
+
+def _primitive_type(r):
+	t = r.jtype()
+	if t is jtype.object:
+		raise FormatError('unknown primitive array type 0x%x' % t.value)
+	return t
+
+def _read_primitive_array(r):
+	objid = r.id()
+	strace = r.u4()
+	length = r.u4()
+	t = _primitive_type(r)
+	return objid, strace, t, Elements(t, r.bytes(length * t.size))
+
+def _skip_primitive_array(r):
+	r.skip(r._idsize + 4)
+	length = r.u4()
+	r.skip(length * _primitive_type(r).size)
+
+def _id(r):
+	return (r.id(),)
+
+def _id_u4(r):
+	return (r.id(), r.u4())
+
+def _id_u4_i4(r):
+	return (r.id(), r.u4(), r.i4())
+
+def _id_u4_u4(r):
+	return (r.id(), r.u4(), r.u4())
+
+def _skipper(nids, nbytes):
+	''' returns a function that skips a record of nids ids and nbytes other bytes. '''
+	def skip(r):
+		r.skip(nids * r._idsize + nbytes)
+	return skip
+
+# heap record type -> (visitor method, reader, skipper)
+_heap_readers = {
+	0x20: ('class_dump',           _read_class_dump,           _skip_class_dump),
+	0x21: ('instance',             _read_instance,             _skip_instance),
+	0x22: ('object_array',         _read_object_array,         _skip_object_array),
+	0x23: ('primitive_array',      _read_primitive_array,      _skip_primitive_array),
+	0xfe: ('heap_info',            lambda r: (r.u4(), r.id()), _skipper(1, 4)),
+	0xff: ('root_unknown',         _id,                        _skipper(1, 0)),
+	0x01: ('root_jni_global',      lambda r: (r.id(), r.id()), _skipper(2, 0)),
+	0x02: ('root_jni_local',       _id_u4_i4,                  _skipper(1, 8)),
+	0x03: ('root_java_frame',      _id_u4_i4,                  _skipper(1, 8)),
+	0x04: ('root_native_stack',    _id_u4,                     _skipper(1, 4)),
+	0x05: ('root_sticky_class',    _id,                        _skipper(1, 0)),
+	0x06: ('root_thread_block',    _id_u4,                     _skipper(1, 4)),
+	0x07: ('root_monitor_used',    _id,                        _skipper(1, 0)),
+	0x08: ('root_thread_object',   _id_u4_u4,                  _skipper(1, 8)),
+	0x89: ('root_interned_string', _id,                        _skipper(1, 0)),
+	0x8b: ('root_debugger',        _id,                        _skipper(1, 0)),
+	0x8d: ('root_vm_internal',     _id,                        _skipper(1, 0)),
+	0x8e: ('root_jni_monitor',     _id_u4_i4,                  _skipper(1, 8)),
+}
@@ -1,19 +1,143 @@
 # Copyright (C) 2019 Snild Dolkow
 # Licensed under the LICENSE.
 
+import hashlib as _hashlib
 import re as _re
+import struct as _struct
+import sys as _sys
+
+from array import array as _array
+from collections import OrderedDict as _OrderedDict
+from collections.abc import ItemsView as _ItemsView
+from collections.abc import KeysView as _KeysView
+from collections.abc import ValuesView as _ValuesView
+from itertools import chain as _chain
+from itertools import compress as _compress
+
+from .error import FormatError as _FormatError
+from .error import MissingObject as _MissingObject
+from ._index import ObjectIndex as _ObjectIndex
+from ._index import RootTable as _RootTable
 
 _namesplit = _re.compile(r'\.|/')
 
 class Heap(dict):
+	# When true, a resolved reference replaces the object id it was resolved
+	# from, so that it does not need to be looked up again.
+	cache_references = False
+
+	# How many decoded java.lang.String values string_value() keeps around.
+	string_cache_size = 4096
+
+	# Shallow sizes are rounded up to a multiple of this. Object headers are
+	# assumed to be two ids, plus the length for arrays; Android class dumps
+	# include the header in their instance sizes.
+	object_alignment = 8
+
 	def __init__(self):
 		self.classes = dict() # JavaClassName -> [JavaClass, ...]
 		self.classtree = JavaHierarchy()
 		self._instances = dict() # JavaClass -> [instance, instance, ...]
+		self._array_nbytes = dict() # JavaArrayClass -> array of data sizes, in _instances order
+		self._android = False # whether the dump is from ART; see _instance_size()
 		self._deferred_classes = dict()
 		self._deferred_primarrays = list()
 		self._deferred_objarrays = list()
 		self._deferred_objects = list()
+		self._layouts = dict() # JavaClass -> InstanceLayout
+		self._table = None # ObjectTable, when indexing rather than creating all objects
+		self._instance_rows = None # JavaClass -> array of table rows, when indexing
+		self._descendants = None # JavaClass -> (JavaClass, subclass, ...), once indexed
+		self._instance_counts = None # JavaClass -> instance count, including subclasses
+		self._class_classes = None # the java.lang.Class classes, as a set
+		self._class_objects = None # all classes in the heap, as a tuple
+		self._data = None
+		self._idsize = None
+		self._scans = list() # pending worker scans of heap segments
+		self._objects = _ObjectIndex() # created non-class objects, when not indexing
+		self._roots = _RootTable()
+		self._graph = None # ObjectGraph, once built
+		self._referrers = None # (offsets, sources) of incoming references, once built
+		self._weak = None # Reference object number -> referent object number, once found
+		self._reachable = None # bytearray; 1 for objects reachable from GC roots, once marked
+		self._dominators = None # (immediate dominators, retained sizes), once computed
+		self._string_layouts = dict() # String JavaClass -> field indices, see _string_layout()
+		self._string_cache = _OrderedDict() # String object id -> str, least recently used first
+
+	def __missing__(self, objid):
+		try:
+			return self._objects.find(objid)
+		except KeyError:
+			if self._table is None:
+				raise
+		from . import _heap_parsing
+		return _heap_parsing.materialize(self, self._table.find(objid))
+
+	def __setitem__(self, objid, obj):
+		dict.__setitem__(self, objid, obj)
+		if isinstance(obj, JavaClass):
+			self._descendants = None # index the classes again when needed
+
+	def __contains__(self, objid):
+		if dict.__contains__(self, objid) or objid in self._objects:
+			return True
+		if self._table is None:
+			return False
+		try:
+			self._table.find(objid)
+		except KeyError:
+			return False
+		return True
+
+	def __len__(self):
+		if self._table is None:
+			return dict.__len__(self) + len(self._objects)
+		return len(self._table)
+
+	def __iter__(self):
+		if self._table is None:
+			return _chain(dict.__iter__(self), self._objects.ids)
+		return iter(self._table.ids)
+
+	def keys(self):
+		return _KeysView(self)
+
+	def values(self):
+		return _HeapValues(self)
+
+	def items(self):
+		return _HeapItems(self)
+
+	def _itervalues(self):
+		if self._table is None:
+			return _chain(dict.values(self), self._objects.objs)
+		return (self._at_row(row) for row in range(len(self._table)))
+
+	def _iteritems(self):
+		if self._table is None:
+			return _chain(dict.items(self), zip(self._objects.ids, self._objects.objs))
+		return zip(self._table.ids, self._itervalues())
+
+	def get(self, objid, default=None):
+		try:
+			return self[objid]
+		except KeyError:
+			return default
+
+	def _deref(self, objid):
+		if not objid:
+			return None
+		try:
+			return self[objid]
+		except KeyError as e:
+			raise _MissingObject(hex(objid)) from e
+
+	def _at_row(self, row):
+		obj = dict.get(self, self._table.ids[row])
+		if obj is None:
+			from . import _heap_parsing
+			obj = _heap_parsing.materialize(self, row)
+		return obj
 
 	def _classes(self, cls_or_name):
 		if isinstance(cls_or_name, JavaClass):
@@ -21,20 +145,766 @@ class Heap(dict):
 		else:
 			yield from self.classes[cls_or_name]
 
-	def exact_instances(self, cls_or_name):
-		''' returns an iterable over all objects of exactly this class. '''
+	def exact_instances(self, cls_or_name, reachable=None):
+		''' returns an iterable over all objects of exactly this class.
+
+		If reachable is True, only objects that can be reached from a GC root
+		are included; if it is False, only those that cannot. See
+		compute_reachable(). '''
+		if self._descendants is None:
+			self._index_classes()
+		for cls in self._classes(cls_or_name):
+			if cls in self._class_classes:
+				yield from self._only(self._class_objects, reachable)
+			yield from self._instances_of(cls, reachable)
+
+	def _instances_of(self, cls, reachable=None):
+		if self._instance_rows is None:
+			return self._only(self._instances.get(cls, ()), reachable)
+		rows = self._instance_rows.get(cls, ())
+		if reachable is not None:
+			marks = self.compute_reachable()
+			rows = _compress(rows, (marks[row] == reachable for row in rows))
+		return (self._at_row(row) for row in rows)
+
+	def _only(self, objs, reachable):
+		''' filters objs by reachability, unless reachable is None. '''
+		if reachable is None:
+			return objs
+		marks = self.compute_reachable()
+		index = self._object_index
+		return (obj for obj in objs if marks[index(obj)] == reachable)
+
+	def all_instances(self, cls_or_name, reachable=None):
+		''' returns an iterable over all objects of this class or any of its
+		subclasses. reachable works like in exact_instances(). '''
+		if self._descendants is None:
+			self._index_classes()
 		for cls in self._classes(cls_or_name):
-			if cls in self.classes.get('java.lang.Class', ()):
-				for lst in self.classes.values():
-					yield from lst
-			yield from self._instances[cls]
+			for subcls in self._subclasses_of(cls):
+				yield from self.exact_instances(subcls, reachable)
 
-	def all_instances(self, cls_or_name):
-		''' returns an iterable over all objects of this class or any of its subclasses. '''
+	def instance_count(self, cls_or_name, subclasses=True):
+		''' returns the number of objects of this class, like
+		len(list(all_instances(cls_or_name))), or exact_instances() if
+		subclasses is False, but without going through them. '''
+		if self._descendants is None:
+			self._index_classes()
+		counts = self._instance_counts
+		n = 0
 		for cls in self._classes(cls_or_name):
-			yield from self.exact_instances(cls)
-			for subcls in cls.__subclasses__():
-				yield from self.all_instances(subcls)
+			if not subclasses:
+				n += self._exact_count(cls)
+			elif cls in counts:
+				n += counts[cls]
+			else:
+				n += sum(self._exact_count(subcls) for subcls in self._subclasses_of(cls))
+		return n
+
+	def _subclasses_of(self, cls):
+		''' the class itself, then all of its subclasses; see _subclass_closure(). '''
+		try:
+			return self._descendants[cls]
+		except KeyError:
+			# not one of the heap's classes; walk it as it is now.
+			return _subclass_closure(cls, {})
+
+	def _exact_count(self, cls):
+		if self._instance_rows is None:
+			n = len(self._instances.get(cls, ()))
+		else:
+			n = len(self._instance_rows.get(cls, ()))
+		if cls in self._class_classes:
+			n += len(self._class_objects)
+		return n
+
+	def _index_classes(self):
+		''' finds the subclasses of every class in the heap once, and counts
+		their instances, so that all_instances() and instance_count() do not
+		have to walk the class hierarchy. Called when the heap is complete, and
+		again after a class has been added to it. '''
+		self._class_objects = tuple(_chain.from_iterable(self.classes.values()))
+		self._class_classes = set(self.classes.get('java.lang.Class', ()))
+		descendants = {}
+		for cls in self._class_objects:
+			_subclass_closure(cls, descendants)
+		self._descendants = descendants
+		exact = {cls: self._exact_count(cls) for cls in descendants}
+		self._instance_counts = {
+			cls: sum(exact[subcls] for subcls in subclasses)
+			for cls, subclasses in descendants.items()
+		}
+
+	def roots(self):
+		''' returns an iterable over (RootKind, object id, thread serial, frame
+		number) tuples for all GC roots. Roots without a thread have thread
+		serial 0, and those without a frame have frame number -1. '''
+		roots = self._roots
+		return zip(map(_rootkinds.__getitem__, roots.kinds), roots.ids, roots.threads, roots.frames)
+
+	def roots_of_kind(self, kind):
+		''' returns an iterable over (object id, thread serial, frame number)
+		tuples for the GC roots of one RootKind. '''
+		kind = _RootKind(kind)
+		roots = self._roots
+		return _compress(zip(roots.ids, roots.threads, roots.frames), map(kind.value.__eq__, roots.kinds))
+
+	def shallow_size(self, obj):
+		''' returns the number of bytes that obj itself takes up, including
+		its object header and alignment padding (see object_alignment).
+
+		The instance size recorded in the class dump is used for instances.
+		Class objects count as 0 bytes. '''
+		if type(obj) is Ref:
+			obj = Ref._target.__get__(obj)
+		if isinstance(obj, JavaClass):
+			return 0
+		cls = type(obj)
+		if isinstance(cls, JavaArrayClass):
+			return self._array_size(self._array_data_size(obj))
+		return self._instance_size(cls)
+
+	def shallow_size_by_class(self, reachable=None):
+		''' returns a dict mapping each class with any instances to a tuple of
+		its instance count and their total shallow size (see shallow_size()).
+		reachable works like in exact_instances(); with it, this is a report of
+		the live (or garbage) objects in the heap.
+
+		Instances of a class all have the same size, so they are not looked at.
+		Array sizes are summed from the array data sizes recorded while
+		parsing, or from the object table in an indexed heap. '''
+		out = {}
+		rows = self._instance_rows
+		table = self._table
+		if reachable is not None:
+			marks = self.compute_reachable()
+		for clslist in self.classes.values():
+			for cls in clslist:
+				if rows is None:
+					objs = self._instances.get(cls, ())
+					if reachable is not None:
+						index = self._object_index
+						keep = [marks[index(obj)] == reachable for obj in objs]
+						count = sum(keep)
+					else:
+						count = len(objs)
+				else:
+					clsrows = rows.get(cls, ())
+					if reachable is not None:
+						clsrows = [row for row in clsrows if marks[row] == reachable]
+					count = len(clsrows)
+				if not count:
+					continue
+				if not isinstance(cls, JavaArrayClass):
+					out[cls] = (count, count * self._instance_size(cls))
+					continue
+				if rows is None:
+					nbytes = self._array_nbytes.get(cls)
+					if nbytes is None or len(nbytes) != len(objs):
+						# not created by the parser; look at each array.
+						nbytes = [self._array_data_size(obj) for obj in objs]
+					if reachable is not None:
+						nbytes = _compress(nbytes, keep)
+				else:
+					# the data follows the array record header.
+					if table.kinds[clsrows[0]] == 0x22:
+						hdrsize = 2 * self._idsize + 8
+					else:
+						hdrsize = self._idsize + 9
+					lengths = table.lengths
+					nbytes = (lengths[row] - hdrsize for row in clsrows)
+				out[cls] = (count, self._arrays_size(nbytes))
+		return out
+
+	def _instance_size(self, cls):
+		size = cls._hprof_objsize
+		if size is None:
+			size = 2 * self._idsize
+			t = cls
+			while t is not JavaObject:
+				for ftype in t._hprof_ifields.values():
+					size += self._idsize if ftype is _jobject else ftype.size
+				t, = t.__bases__
+		elif not self._android:
+			size += 2 * self._idsize # ART includes the header; HotSpot doesn't.
+		return self._aligned(size)
+
+	def _array_size(self, nbytes):
+		return self._aligned(2 * self._idsize + 4 + nbytes)
+
+	def _arrays_size(self, nbytes):
+		''' the total shallow size of arrays with nbytes of data each. '''
+		mask = self.object_alignment - 1
+		extra = 2 * self._idsize + 4 + mask
+		return sum((n + extra) & ~mask for n in nbytes)
+
+	def _array_data_size(self, arr):
+		data = arr._hprof_array_data
+		if type(data) is _RefArrayData:
+			return len(data) * self._idsize
+		return len(data.bytes)
+
+	def _aligned(self, size):
+		mask = self.object_alignment - 1
+		return (size + mask) & ~mask
+
+	def _object_graph(self, progress_callback=None):
+		if self._graph is None:
+			from . import _graph
+			self._graph = _graph.build_graph(self, progress_callback)
+		return self._graph
+
+	def _object_index(self, obj):
+		''' returns the object number of obj in the object graph. '''
+		graph = self._object_graph()
+		if type(obj) is Ref:
+			obj = Ref._target.__get__(obj)
+		if isinstance(obj, JavaClass):
+			objid = graph.classids[obj]
+		else:
+			objid = JavaObject._hprof_id.__get__(obj)
+		return graph.index(objid)
+
+	def compute_referrers(self, progress_callback=None):
+		''' build the index of incoming references used by referrers().
+
+		This is done automatically when needed, but takes a while on large
+		heaps. The index takes a few bytes per reference. '''
+		if self._referrers is None:
+			from . import _graph
+			graph = self._object_graph(progress_callback)
+			self._referrers = _graph.reverse_edges(graph, progress_callback)
+		return self._referrers
+
+	def referrers(self, obj):
+		''' returns a list of the objects that refer to obj, in object id
+		order. Instances refer to their class, and classes to their super
+		class and the values of their static fields. '''
+		offsets, sources = self.compute_referrers()
+		ix = self._object_index(obj)
+		ids = self._graph.ids
+		out = []
+		prev = -1
+		for src in sources[offsets[ix] : offsets[ix+1]]:
+			if src != prev: # sources are sorted; skip duplicates
+				out.append(self[ids[src]])
+				prev = src
+		return out
+
+	def compute_reachable(self, progress_callback=None):
+		''' mark every object that can be reached from a GC root. Returns a
+		bytearray with a 1 for each of them, indexed by object number.
+
+		This is done automatically when needed, but takes a while on large
+		heaps. Objects that cannot be reached are garbage that has not been
+		collected yet. '''
+		if self._reachable is None:
+			from . import _graph
+			graph = self._object_graph(progress_callback)
+			self._reachable = _graph.mark_reachable(graph, self._root_indices(), progress_callback)
+		return self._reachable
+
+	def is_reachable(self, obj):
+		''' returns whether obj can be reached from any GC root. '''
+		return bool(self.compute_reachable()[self._object_index(obj)])
+
+	def path_to_root(self, obj, exclude_weak=True):
+		''' returns a list of objects along a shortest reference chain from a
+		GC root to obj, starting with the root and ending with obj, or None if
+		obj cannot be reached from any GC root.
+
+		If exclude_weak is true, the referent field of java.lang.ref.Reference
+		objects (weak, soft and phantom references, finalizers...) is not
+		followed, since it does not keep obj alive. '''
+		from . import _graph
+		preds = self.compute_referrers()
+		start = self._object_index(obj)
+		graph = self._graph
+		isroot = bytearray(len(graph))
+		for ix in self._root_indices():
+			isroot[ix] = 1
+		skip = None
+		if exclude_weak:
+			weak = self._weak_referents()
+			if weak:
+				def skip(src, t):
+					if weak.get(src) != t:
+						return False
+					# only skip if the referent is the sole reference to t.
+					targets = graph.targets[graph.offsets[src] : graph.offsets[src+1]]
+					return targets.count(t) == 1
+		path = _graph.path_to_root(preds, start, isroot, skip)
+		if path is None:
+			return None
+		ids = graph.ids
+		return [self[ids[ix]] for ix in path]
+
+	def _root_indices(self):
+		''' returns the object numbers of the GC roots, without duplicates. '''
+		graph = self._object_graph()
+		out = []
+		seen = bytearray(len(graph))
+		for objid in self._roots.ids:
+			try:
+				ix = graph.index(objid)
+			except KeyError:
+				continue # roots may point to objects that are not in the dump
+			if not seen[ix]:
+				seen[ix] = 1
+				out.append(ix)
+		return out
+
+	def _weak_referents(self):
+		''' returns a dict mapping the object number of each
+		java.lang.ref.Reference object to that of its referent. '''
+		if self._weak is not None:
+			return self._weak
+		from . import _graph
+		graph = self._object_graph()
+		out = {}
+		for refcls in self.classes.get('java.lang.ref.Reference', ()):
+			if 'referent' not in refcls._hprof_ifieldix:
+				continue
+			ix = _field_index(refcls, 'referent')
+			for obj in self.all_instances(refcls):
+				objid = JavaObject._hprof_id.__get__(obj)
+				refid = _graph._refid(JavaObject._hprof_ifieldvals.__get__(obj)[ix], graph.classids)
+				try:
+					out[graph.index(objid)] = graph.index(refid)
+				except KeyError:
+					pass # no referent
+		self._weak = out
+		return out
+
+	def compute_dominators(self, progress_callback=None):
+		''' build the dominator tree of the heap, rooted at its GC roots.
+
+		This is done automatically by dominator(), retained_size() and
+		top_retainers(), but takes a while on large heaps. '''
+		if self._dominators is None:
+			from . import _graph
+			graph = self._object_graph(progress_callback)
+			roots = self._root_indices()
+			referrers = self.compute_referrers(progress_callback)
+			self._dominators = _graph.dominator_tree(graph, roots, progress_callback, referrers)
+		return self._dominators
+
+	def dominator(self, obj):
+		''' returns the immediate dominator of obj: the object that every path
+		from the GC roots to obj goes through last. Returns None for GC roots,
+		objects that are reachable from several of them through separate
+		paths, and objects that cannot be reached at all. '''
+		idom, retained = self.compute_dominators()
+		ix = idom[self._object_index(obj)]
+		if ix < 0:
+			return None
+		return self[self._graph.ids[ix]]
+
+	def retained_size(self, obj):
+		''' returns the number of bytes that would be freed if obj was
+		garbage collected: the shallow size of obj and every object that it
+		dominates. Objects that cannot be reached from any GC root retain
+		nothing. '''
+		idom, retained = self.compute_dominators()
+		return retained[self._object_index(obj)]
+
+	def top_retainers(self, n=10):
+		''' returns a list of (object, retained size) for the n objects with
+		the largest retained sizes, largest first. '''
+		import heapq
+		idom, retained = self.compute_dominators()
+		ixs = heapq.nlargest(n, range(len(retained)), key=retained.__getitem__)
+		ids = self._graph.ids
+		return [(self[ids[ix]], retained[ix]) for ix in ixs]
+
+	def string_value(self, obj):
+		''' returns the contents of a java.lang.String as a str, or None if
+		it has no value array.
+
+		Recently used values are cached, so asking for the same String again
+		is cheap. '''
+		if type(obj) is Ref:
+			obj = Ref._target.__get__(obj)
+		objid = JavaObject._hprof_id.__get__(obj)
+		cache = self._string_cache
+		try:
+			val = cache[objid]
+		except KeyError:
+			pass
+		else:
+			cache.move_to_end(objid)
+			return val
+		val = self._decode_string(obj)
+		cache[objid] = val
+		if len(cache) > self.string_cache_size:
+			cache.popitem(last=False)
+		return val
+
+	def iter_strings(self):
+		''' returns an iterable over (String, str) pairs for every
+		java.lang.String in the heap; see string_value(). The values are
+		not cached. '''
+		for cls in self.classes.get('java.lang.String', ()):
+			for obj in self._instances_of(cls):
+				yield obj, self._decode_string(obj)
+
+	def _decode_string(self, obj):
+		encoded = self._string_bytes(obj)
+		if encoded is None:
+			return None
+		arrid, codec, data = encoded
+		return str(data, codec, 'surrogatepass')
+
+	def _string_bytes(self, obj):
+		''' returns the id of the value array of a java.lang.String, and the
+		codec and raw bytes of its contents, or None if it has no value. '''
+		cls = type(obj)
+		try:
+			layout = self._string_layouts[cls]
+		except KeyError:
+			layout = self._string_layouts[cls] = _string_layout(cls)
+		valueix, offsetix, countix, coderix = layout
+		vals = JavaObject._hprof_ifieldvals.__get__(obj)
+		value = vals[valueix]
+		if value is None or value == 0:
+			return None
+		t, data = self._primarray_bytes(value)
+		if type(value) is not int:
+			value = JavaObject._hprof_id.__get__(value)
+		if offsetix is not None:
+			start = vals[offsetix] * t.size
+			data = data[start : start + vals[countix] * t.size]
+		if t is _jtype.char:
+			return value, 'utf-16-be', data
+		elif t is _jtype.byte:
+			if coderix is not None and vals[coderix]:
+				# UTF16 byte arrays are in the byte order of the JVM's host,
+				# which is not recorded in the dump. It's little-endian in
+				# practice.
+				return value, 'utf-16-le', data
+			return value, 'latin-1', data
+		raise _FormatError('String 0x%x has a %s[] value' % (JavaObject._hprof_id.__get__(obj), t.name))
+
+	def duplicate_arrays(self):
+		''' finds primitive arrays with identical contents.
+
+		Returns a list of (element type, length, ids, wasted bytes) tuples,
+		one for each group of at least two identical arrays, most wasted bytes
+		first. ids is a sorted array of the object ids of the group. The
+		wasted bytes are the shallow sizes of all but one of them.
+
+		Arrays are grouped by type and length first, and only the contents of
+		arrays in groups of two or more are hashed, straight from the file
+		data. '''
+		bysize = {} # (jtype, byte count) -> [row or array, ...]
+		table = self._table
+		if table is not None:
+			idsize = self._idsize
+			hdrsize = idsize + 9
+			data = self._data
+			for row, (kind, offset, length) in enumerate(zip(table.kinds, table.offsets, table.lengths)):
+				if kind == 0x23:
+					key = (data[offset + hdrsize - 1], length - hdrsize)
+					try:
+						bysize[key].append(row)
+					except KeyError:
+						bysize[key] = [row]
+			def contents(row):
+				offset = table.offsets[row]
+				return data[offset + hdrsize : offset + table.lengths[row]]
+			def objid(row):
+				return table.ids[row]
+		else:
+			for clslist in self.classes.values():
+				for cls in clslist:
+					if not isinstance(cls, JavaArrayClass):
+						continue
+					for arr in self._instances.get(cls, ()):
+						arrdata = arr._hprof_array_data
+						if type(arrdata) is _DeferredArrayData and arrdata.jtype is not _jobject:
+							key = (arrdata.jtype.value, len(arrdata.bytes))
+							try:
+								bysize[key].append(arr)
+							except KeyError:
+								bysize[key] = [arr]
+			def contents(arr):
+				return arr._hprof_array_data.bytes
+			objid = JavaObject._hprof_id.__get__
+
+		out = []
+		for (t, nbytes), members in bysize.items():
+			if len(members) < 2:
+				continue
+			t = _jtype(t)
+			size = self._array_size(nbytes)
+			for group in _same_contents(members, contents):
+				ids = _array('Q', sorted(map(objid, group)))
+				out.append((t, nbytes // t.size, ids, (len(ids) - 1) * size))
+		out.sort(key=lambda group: (-group[3], group[0].value, group[1], group[2][0]))
+		return out
+
+	def duplicate_strings(self):
+		''' finds java.lang.String objects with identical contents.
+
+		Returns a list of (value, ids, wasted bytes) tuples, one for each
+		group of at least two identical Strings, most wasted bytes first. ids
+		is a sorted array of the object ids of the group. The wasted bytes are
+		the shallow sizes of all but one of the Strings, and of all but one of
+		their value arrays (Strings may share them), as if the arrays held
+		exactly the contents of the String.
+
+		Only the contents of Strings whose values have the same encoding and
+		length are hashed, straight from the file data. '''
+		bysize = {} # (codec, byte count) -> [(String id, array id, String size), ...]
+		for cls in self.classes.get('java.lang.String', ()):
+			size = self._instance_size(cls)
+			for obj in self._instances_of(cls):
+				encoded = self._string_bytes(obj)
+				if encoded is None:
+					continue
+				arrid, codec, data = encoded
+				key = (codec, len(data))
+				member = (JavaObject._hprof_id.__get__(obj), arrid, size)
+				try:
+					bysize[key].append(member)
+				except KeyError:
+					bysize[key] = [member]
+
+		def contents(member):
+			return self._string_bytes(self[member[0]])[2]
+
+		out = []
+		for (codec, nbytes), members in bysize.items():
+			if len(members) < 2:
+				continue
+			arrsize = self._array_size(nbytes)
+			for group in _same_contents(members, contents):
+				ids = _array('Q', sorted(member[0] for member in group))
+				narrays = len(set(member[1] for member in group))
+				wasted = sum(member[2] for member in group[1:]) + (narrays - 1) * arrsize
+				value = self.string_value(self[ids[0]])
+				out.append((value, ids, wasted))
+		out.sort(key=lambda group: (-group[2], group[0]))
+		return out
+
+	def collection_view(self, obj):
+		''' returns a CollectionView of a java.util.HashMap, HashSet,
+		ArrayList or ConcurrentHashMap (or a subclass of one of them), which
+		reads the contents straight from its internal arrays and nodes.
+
+		Raises TypeError for other objects. '''
+		from . import _collections
+		return _collections.view(self, obj)
+
+	def collections_report(self):
+		''' returns a list of (collection, size, capacity, fill ratio, wasted
+		bytes) tuples for every collection that collection_view() supports,
+		most wasted bytes first. The capacity is the length of the internal
+		array, and the wasted bytes are its empty slots. The fill ratio is
+		None if no array has been allocated. '''
+		from . import _collections
+		return _collections.report(self)
+
+	def _field_values(self, obj):
+		''' returns the class of an instance and all of its instance field
+		values, as a single tuple in InstanceLayout order. obj may be an id,
+		but not a Ref; instances that have not been created yet in an indexed heap are read
+		straight from the file data. References are ids, unless they have been
+		resolved. '''
+		if type(obj) is int:
+			table = self._table
+			if table is not None and not dict.__contains__(self, obj):
+				try:
+					row = table.find(obj)
+				except KeyError as e:
+					raise _MissingObject(hex(obj)) from e
+				if table.kinds[row] == 0x21:
+					cls = self[table.clsids[row]]
+					idsize = self._idsize
+					offset = table.offsets[row]
+					data = self._data[offset + 2 * idsize + 8 : offset + table.lengths[row]]
+					return cls, _layout(self, cls, idsize).unpack(data)
+			obj = self._deref(obj)
+		cls = type(obj)
+		if isinstance(cls, JavaArrayClass) or isinstance(obj, JavaClass):
+			raise TypeError('%r is not an instance' % (obj,))
+		return cls, JavaObject._hprof_ifieldvals.__get__(obj)
+
+	def _array_elements(self, arr):
+		''' returns the elements of an object array, given the array or its
+		id, as ids, unless they have been resolved. Arrays that have not been
+		created yet in an indexed heap are read straight from the file data. '''
+		if type(arr) is int:
+			table = self._table
+			if table is not None and not dict.__contains__(self, arr):
+				try:
+					row = table.find(arr)
+				except KeyError as e:
+					raise _MissingObject(hex(arr)) from e
+				if table.kinds[row] == 0x22:
+					idsize = self._idsize
+					offset = table.offsets[row]
+					return _decode_ids(self._data[offset + 2 * idsize + 8 : offset + table.lengths[row]], idsize)
+			arr = self._deref(arr)
+		data = getattr(arr, '_hprof_array_data', None)
+		if type(data) is not _RefArrayData:
+			raise TypeError('%r is not an object array' % (arr,))
+		if data.objs is not None:
+			return data.objs
+		return data._decoded()
+
+	def _primarray_bytes(self, arr):
+		''' returns the element type and raw bytes of a primitive array,
+		given the array or its id. Arrays that have not been created yet in an
+		indexed heap are read straight from the file data. '''
+		if type(arr) is int:
+			table = self._table
+			if table is not None and not dict.__contains__(self, arr):
+				try:
+					row = table.find(arr)
+				except KeyError as e:
+					raise _MissingObject(hex(arr)) from e
+				if table.kinds[row] == 0x23:
+					offset = table.offsets[row]
+					start = offset + self._idsize + 8 # id, stacktrace, length
+					return _jtype(self._data[start]), self._data[start + 1 : offset + table.lengths[row]]
+			arr = self._deref(arr)
+		data = getattr(arr, '_hprof_array_data', None)
+		if type(data) is not _DeferredArrayData or data.jtype is _jobject:
+			raise TypeError('%r is not a primitive array' % (arr,))
+		return data.jtype, data.bytes
+
+	def resolve_references(self, progress_callback=None):
+		''' resolve every reference in the heap now, rather than when it is
+		accessed, and cache the results (see cache_references).
+
+		This goes through the heap one class at a time; only the reference
+		fields of each class are looked at. '''
+		self.cache_references = True
+		deref = self._deref
+		total = len(self)
+		done = 0
+		if progress_callback:
+			progress_callback('resolving heap', 0, total)
+		for clslist in self.classes.values():
+			for cls in clslist:
+				for name in cls._hprof_sfields:
+					_static_value(cls, name)
+				n = 0
+				if isinstance(cls, JavaArrayClass):
+					for arr in self._instances_of(cls):
+						n += 1
+						data = arr._hprof_array_data
+						if type(data) is _RefArrayData:
+							data.resolve()
+				else:
+					ixs = _reference_fields(cls)
+					getvals = JavaObject._hprof_ifieldvals.__get__
+					setvals = JavaObject._hprof_ifieldvals.__set__
+					for obj in self._instances_of(cls):
+						n += 1
+						vals = getvals(obj)
+						newvals = None
+						for ix in ixs:
+							if type(vals[ix]) is int:
+								if newvals is None:
+									newvals = list(vals)
+								newvals[ix] = deref(vals[ix])
+						if newvals is not None:
+							setvals(obj, tuple(newvals))
+				done += n + 1 # the class itself counts too
+				if progress_callback:
+					progress_callback('resolving heap', min(done, total), total)
+		if progress_callback:
+			progress_callback('resolving heap', total, total)
+
+
+def _subclass_closure(cls, out):
+	''' returns cls and all of its subclasses as a tuple, in the order that
+	walking cls.__subclasses__() depth first would find them. The tuples for
+	cls and the subclasses are stored in out, and reused from it. '''
+	try:
+		return out[cls]
+	except KeyError:
+		pass
+	found = [cls]
+	for subcls in cls.__subclasses__():
+		found.extend(_subclass_closure(subcls, out))
+	found = out[cls] = tuple(found)
+	return found
+
+def _same_contents(members, contents):
+	''' groups members whose contents(member) are the same, leaving out
+	those that are unique. Members are grouped by hash first, and the
+	contents of those with the same hash are compared to be sure. '''
+	buckets = {}
+	for member in members:
+		digest = _hashlib.blake2b(contents(member), digest_size=16).digest()
+		try:
+			buckets[digest].append(member)
+		except KeyError:
+			buckets[digest] = [member]
+	out = []
+	for bucket in buckets.values():
+		if len(bucket) < 2:
+			continue
+		groups = [] # (contents, members) for each distinct contents
+		for member in bucket:
+			data = contents(member)
+			for known, group in groups:
+				if known == data:
+					group.append(member)
+					break
+			else:
+				groups.append((bytes(data), [member]))
+		out.extend(group for known, group in groups if len(group) > 1)
+	return out
+
+def _string_layout(cls):
+	''' returns the field indices of value, offset, count and coder in the
+	instance fields of a java.lang.String class, with None for those that
+	it does not have.
+
+	Which fields there are depends on the JVM: old JDKs and Dalvik share
+	char arrays between strings, using offset and count. Newer JDKs store
+	chars or, since JDK 9, bytes with a coder. On ART, count is not the
+	length, but there is no offset either, so it is not used. '''
+	if str(cls) != 'java.lang.String':
+		raise TypeError('%s is not java.lang.String' % cls)
+	ixs = cls._hprof_ifieldix
+	if 'value' not in ixs:
+		raise _FormatError('%s has no value field' % cls)
+	if 'offset' in ixs and 'count' in ixs:
+		offsetix, countix = _field_index(cls, 'offset'), _field_index(cls, 'count')
+	else:
+		offsetix, countix = None, None
+	coderix = _field_index(cls, 'coder') if 'coder' in ixs else None
+	return _field_index(cls, 'value'), offsetix, countix, coderix
+
+def _reference_fields(cls):
+	''' returns the indices of the reference fields in the field values of
+	an instance of cls, including the inherited ones. '''
+	out = []
+	start = 0
+	while cls is not JavaObject:
+		out.extend(start + ix for ix, t in enumerate(cls._hprof_ifields.values()) if t is _jobject)
+		start += len(cls._hprof_ifields)
+		cls, = cls.__bases__
+	return tuple(out)
+
+class _HeapValues(_ValuesView):
+	''' Heap.values(); goes through the objects without looking each id up. '''
+	__slots__ = ()
+
+	def __iter__(self):
+		return self._mapping._itervalues()
+
+class _HeapItems(_ItemsView):
+	''' Heap.items(); goes through the objects without looking each id up. '''
+	__slots__ = ()
+
+	def __iter__(self):
+		return self._mapping._iteritems()
 
 class JavaHierarchy(object):
 	pass
@@ -121,8 +991,13 @@ class JavaClassName(JavaClassContainer):
 class JavaObject(object):
 	__slots__ = (
 		'_hprof_id',       # object id
+		'_hprof_ifieldvals', # all instance field values, see InstanceLayout
 	)
 
+	_hprof_heap = None # set on each JavaClass by the heap that owns it
+	_hprof_attrs = {}  # see _attr_table()
+	_hprof_nifields = 0 # number of instance fields, including inherited ones
+
 	def __init__(self, objid):
 		JavaObject._hprof_id.__set__(self, objid)
 
@@ -151,42 +1026,41 @@ class JavaObject(object):
 			t = type(self)
 		else:
 			t = reftype
-		while t is not JavaObject:
-			if name in t._hprof_ifieldix:
-				ix = t._hprof_ifieldix[name]
-				vals = t._hprof_ifieldvals.__get__(self)
-				return vals[ix]
-			elif name in t._hprof_sfields:
-				return t._hprof_sfields[name]
-			bases = t.__bases__
-			if len(bases) == 2:
-				t = bases[1 - bases.index(JavaArray)]
-			else:
-				t, = bases
-		# TODO: implement getattr(x, 'super') to return a Ref?
-		# TODO: ...and x.SuperClass too?
-		raise AttributeError('type %r has no attribute %r' % (type(self), name))
+		try:
+			lcls, ix, isref = t._hprof_attrs[name]
+		except KeyError:
+			# may be a static field that was added after the class was created.
+			lcls = _static_owner(t, name)
+			if lcls is None:
+				# TODO: implement getattr(x, 'super') to return a Ref?
+				# TODO: ...and x.SuperClass too?
+				raise AttributeError('type %r has no attribute %r' % (type(self), name)) from None
+			ix = None
+		if ix is None:
+			return _static_value(lcls, name)
+		vals = JavaObject._hprof_ifieldvals.__get__(self)
+		val = vals[ix]
+		if isref and type(val) is int and lcls._hprof_heap is not None:
+			# unresolved reference
+			heap = lcls._hprof_heap
+			val = heap._deref(val)
+			if heap.cache_references:
+				ix += len(vals)
+				JavaObject._hprof_ifieldvals.__set__(self, vals[:ix] + (val,) + vals[ix+1:])
+		return val
 
 
 class JavaArray(JavaObject):
 	__slots__ = ()
 
 	def __len__(self):
-		try:
-			return len(self._hprof_array_data)
-		except TypeError:
-			self._hprof_array_data = self._hprof_array_data.toarray()
-			return len(self._hprof_array_data)
+		return len(self._hprof_array_data)
 
 	def __getitem__(self, ix):
-		try:
-			return self._hprof_array_data[ix]
-		except TypeError:
-			try:
-				self._hprof_array_data = self._hprof_array_data.toarray()
-			except AttributeError:
-				pass # the TypeError was the caller's fault, not ours
-			return self._hprof_array_data[ix]
+		return self._hprof_array_data[ix]
+
+	def __iter__(self):
+		return iter(self._hprof_array_data)
 
 class JavaClass(type):
 	__slots__ = ()
@@ -197,13 +1071,14 @@ class JavaClass(type):
 		assert '$' not in name or name.find('$') >= name.find('$$')
 		assert ';' not in name
 		assert isinstance(static_attrs, dict)
+		assert isinstance(instance_attrs, dict)
 		if supercls is None:
 			supercls = JavaObject
 		if meta is JavaArrayClass and not isinstance(supercls, JavaArrayClass):
-			slots = ('_hprof_ifieldvals', '_hprof_array_data')
+			slots = ('_hprof_array_data',)
 			supercls = (JavaArray,supercls)
 		else:
-			slots = ('_hprof_ifieldvals')
+			slots = ()
 			supercls = (supercls,)
 		cls = super().__new__(meta, name, supercls, {
 			'__slots__': slots,
@@ -211,6 +1086,9 @@ class JavaClass(type):
 		cls._hprof_sfields = static_attrs
 		cls._hprof_ifields = instance_attrs
 		cls._hprof_ifieldix = {name:ix for ix, name in enumerate(instance_attrs)}
+		cls._hprof_objsize = None # instance size from the class dump, if any
+		cls._hprof_nifields = supercls[-1]._hprof_nifields + len(instance_attrs)
+		cls._hprof_attrs = _attr_table(cls, supercls[-1])
 		return cls
 
 	def __init__(meta, name, supercls, static_attrs, instance_attrs):
@@ -237,36 +1115,208 @@ class JavaClass(type):
 		t = self
 		while t is not JavaObject:
 			if name in t._hprof_sfields:
-				return t._hprof_sfields[name]
+				return _static_value(t, name)
 			t, = t.__bases__
 		raise AttributeError('type %r has no static attribute %r' % (self, name))
 
 
+def _attr_table(cls, supercls):
+	''' builds the attribute lookup table of a new class, so that
+	JavaObject.__getattr__ does not have to walk the class hierarchy.
+
+	It maps each attribute name to (declaring class, index, is a reference)
+	for instance fields, with the index from _field_index(), or (declaring
+	class, None, None) for static fields. The fields of cls shadow those of
+	its super classes, and its instance fields shadow its static fields. '''
+	out = dict(supercls._hprof_attrs)
+	for name in cls._hprof_sfields:
+		out[name] = (cls, None, None)
+	ifields = cls._hprof_ifields
+	for name in cls._hprof_ifieldix:
+		out[name] = (cls, _field_index(cls, name), ifields[name] is _jobject)
+	return out
+
+def _field_index(cls, name):
+	''' the index of the instance field name, declared by cls, in the field
+	values of an instance of cls or any of its subclasses.
+
+	The values are in InstanceLayout order: the fields of the most derived
+	class come first, so the index counts from the end to be the same for
+	all subclasses. '''
+	return cls._hprof_ifieldix[name] - cls._hprof_nifields
+
+def _static_owner(cls, name):
+	''' the class that declares the static field name, walking up from cls,
+	or None. '''
+	while cls is not JavaObject:
+		if name in cls._hprof_sfields:
+			return cls
+		bases = cls.__bases__
+		if len(bases) == 2:
+			cls = bases[1 - bases.index(JavaArray)]
+		else:
+			cls, = bases
+	return None
+
+def _static_value(cls, name):
+	val = cls._hprof_sfields[name]
+	if type(val) is _DeferredRef and cls._hprof_heap is not None:
+		val = cls._hprof_sfields[name] = cls._hprof_heap._deref(val)
+	return val
+
+
+class _RefArrayData(object):
+	''' The elements of an object array, as ids that are looked up in the
+	heap when they are accessed. '''
+	__slots__ = ('heap', 'ids', 'objs')
+
+	def __init__(self, heap, ids):
+		self.heap = heap
+		self.ids = ids
+		self.objs = None # all elements, once resolved and cached
+
+	def _decoded(self):
+		ids = self.ids
+		if type(ids) is _DeferredArrayData:
+			ids = self.ids = ids.toarray()
+		return ids
+
+	def __len__(self):
+		if self.objs is not None:
+			return len(self.objs)
+		return len(self._decoded())
+
+	def resolve(self):
+		''' look up all elements, and keep them. '''
+		if self.objs is None:
+			deref = self.heap._deref
+			self.objs = tuple(deref(objid) for objid in self._decoded())
+			self.ids = None
+		return self.objs
+
+	def __getitem__(self, ix):
+		objs = self.objs
+		if objs is None:
+			if self.heap.cache_references:
+				return self.resolve()[ix]
+			ids = self._decoded()
+			deref = self.heap._deref
+			if type(ix) is slice:
+				return tuple(deref(objid) for objid in ids[ix])
+			return deref(ids[ix])
+		return objs[ix]
+
+
 class _DeferredArrayData(object):
-	__slots__ = ('bytes', 'jtype')
+	''' The raw, big-endian elements of an array. Single elements are decoded
+	as they are read; slicing or iterating decodes all of them in bulk, once. '''
+	__slots__ = ('bytes', 'jtype', 'idsize', '_decoded')
 
-	def __init__(self, jtype, bytes):
-		assert len(bytes) % jtype.size == 0
+	def __init__(self, jtype, bytes, idsize=None):
+		if idsize is None:
+			assert len(bytes) % jtype.size == 0
+		else:
+			assert len(bytes) % idsize == 0
 		self.jtype = jtype
 		self.bytes = bytes
+		self.idsize = idsize
+		self._decoded = None
+
+	def __len__(self):
+		if self.idsize is None:
+			return len(self.bytes) // self.jtype.size
+		return len(self.bytes) // self.idsize
+
+	def __getitem__(self, ix):
+		decoded = self._decoded
+		if decoded is None:
+			if type(ix) is int:
+				return self._item(ix)
+			decoded = self._decoded = self.toarray()
+		if type(ix) is slice and self.jtype in _prim_typecodes:
+			return tuple(decoded[ix]) # slices of numeric arrays are tuples, as always.
+		return decoded[ix]
+
+	def __iter__(self):
+		decoded = self._decoded
+		if decoded is None:
+			decoded = self._decoded = self.toarray()
+		return iter(decoded)
+
+	def _item(self, ix):
+		''' decodes the element at index ix on its own. '''
+		n = len(self)
+		if ix < 0:
+			ix += n
+		if not 0 <= ix < n:
+			raise IndexError('array index out of range')
+		if self.idsize is not None:
+			size = self.idsize
+			return int.from_bytes(self.bytes[ix * size : ix * size + size], 'big')
+		t = self.jtype
+		if t is _jtype.char:
+			return chr(int.from_bytes(self.bytes[2 * ix : 2 * ix + 2], 'big'))
+		value, = _struct.unpack_from('>' + t.packfmt, self.bytes, ix * t.size)
+		return value
 
 	def toarray(self):
 		from . import jtype
-		if self.jtype is jtype.char:
-			import codecs
-			# Decode bytes pair-by-pair.
-			# Not pretty, but we want the same behavior as Java, which
-			# means each char element is exactly 16 bits; surrogate pairs
-			# therefore must span two array indices.
-			return ''.join(
-				codecs.decode(self.bytes[i:i+2], 'utf-16-be', 'surrogatepass')
-				for i in range(0, len(self.bytes), 2)
-			)
+		if self.jtype is jtype.object:
+			return _decode_ids(self.bytes, self.idsize)
+		elif self.jtype is jtype.char:
+			return _decode_chars(self.bytes)
+		elif self.jtype in _prim_typecodes:
+			return _decode_numbers(self.bytes, _prim_typecodes[self.jtype])
 		else:
-			import struct
 			count = len(self.bytes) // self.jtype.size
 			fmt = '>%d%s' % (count, self.jtype.packfmt)
-			return struct.unpack(fmt, self.bytes)
+			return _struct.unpack(fmt, self.bytes)
+
+def _decode_numbers(bytes, typecode):
+	''' decodes a run of big-endian numbers in one go; into an array, or, on
+	big-endian machines, a memoryview of bytes. '''
+	if _sys.byteorder == 'big':
+		return memoryview(bytes).cast(typecode)
+	vals = _array(typecode)
+	vals.frombytes(bytes)
+	vals.byteswap()
+	return vals
+
+def _decode_chars(bytes):
+	''' decodes a run of big-endian UTF-16 code units in one go.
+
+	We want the same behavior as Java, which means each char element is
+	exactly 16 bits; surrogate pairs must span two indices, and lone
+	surrogates are kept as they are. The codec joins surrogate pairs, so any
+	characters outside the BMP are split up again afterwards. '''
+	s = str(bytes, 'utf-16-be', 'surrogatepass')
+	if len(s) * 2 == len(bytes):
+		return s # no surrogate pairs; the common case.
+	return _astral.sub(_split_astral, s)
+
+_astral = _re.compile('[\U00010000-\U0010ffff]')
+
+def _split_astral(match):
+	c = ord(match.group()) - 0x10000
+	return chr(0xd800 | (c >> 10)) + chr(0xdc00 | (c & 0x3ff))
+
+_id_typecodes = {
+	_array('I').itemsize: 'I',
+	_array('L').itemsize: 'L',
+	_array('Q').itemsize: 'Q',
+}
+
+def _decode_ids(bytes, idsize):
+	''' decodes a run of big-endian object ids in one go. '''
+	try:
+		typecode = _id_typecodes[idsize]
+	except KeyError:
+		# odd id size; no native type to lean on.
+		return tuple(
+			int.from_bytes(bytes[i:i+idsize], 'big')
+			for i in range(0, len(bytes), idsize)
+		)
+	return _decode_numbers(bytes, typecode)
 
 class JavaArrayClass(JavaClass):
 	__slots__ = ()
@@ -315,7 +1365,10 @@ _name_to_typechar = {
 }
 
 
-def _create_class(container, name, supercls, staticattrs, instanceattrs):
+def _split_class_name(name):
+	''' splits a class name from a class load record into its package names
+	and its (nested) class names. The last class name ends with a [] for each
+	array dimension. '''
 	# android hprofs may have slightly different class name format...
 	if '.' in name:
 		name = name.replace('.', '/')
@@ -358,15 +1411,27 @@ def _create_class(container, name, supercls, staticattrs, instanceattrs):
 		extra = ''
 
 	name = name.split('/')
-	container = _get_or_create_container(container, name[:-1], JavaPackage)
+	packages = name[:-1]
 	name = name[-1].split('$')
 	if extra:
 		name[-1] += extra
 	name[-1] += nests * '[]'
+	return packages, name
+
+def _class_name(name):
+	''' the name that a class load record's class name gets in Heap.classes,
+	as a plain string. '''
+	packages, names = _split_class_name(name)
+	return '.'.join(packages + names)
+
+def _create_class(container, name, supercls, staticattrs, instanceattrs):
+	packages, name = _split_class_name(name)
+	isarray = name[-1].endswith('[]')
+	container = _get_or_create_container(container, packages, JavaPackage)
 	container = _get_or_create_container(container, name[:-1], JavaClassName)
 	classname = _get_or_create_container(container, name[-1:], JavaClassName)
 	name = name[-1]
-	if nests:
+	if isarray:
 		cls = JavaArrayClass(name, supercls, staticattrs, instanceattrs)
 	else:
 		cls = JavaClass(name, supercls, staticattrs, instanceattrs)
@@ -375,3 +1440,48 @@ def _create_class(container, name, supercls, staticattrs, instanceattrs):
 	else:
 		type.__setattr__(cls, '__module__', None)
 	return classname, cls
+
+
+from . import jtype as _jtype
+from . import RootKind as _RootKind
+from ._heap_parsing import DeferredRef as _DeferredRef
+from ._heap_parsing import _layout
+_jobject = _jtype.object
+_rootkinds = {kind.value: kind for kind in _RootKind}
+
+# array typecodes for the primitive types, where the sizes match.
+_prim_typecodes = {
+	t: code
+	for t, code, size in (
+		(_jtype.byte,   'b', 1),
+		(_jtype.short,  'h', 2),
+		(_jtype.int,    'i', 4),
+		(_jtype.long,   'q', 8),
+		(_jtype.float,  'f', 4),
+		(_jtype.double, 'd', 8),
+	)
+	if _array(code).itemsize == size
+}
+
+_dtypes = {
+	_jtype.boolean: '?',
+	_jtype.char:    '>u2',
+	_jtype.float:   '>f4',
+	_jtype.double:  '>f8',
+	_jtype.byte:    'i1',
+	_jtype.short:   '>i2',
+	_jtype.int:     '>i4',
+	_jtype.long:    '>i8',
+}
+
+def as_ndarray(arr):
+	''' returns the elements of a primitive array as a read-only numpy
+	ndarray. It is a view of the file data, with a big-endian dtype; nothing
+	is copied or decoded. Requires numpy. '''
+	import numpy
+	if type(arr) is Ref:
+		arr = Ref._target.__get__(arr)
+	data = getattr(arr, '_hprof_array_data', None)
+	if type(data) is not _DeferredArrayData or data.jtype is _jobject:
+		raise TypeError('%r is not a primitive array' % (arr,))
+	return numpy.frombuffer(data.bytes, dtype=_dtypes[data.jtype])
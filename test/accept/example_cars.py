@@ -34,6 +34,28 @@ class TestCars(object):
 		self.assertIsInstance(self.cars.mine.make, self.stringCls)
 		self.assertIsInstance(self.cars.redYellow.make, self.stringCls)
 
+	def test_vehicle_make_strings(self):
+		strval = self.heap.string_value
+		self.assertEqual(strval(self.cars.swe.make), 'Lolvo')
+		self.assertEqual(strval(self.cars.jap.make), 'Toy Yoda')
+		self.assertEqual(strval(self.cars.generic.make), 'Stretch')
+		self.assertEqual(strval(self.cars.mine.make), 'Fånark')
+		self.assertEqual(strval(self.cars.redYellow.make), 'Axes')
+
+	def test_iter_strings(self):
+		strings = dict(self.heap.iter_strings())
+		self.assertEqual(strings[self.cars.mine.make], 'Fånark')
+		self.assertEqual(len(strings), len(list(self.heap.exact_instances(self.stringCls))))
+
+	def test_reachable(self):
+		self.assertCountEqual(self.heap.all_instances('com.example.cars.Vehicle', reachable=True),
+				self.heap.all_instances('com.example.cars.Vehicle'))
+		self.assertTrue(self.heap.is_reachable(self.cars))
+		self.assertEqual(self.heap.path_to_root(self.cars.generic), [self.cars, self.cars.generic])
+		live = len(list(self.heap.exact_instances('java.lang.Class', reachable=True)))
+		dead = len(list(self.heap.exact_instances('java.lang.Class', reachable=False)))
+		self.assertEqual(live + dead, len(list(self.heap.exact_instances('java.lang.Class'))))
+
 	def test_vehicle_array(self):
 		self.assertEqual(len(self.cars.vehicles), 5)
 		self.assertIs(self.cars.vehicles[0], self.cars.swe)
@@ -30,3 +30,11 @@ class JvmTest(TestCase):
 class TestShadowingJvm(TestShadowing, JvmTest): pass
 class TestArraysJvm(TestArrays, JvmTest): pass
 class TestCarsJvm(TestCars, JvmTest): pass
+
+class TestHistogramJvm(JvmTest):
+	def test_same_as_heap(self):
+		heap, = self.hf.heaps
+		expected = [(str(cls), count, size) for cls, (count, size) in heap.shallow_size_by_class().items()]
+		hist = hprof.histogram('testdata/example-java.hprof.bz2')
+		self.assertCountEqual(hist, expected)
+		self.assertIn(('com.example.cars.Limo', 1, 32), hist)
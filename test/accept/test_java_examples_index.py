@@ -0,0 +1,32 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+from unittest import TestCase
+
+from .example_shadowing import TestShadowing
+from .example_arrays import TestArrays
+from .example_cars import TestCars
+
+import hprof
+
+from . import util
+
+def setUpModule():
+	global thefile
+	print()
+	thefile = hprof.open('testdata/example-java.hprof.bz2', util.progress('example-java (index)'), mode='index')
+	print('example-java (index): file loaded!    ')
+
+def tearDownModule():
+	global thefile
+	thefile.close()
+	thefile = None
+
+class JvmIndexTest(TestCase):
+	@classmethod
+	def setUpClass(self):
+		self.hf = thefile
+
+class TestShadowingJvmIndex(TestShadowing, JvmIndexTest): pass
+class TestArraysJvmIndex(TestArrays, JvmIndexTest): pass
+class TestCarsJvmIndex(TestCars, JvmIndexTest): pass
@@ -0,0 +1,44 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from .example_shadowing import TestShadowing
+from .example_arrays import TestArrays
+from .example_cars import TestCars
+
+import hprof
+
+from . import util
+
+def setUpModule():
+	global thefile, tmpdir
+	print()
+	tmpdir = tempfile.TemporaryDirectory()
+	path = os.path.join(tmpdir.name, 'example-java.hprof.bz2')
+	shutil.copyfile('testdata/example-java.hprof.bz2', path)
+	with hprof.open(path, util.progress('example-java (writing index)'), mode='index', sidecar=True):
+		pass
+	assert os.path.exists(path + '.pyhprof-idx')
+	thefile = hprof.open(path, util.progress('example-java (reading index)'), mode='index', sidecar=True)
+	print('example-java (reading index): file loaded!    ')
+
+def tearDownModule():
+	global thefile, tmpdir
+	thefile.close()
+	thefile = None
+	tmpdir.cleanup()
+	tmpdir = None
+
+class JvmSidecarTest(TestCase):
+	@classmethod
+	def setUpClass(self):
+		self.hf = thefile
+
+class TestShadowingJvmSidecar(TestShadowing, JvmSidecarTest): pass
+class TestArraysJvmSidecar(TestArrays, JvmSidecarTest): pass
+class TestCarsJvmSidecar(TestCars, JvmSidecarTest): pass
@@ -11,7 +11,7 @@ class TestClassInstanceLookups(unittest.TestCase):
 		self.heap = hprof.heap.Heap()
 
 		def c(name, supercls):
-			name, cls = _create_class(self.heap.classtree, name, supercls, {}, ())
+			name, cls = _create_class(self.heap.classtree, name, supercls, {}, {})
 			self.heap._instances[cls] = []
 			if name not in self.heap.classes:
 				self.heap.classes[name] = []
@@ -148,3 +148,51 @@ class TestClassInstanceLookups(unittest.TestCase):
 				with self.subTest('all'):
 					self.assertCountEqual(self.heap.all_instances(key),
 							(self.la,))
+
+	def test_counts(self):
+		keys = (
+			self.objectCls1, self.objectCls2, 'java.lang.Object', self.classCls,
+			self.listCls, self.alistCls, self.llistCls, self.parrayCls,
+			self.oarrayCls, 'java.lang.Object[]', self.larrayCls,
+		)
+		for key in keys:
+			with self.subTest(key=key):
+				self.assertEqual(self.heap.instance_count(key), len(list(self.heap.all_instances(key))))
+				self.assertEqual(self.heap.instance_count(key, subclasses=False), len(list(self.heap.exact_instances(key))))
+		self.assertEqual(self.heap.instance_count('java.lang.Object'), 21)
+		self.assertEqual(self.heap.instance_count(self.classCls, False), 9)
+
+	def test_class_added_later(self):
+		from hprof.heap import _create_class
+		self.assertEqual(self.heap.instance_count(self.listCls), 4) # index the classes first
+		name, stack = _create_class(self.heap.classtree, 'java.util.Stack', self.listCls, {}, {})
+		self.heap.classes[name] = [stack]
+		s1 = stack(60)
+		self.heap._instances[stack] = [s1]
+		self.heap[0x5ac] = stack
+		self.assertCountEqual(self.heap.all_instances(stack), (s1,))
+		self.assertEqual(self.heap.instance_count(stack), 1)
+		self.assertCountEqual(self.heap.all_instances(self.listCls), (self.l1, self.l2, self.a1, self.a2, s1))
+		self.assertEqual(self.heap.instance_count(self.listCls), 5)
+		self.assertEqual(self.heap.instance_count(self.classCls), 10)
+
+	def test_not_in_heap(self):
+		from hprof.heap import _create_class
+		_, other = _create_class(self.heap.classtree, 'com.example.Other', self.objectCls2, {}, {})
+		self.assertEqual(self.heap.instance_count(other), 0)
+		self.assertCountEqual(self.heap.all_instances(other), ())
+
+	def test_subclass_not_in_heap(self):
+		from hprof.heap import _create_class
+		self.assertEqual(len(list(self.heap.all_instances(self.listCls))), 4) # index the classes first
+		_, stack = _create_class(self.heap.classtree, 'java.util.Stack', self.listCls, {}, {})
+		_, vector = _create_class(self.heap.classtree, 'java.util.Vector', stack, {}, {})
+		s1, v1 = stack(60), vector(61)
+		self.heap._instances[stack] = [s1]
+		self.heap._instances[vector] = [v1]
+		# not stored in the heap, so they are walked as they are.
+		self.assertCountEqual(self.heap.all_instances(stack), (s1, v1))
+		self.assertEqual(self.heap.instance_count(stack), 2)
+		self.assertEqual(self.heap.instance_count(vector), 1)
+		self.assertEqual(self.heap.instance_count(stack, subclasses=False), 1)
+		self.assertEqual(self.heap.instance_count(self.listCls), 4)
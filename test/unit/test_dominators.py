@@ -0,0 +1,219 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import random
+import unittest
+import hprof
+
+from array import array
+
+from hprof._graph import ObjectGraph, build_graph, dominator_tree, mark_reachable, reverse_edges
+
+from .util import Builder, Dump, hprofdata
+
+def makegraph(edges, sizes):
+	graph = ObjectGraph(array('Q', range(1, len(sizes) + 1)))
+	for ix, size in enumerate(sizes):
+		graph.targets.extend(edges.get(ix, ()))
+		graph.offsets.append(len(graph.targets))
+		graph.sizes.append(size)
+	return graph
+
+def naive_dominators(edges, n, roots):
+	''' the straightforward iterative data flow solution, with node n as the
+	virtual root. '''
+	succs = dict(edges)
+	succs[n] = roots
+	reachable = {n}
+	todo = [n]
+	while todo:
+		for t in succs.get(todo.pop(), ()):
+			if t not in reachable:
+				reachable.add(t)
+				todo.append(t)
+	preds = {ix: set() for ix in reachable}
+	for src in reachable:
+		for t in succs.get(src, ()):
+			preds[t].add(src)
+	dom = {ix: set(reachable) for ix in reachable}
+	dom[n] = {n}
+	changed = True
+	while changed:
+		changed = False
+		for ix in reachable - {n}:
+			new = {ix} | set.intersection(*(dom[p] for p in preds[ix]))
+			if new != dom[ix]:
+				dom[ix] = new
+				changed = True
+	return dom
+
+def graphdump(idsize):
+	''' Node objects in descending id order: 0x52 and 0x53 are roots and
+	refer to 0x51, which refers to 0x50, as does the garbage 0x54. The Node
+	class refers to 0x50 and to java.lang.Object through static fields, and
+	has an int one. '''
+	heap = Builder(idsize)
+	heap.class_dump(0x10, 0, 0, ())
+	heap.class_dump(0x11, 0x10, idsize, ((0x102, 2),), statics=((0x103, 2, 0x50), (0x104, 2, 0x10), (0x105, 10, 7)))
+	for objid, nextid in ((0x54, 0x50), (0x53, 0x51), (0x52, 0x51), (0x51, 0x50), (0x50, 0)):
+		heap.instance(objid, 0x11, Builder(idsize).id(nextid))
+	for objid in (0x53, 0x52):
+		heap.u1(0x03).id(objid).u4(1).i4(0)
+	out = Dump(idsize).names(('java/lang/Object', 'com/example/Node', 'next', 'FIRST', 'OBJECT', 'COUNT'))
+	out.stack_trace().loads((0x10, 0x11))
+	return out.heap(heap).end()
+
+class TestDominatorTree(unittest.TestCase):
+	def check(self, edges, sizes, roots):
+		n = len(sizes)
+		graph = makegraph(edges, sizes)
+		idom, retained = dominator_tree(graph, roots)
+		dom = naive_dominators(edges, n, roots)
+		for ix in range(n):
+			if ix not in dom:
+				self.assertEqual(idom[ix], -2, ix)
+				self.assertEqual(retained[ix], 0, ix)
+				continue
+			strict = dom[ix] - {ix}
+			closest = max(strict, key=lambda d: len(dom[d]))
+			self.assertEqual(idom[ix], -1 if closest == n else closest, ix)
+			dominated = [other for other in dom if other != n and ix in dom[other]]
+			self.assertEqual(retained[ix], sum(sizes[other] for other in dominated), ix)
+
+	def test_chain(self):
+		self.check({0: [1], 1: [2]}, [1, 10, 100], [0])
+
+	def test_diamond(self):
+		self.check({0: [1, 2], 1: [3], 2: [3], 3: [4]}, [1, 2, 4, 8, 16], [0])
+
+	def test_multiple_roots(self):
+		self.check({0: [2], 1: [2], 2: [3]}, [1, 2, 4, 8], [0, 1])
+
+	def test_cycles(self):
+		self.check({0: [1], 1: [2, 0], 2: [1, 3], 3: [3]}, [1, 2, 4, 8], [0])
+
+	def test_unreachable(self):
+		self.check({0: [1], 2: [1, 3]}, [1, 2, 4, 8], [0])
+
+	def test_no_roots(self):
+		self.check({0: [1]}, [1, 2], [])
+
+	def test_random(self):
+		rnd = random.Random(1234)
+		for i in range(200):
+			n = rnd.randint(1, 30)
+			edges = {}
+			for src in range(n):
+				edges[src] = [rnd.randrange(n) for j in range(rnd.randint(0, 3))]
+			sizes = [rnd.randint(0, 100) for ix in range(n)]
+			roots = rnd.sample(range(n), rnd.randint(0, min(n, 3)))
+			with self.subTest(i=i):
+				self.check(edges, sizes, roots)
+
+	def test_mark_reachable(self):
+		graph = makegraph({0: [1], 1: [2], 3: [2]}, [0, 0, 0, 0])
+		self.assertEqual(list(mark_reachable(graph, [0, 2, 0])), [1, 1, 1, 0])
+		self.assertEqual(list(mark_reachable(graph, [])), [0, 0, 0, 0])
+
+	def test_reverse_edges(self):
+		graph = makegraph({0: [1, 2], 1: [2], 2: [0, 2]}, [0, 0, 0, 0])
+		offsets, sources = reverse_edges(graph)
+		self.assertEqual(list(offsets), [0, 1, 2, 5, 5])
+		self.assertEqual(list(sources), [2, 0, 0, 1, 2])
+
+
+class TestHeapDominators(unittest.TestCase):
+	def each_heap(self, fn):
+		for mode in ('full', 'index'):
+			with self.subTest(mode=mode):
+				with hprof.parse(hprofdata(4), mode=mode) as hf:
+					fn(hf.heaps[0])
+
+	def test_graph(self):
+		def check(heap):
+			graph = build_graph(heap)
+			self.assertEqual(list(graph.ids), [0x50, 0x51, 0x9017, 0x0b1ec7])
+			# instances refer to their class, classes to their super class.
+			self.assertEqual(list(graph.offsets), [0, 2, 3, 4, 4])
+			self.assertEqual(list(graph.targets), [2, 1, 2, 3])
+			self.assertEqual(list(graph.sizes), [16, 16, 0, 0])
+			self.assertEqual(graph.classids, {heap[0x9017]: 0x9017, heap[0x0b1ec7]: 0x0b1ec7})
+			heap.resolve_references()
+			self.assertEqual(list(build_graph(heap).targets), [2, 1, 2, 3])
+		self.each_heap(check)
+
+	def test_dominators(self):
+		def check(heap):
+			heap._roots.append(0x03, 0x50, 1, 2)
+			heap._roots.append(0x03, 0x50, 1, 3) # duplicates don't matter
+			heap._roots.append(0x01, 0x666, 0, -1) # nor do missing objects
+			p50, p51, point, obj = heap[0x50], heap[0x51], heap[0x9017], heap[0x0b1ec7]
+			self.assertIsNone(heap.dominator(p50))
+			self.assertIs(heap.dominator(p51), p50)
+			self.assertIs(heap.dominator(point), p50)
+			self.assertIs(heap.dominator(obj), point)
+			self.assertIs(heap.dominator(hprof.cast(p51, obj)), p50)
+			self.assertEqual(heap.retained_size(p50), 32)
+			self.assertEqual(heap.retained_size(p51), 16)
+			self.assertEqual(heap.retained_size(point), 0)
+			self.assertEqual(heap.top_retainers(2), [(p50, 32), (p51, 16)])
+			self.assertEqual(len(heap.top_retainers()), 4)
+			del p50, p51, point, obj
+		self.each_heap(check)
+
+	def test_unreachable(self):
+		def check(heap):
+			p50 = heap[0x50]
+			self.assertIsNone(heap.dominator(p50))
+			self.assertEqual(heap.retained_size(p50), 0)
+			del p50
+		self.each_heap(check)
+
+	def test_joins_and_statics(self):
+		# two roots join at 0x51, 0x54 is garbage, and the Node class refers
+		# to an instance and a class through its static fields.
+		for mode in ('full', 'index'):
+			for idsize in (4, 8):
+				with self.subTest(mode=mode, idsize=idsize):
+					with hprof.parse(graphdump(idsize), mode=mode) as hf:
+						heap, = hf.heaps
+						graph = build_graph(heap)
+						self.assertEqual(list(graph.ids), [0x10, 0x11, 0x50, 0x51, 0x52, 0x53, 0x54])
+						self.assertEqual(list(graph.offsets), [0, 0, 3, 4, 6, 8, 10, 12])
+						self.assertEqual(list(graph.targets), [0, 2, 0, 1, 1, 2, 1, 3, 1, 3, 1, 2])
+						heap.resolve_references()
+						self.assertEqual(list(build_graph(heap).targets), list(graph.targets))
+						obj, node = heap[0x10], heap[0x11]
+						n50, n51, n53, n54 = heap[0x50], heap[0x51], heap[0x53], heap[0x54]
+						self.assertIsNone(heap.dominator(n51))
+						self.assertIsNone(heap.dominator(n50))
+						self.assertIsNone(heap.dominator(node))
+						self.assertIs(heap.dominator(obj), node)
+						self.assertEqual(heap.retained_size(n53), heap.shallow_size(n53))
+						self.assertTrue(heap.is_reachable(n50))
+						self.assertFalse(heap.is_reachable(n54))
+						self.assertIsNone(heap.dominator(n54))
+						self.assertEqual(heap.retained_size(n54), 0)
+						del heap, obj, node, n50, n51, n53, n54
+
+	def test_progress(self):
+		def check(heap):
+			heap._roots.append(0x03, 0x50, 1, 2)
+			calls = []
+			idom, retained = heap.compute_dominators(lambda *args: calls.append(args))
+			self.assertIs(heap.compute_dominators(), heap._dominators)
+			self.assertEqual(calls[0], ('building object graph', 0, 4))
+			self.assertIn(('building object graph', 4, 4), calls)
+			self.assertEqual(calls[-1], ('computing dominators', 3, 3))
+			self.assertEqual(list(idom), [-1, 0, 0, 2])
+			self.assertEqual(list(retained), [32, 16, 0, 0])
+		self.each_heap(check)
+
+	def test_not_in_heap(self):
+		def check(heap):
+			other = hprof.heap._create_class(heap.classtree, 'Other', None, {}, {})[1]
+			with self.assertRaises(KeyError):
+				heap.retained_size(other)
+			with self.assertRaises(KeyError):
+				heap.dominator(other(0x52))
+		self.each_heap(check)
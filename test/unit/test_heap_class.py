@@ -8,6 +8,9 @@ from unittest.mock import patch
 
 from .util import varyingid, HeapRecordTest
 
+class FakeClass(object):
+	pass
+
 @varyingid
 class TestHeapClass(HeapRecordTest):
 
@@ -40,7 +43,7 @@ class TestHeapClass(HeapRecordTest):
 		self.assertEqual(self.heap._instances[cls], [])
 
 	def test_minimal(self):
-		expected = object()
+		expected = FakeClass()
 		load = hprof._parsing.ClassLoad()
 		load.class_id = self.id(0x7e577e57)
 		load.class_name = 'java/lang/String'
@@ -75,7 +78,7 @@ class TestHeapClass(HeapRecordTest):
 		self.assertEqual(self.heap._instances[expected], [])
 
 	def test_small(self):
-		expected = object()
+		expected = FakeClass()
 		load = hprof._parsing.ClassLoad()
 		load.class_id = self.id(0x7e577e57)
 		load.class_name = 'java/lang/String'
@@ -122,6 +125,35 @@ class TestHeapClass(HeapRecordTest):
 		self.assertEqual(self.heap.classes['java.lang.String'], [expected])
 		self.assertEqual(self.heap._instances[expected], [])
 
+	def test_static_object_ref(self):
+		load = hprof._parsing.ClassLoad()
+		load.class_id = self.id(0x7e577e57)
+		load.class_name = 'java/lang/String'
+		self.hf.classloads_by_id[load.class_id] = load
+		self.hf.names[0xf00] = 'foo'
+
+		with patch('hprof.heap._create_class', return_value=('java.lang.String', FakeClass())) as mock:
+			self.doit(0x20, self.build()
+					.id(0x7e577e57) # class object id
+					.u4(0x123)      # stacktrace serial
+					.id(0)          # superclass id
+					.id(0x10ade2)   # loader id
+					.id(0x5151515)  # signer id
+					.id(0x5ec002e)  # protection domain id
+					.id(0x999999)   # reserved 1
+					.id(0xaaaaaa)   # reserved 2
+					.u4(0x40)       # instance size
+					.u2(0x0)        # constant pool size
+					.u2(0x1)        # static field count
+						.id(0xf00)  # field name
+						.u1(2)      # field type (object)
+						.id(0xbadf00d) # field value
+					.u2(0x0)        # instance field count
+			)
+		val = mock.call_args[0][3]['foo']
+		self.assertIs(type(val), hprof._heap_parsing.DeferredRef)
+		self.assertEqual(val, self.id(0xbadf00d))
+
 	def test_duplicate_class(self):
 		load = hprof._parsing.ClassLoad()
 		load.class_id = self.id(0x7e577e57)
@@ -157,8 +189,8 @@ class TestHeapClass(HeapRecordTest):
 			ct.java
 
 	def test_duplicate_classname(self):
-		expected1 = object()
-		expected2 = object()
+		expected1 = FakeClass()
+		expected2 = FakeClass()
 		load = hprof._parsing.ClassLoad()
 		load.class_id = self.id(0x7e577e57)
 		load.class_name = 'java/lang/String'
@@ -221,9 +253,9 @@ class TestHeapClass(HeapRecordTest):
 		load.class_name = 'java/util/ChainedList' # which is totally a real thing.
 		self.hf.classloads_by_id[load.class_id] = load
 
-		List = object()
-		LinkedList = object()
-		ChainedList = object()
+		List = FakeClass()
+		LinkedList = FakeClass()
+		ChainedList = FakeClass()
 		retvals = {
 			'java/util/List': ('java.util.List', List),
 			'java/util/LinkedList': ('java.util.LinkedList', LinkedList),
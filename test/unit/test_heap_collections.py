@@ -0,0 +1,262 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from .util import Builder, Dump
+
+# name -> (class id, super class id, ((field name, is a reference), ...))
+classes = {
+	'java/lang/Object': (0x10, 0, ()),
+	'java/util/HashMap': (0x11, 0x10, (('table', True), ('size', False))),
+	'java/util/LinkedHashMap': (0x12, 0x11, (('head', True),)),
+	'java/util/HashMap$Node': (0x13, 0x10, (('hash', False), ('key', True), ('value', True), ('next', True))),
+	'java/util/HashSet': (0x14, 0x10, (('map', True),)),
+	'java/util/ArrayList': (0x15, 0x10, (('size', False), ('elementData', True))),
+	'java/util/concurrent/ConcurrentHashMap': (0x16, 0x10, (('table', True),)),
+	'java/util/concurrent/ConcurrentHashMap$Node': (0x17, 0x10, (('hash', False), ('key', True), ('val', True), ('next', True))),
+	'java/util/concurrent/ConcurrentHashMap$TreeBin': (0x18, 0x17, (('first', True),)),
+	'java/util/concurrent/ConcurrentHashMap$ForwardingNode': (0x19, 0x17, (('nextTable', True),)),
+	'[Ljava/lang/Object;': (0x1a, 0x10, ()),
+	'com/example/Thing': (0x1b, 0x10, ()),
+	'com/example/NullKeyMap': (0x1c, 0x11, (('entryForNullKey', True),)), # like old Android HashMaps
+}
+
+instances = (
+	(0x100, 'java/util/HashMap', {'table': 0x200, 'size': 3}),
+	(0x300, 'java/util/HashMap$Node', {'key': 0x80, 'value': 0x81, 'next': 0x301}),
+	(0x301, 'java/util/HashMap$Node', {'key': 0x82}),
+	(0x302, 'java/util/HashMap$Node', {'value': 0x83}),
+	(0x101, 'java/util/LinkedHashMap', {}),
+	(0x102, 'java/util/HashSet', {'map': 0x103}),
+	(0x103, 'java/util/HashMap', {'table': 0x201, 'size': 1}),
+	(0x303, 'java/util/HashMap$Node', {'key': 0x84, 'value': 0x85}),
+	(0x104, 'java/util/ArrayList', {'elementData': 0x202, 'size': 3}),
+	(0x105, 'java/util/concurrent/ConcurrentHashMap', {'table': 0x203}),
+	(0x310, 'java/util/concurrent/ConcurrentHashMap$Node', {'key': 0x88, 'val': 0x89}),
+	(0x311, 'java/util/concurrent/ConcurrentHashMap$TreeBin', {'hash': -2, 'first': 0x313}),
+	(0x312, 'java/util/concurrent/ConcurrentHashMap$ForwardingNode', {'hash': -1, 'nextTable': 0x204}),
+	(0x313, 'java/util/concurrent/ConcurrentHashMap$Node', {'key': 0x8a, 'val': 0x8b, 'next': 0x314}),
+	(0x314, 'java/util/concurrent/ConcurrentHashMap$Node', {'key': 0x8c, 'val': 0x8d}),
+	(0x315, 'java/util/concurrent/ConcurrentHashMap$Node', {'key': 0x8e, 'val': 0x8f}),
+	(0x316, 'java/util/concurrent/ConcurrentHashMap$Node', {'key': 0x90, 'val': 0x91}),
+	(0x106, 'java/util/HashSet', {}),
+	(0x107, 'com/example/NullKeyMap', {'table': 0x205, 'size': 2, 'entryForNullKey': 0x305}),
+	(0x304, 'java/util/HashMap$Node', {'key': 0x80, 'value': 0x81}),
+	(0x305, 'java/util/HashMap$Node', {'value': 0x83}),
+) + tuple((objid, 'com/example/Thing', {}) for objid in range(0x80, 0x92))
+
+objarrays = (
+	(0x200, (0x300, 0, 0x302, 0)),
+	(0x201, (0x303, 0)),
+	(0x202, (0x86, 0, 0x87, 0, 0)),
+	(0x203, (0x310, 0x311, 0x312, 0)),
+	(0x204, (0, 0, 0x315, 0, 0, 0, 0x316, 0)), # the bin at 2 was split into 2 and 6
+	(0x205, (0, 0x304)),
+)
+
+def collectiondump(idsize):
+	names = list(classes)
+	fieldnames = sorted(set(name for clsid, superid, fields in classes.values() for name, isref in fields))
+	out = Dump(idsize).names(names + fieldnames, 0x1000).stack_trace()
+	out.loads((classes[name][0] for name in names), 0x1000)
+
+	byid = {clsid: fields for clsid, superid, fields in classes.values()}
+	supers = {clsid: superid for clsid, superid, fields in classes.values()}
+	def allfields(clsid):
+		out = []
+		while clsid:
+			out.extend(byid[clsid])
+			clsid = supers[clsid]
+		return out
+	def size(fields):
+		return sum(idsize if isref else 4 for name, isref in fields)
+
+	heap = Builder(idsize)
+	for clsid, superid, fields in classes.values():
+		fieldtypes = [(0x1000 + len(names) + fieldnames.index(name), 2 if isref else 10) for name, isref in fields]
+		heap.class_dump(clsid, superid, size(allfields(clsid)), fieldtypes)
+	for objid, clsname, vals in instances:
+		body = Builder(idsize)
+		for name, isref in allfields(classes[clsname][0]):
+			if isref:
+				body.id(vals.get(name, 0))
+			else:
+				body.i4(vals.get(name, 0))
+		heap.instance(objid, classes[clsname][0], body)
+	for objid, elems in objarrays:
+		heap.object_array(objid, 0x1a, elems)
+	return out.heap(heap).end()
+
+def objid(obj):
+	if obj is None:
+		return None
+	return hprof.heap.JavaObject._hprof_id.__get__(obj)
+
+class TestCollections(unittest.TestCase):
+	def each_heap(self, fn):
+		for mode in ('full', 'index'):
+			for idsize in (4, 8):
+				with self.subTest(mode=mode, idsize=idsize):
+					with hprof.parse(collectiondump(idsize), mode=mode) as hf:
+						fn(hf.heaps[0], idsize)
+
+	def entries(self, view):
+		if view.kind == 'map':
+			return [(objid(k), objid(v)) for k, v in view]
+		return [objid(elem) for elem in view]
+
+	def test_hashmap(self):
+		def check(heap, idsize):
+			view = heap.collection_view(heap[0x100])
+			self.assertEqual(view.kind, 'map')
+			self.assertEqual(self.entries(view), [(0x80, 0x81), (0x82, None), (None, 0x83)])
+			self.assertEqual((len(view), view.capacity, view.empty_slots), (3, 4, 2))
+			self.assertEqual(view.fill_ratio, 0.75)
+			self.assertEqual(view.wasted_bytes, 2 * idsize)
+			self.assertIs(view.collection, heap[0x100])
+			self.assertEqual(self.entries(view), [(0x80, 0x81), (0x82, None), (None, 0x83)]) # again
+			obj, = heap.classes['java.lang.Object']
+			self.assertEqual(len(heap.collection_view(hprof.cast(heap[0x100], obj))), 3)
+		self.each_heap(check)
+
+	def test_null_key_entry(self):
+		def check(heap, idsize):
+			view = heap.collection_view(heap[0x107])
+			self.assertEqual(self.entries(view), [(None, 0x83), (0x80, 0x81)])
+			self.assertEqual((len(view), view.capacity, view.empty_slots), (2, 2, 1))
+		self.each_heap(check)
+
+	def test_repr(self):
+		def check(heap, idsize):
+			view = heap.collection_view(heap[0x104])
+			self.assertEqual(repr(view), '<CollectionView of %r size=3 capacity=5>' % (heap[0x104],))
+		self.each_heap(check)
+
+	def test_empty_subclass(self):
+		def check(heap, idsize):
+			view = heap.collection_view(heap[0x101])
+			self.assertEqual((view.kind, len(view), view.capacity, view.fill_ratio, view.wasted_bytes), ('map', 0, 0, None, 0))
+			self.assertEqual(list(view), [])
+		self.each_heap(check)
+
+	def test_hashset(self):
+		def check(heap, idsize):
+			view = heap.collection_view(heap[0x102])
+			self.assertEqual(view.kind, 'set')
+			self.assertEqual(self.entries(view), [0x84])
+			self.assertEqual((len(view), view.capacity, view.empty_slots), (1, 2, 1))
+			view = heap.collection_view(heap[0x106]) # no map
+			self.assertEqual((view.kind, len(view), view.capacity, list(view)), ('set', 0, 0, []))
+		self.each_heap(check)
+
+	def test_arraylist(self):
+		def check(heap, idsize):
+			view = heap.collection_view(heap[0x104])
+			self.assertEqual(view.kind, 'list')
+			self.assertEqual(self.entries(view), [0x86, None, 0x87])
+			self.assertEqual((len(view), view.capacity, view.empty_slots), (3, 5, 2))
+			self.assertEqual(view.fill_ratio, 0.6)
+		self.each_heap(check)
+
+	def test_concurrent_hashmap(self):
+		def check(heap, idsize):
+			view = heap.collection_view(heap[0x105])
+			self.assertEqual(view.kind, 'map')
+			self.assertEqual(self.entries(view), [(0x88, 0x89), (0x8a, 0x8b), (0x8c, 0x8d), (0x8e, 0x8f), (0x90, 0x91)])
+			self.assertEqual((len(view), view.capacity, view.empty_slots), (5, 4, 1))
+		self.each_heap(check)
+
+	def test_forwarding_to_smaller_table(self):
+		def check(heap, idsize):
+			heap.resolve_references()
+			node = heap[0x312]
+			vals = list(hprof.heap.JavaObject._hprof_ifieldvals.__get__(node))
+			vals[0] = heap[0x201] # nextTable; only two bins
+			hprof.heap.JavaObject._hprof_ifieldvals.__set__(node, tuple(vals))
+			with self.assertRaisesRegex(hprof.error.FormatError, 'ForwardingNode'):
+				list(heap.collection_view(heap[0x105]))
+			del node
+		self.each_heap(check)
+
+	def test_resolved(self):
+		def check(heap, idsize):
+			heap.resolve_references()
+			self.assertEqual(self.entries(heap.collection_view(heap[0x100])), [(0x80, 0x81), (0x82, None), (None, 0x83)])
+			self.assertEqual(self.entries(heap.collection_view(heap[0x102])), [0x84])
+			self.assertEqual(self.entries(heap.collection_view(heap[0x104])), [0x86, None, 0x87])
+			self.assertEqual(len(heap.collection_view(heap[0x105])), 5)
+			self.assertEqual(heap.collection_view(heap[0x100]).empty_slots, 2)
+		self.each_heap(check)
+
+	def test_not_a_collection(self):
+		def check(heap, idsize):
+			for obj in (heap[0x80], heap[0x200], heap.classes['java.util.HashMap'][0]):
+				with self.assertRaisesRegex(TypeError, 'not a supported collection'):
+					heap.collection_view(obj)
+		self.each_heap(check)
+
+	def test_by_id(self):
+		def check(heap, idsize):
+			self.assertEqual(self.entries(heap.collection_view(0x100)), [(0x80, 0x81), (0x82, None), (None, 0x83)])
+			with self.assertRaisesRegex(TypeError, 'not an instance'):
+				heap.collection_view(0x200)
+			with self.assertRaises(hprof.error.MissingObject):
+				heap.collection_view(0xbad)
+		self.each_heap(check)
+
+	def set_field(self, obj, ix, value):
+		vals = list(hprof.heap.JavaObject._hprof_ifieldvals.__get__(obj))
+		vals[ix] = value
+		hprof.heap.JavaObject._hprof_ifieldvals.__set__(obj, tuple(vals))
+
+	def test_bad_table(self):
+		def check(heap, idsize):
+			hashmap = heap[0x100]
+			self.set_field(hashmap, 0, 0x80) # table; not an array
+			with self.assertRaisesRegex(TypeError, 'not an object array'):
+				heap.collection_view(hashmap)
+			self.set_field(hashmap, 0, 0xbad)
+			with self.assertRaises(hprof.error.MissingObject):
+				heap.collection_view(hashmap)
+			del hashmap
+		self.each_heap(check)
+
+	def test_missing_field(self):
+		def check(heap, idsize):
+			reader = hprof._collections._Reader(heap)
+			cls, vals = heap._field_values(heap[0x80])
+			self.assertIsNone(reader.get(cls, vals, 'size', None))
+			with self.assertRaisesRegex(hprof.error.FormatError, 'com.example.Thing has no size field'):
+				reader.get(cls, vals, 'size')
+		self.each_heap(check)
+
+	def test_cast_references(self):
+		def check(heap, idsize):
+			heap.resolve_references()
+			obj, = heap.classes['java.lang.Object']
+			hashmap = heap[0x100]
+			self.set_field(hashmap, 0, hprof.cast(heap[0x200], obj)) # table
+			self.set_field(heap[0x300], 3, hprof.cast(heap[0x301], obj)) # next
+			self.assertEqual(self.entries(heap.collection_view(hashmap)), [(0x80, 0x81), (0x82, None), (None, 0x83)])
+			del hashmap
+		self.each_heap(check)
+
+	def test_report(self):
+		def check(heap, idsize):
+			report = heap.collections_report()
+			rows = {objid(row[0]): row[1:] for row in report}
+			self.assertEqual(rows, {
+				0x100: (3, 4, 0.75, 2 * idsize),
+				0x101: (0, 0, None, 0),
+				0x102: (1, 2, 0.5, idsize),
+				0x103: (1, 2, 0.5, idsize),
+				0x104: (3, 5, 0.6, 2 * idsize),
+				0x105: (5, 4, 1.25, idsize),
+				0x106: (0, 0, None, 0),
+				0x107: (2, 2, 1.0, idsize),
+			})
+			wasted = [row[4] for row in report]
+			self.assertEqual(wasted, sorted(wasted, reverse=True))
+		self.each_heap(check)
@@ -0,0 +1,110 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from unittest.mock import patch
+
+from .util import Builder, Dump, stringdump
+
+jdk8 = (('value', hprof.jtype.object), ('hash', hprof.jtype.int))
+jdk6 = (('value', hprof.jtype.object), ('offset', hprof.jtype.int), ('count', hprof.jtype.int), ('hash', hprof.jtype.int))
+
+C = hprof.jtype.char
+arrays = (
+	(0x60, C, 'ab'.encode('utf-16-be')),
+	(0x61, C, 'ab'.encode('utf-16-be')),
+	(0x62, C, 'ac'.encode('utf-16-be')),
+	(0x63, hprof.jtype.byte, b'\0a\0b'), # same bytes, other type
+	(0x64, C, 'ab'.encode('utf-16-be')),
+	(0x65, hprof.jtype.int, b''),
+	(0x66, hprof.jtype.int, b''),
+	(0x67, hprof.jtype.byte, b''),
+	(0x68, C, 'abab'.encode('utf-16-be')),
+)
+
+class TestDuplicates(unittest.TestCase):
+	def each_heap(self, fields, instances, fn):
+		for mode in ('full', 'index'):
+			for idsize in (4, 8):
+				with self.subTest(mode=mode, idsize=idsize):
+					with hprof.parse(stringdump(idsize, fields, instances, arrays), mode=mode) as hf:
+						fn(hf.heaps[0], idsize)
+
+	def test_arrays(self):
+		def check(heap, idsize):
+			groups = [(t, n, list(ids), wasted) for t, n, ids, wasted in heap.duplicate_arrays()]
+			self.assertEqual(groups, [
+				(C, 2, [0x60, 0x61, 0x64], 2 * (16 if idsize == 4 else 24)),
+				(hprof.jtype.int, 0, [0x65, 0x66], 16 if idsize == 4 else 24),
+			])
+		self.each_heap(jdk8, (), check)
+
+	def test_hash_collisions(self):
+		# every array gets the same hash; only equal contents are grouped.
+		def check(heap, idsize):
+			with patch('hprof.heap._hashlib.blake2b') as blake2b:
+				blake2b.return_value.digest.return_value = b'collision'
+				arrays = [(t, n, list(ids)) for t, n, ids, wasted in heap.duplicate_arrays()]
+				strings = [(value, list(ids)) for value, ids, wasted in heap.duplicate_strings()]
+			self.assertEqual(arrays, [
+				(C, 2, [0x60, 0x61, 0x64]),
+				(hprof.jtype.int, 0, [0x65, 0x66]),
+			])
+			self.assertEqual(strings, [('ab', [0x50, 0x51])])
+		self.each_heap(jdk8, ((0x50, (0x60, 0)), (0x51, (0x61, 0)), (0x52, (0x62, 0))), check)
+
+	def test_object_arrays(self):
+		# only primitive arrays are compared.
+		for mode in ('full', 'index'):
+			for idsize in (4, 8):
+				with self.subTest(mode=mode, idsize=idsize):
+					heap = Builder(idsize).class_dump(0x10, 0, 0, ()).class_dump(0x11, 0x10, 0, ())
+					heap.object_array(0x60, 0x11, (0x60, 0)).object_array(0x61, 0x11, (0x60, 0))
+					data = Dump(idsize).names(('java/lang/Object', '[Ljava/lang/Object;')).stack_trace()
+					data.loads((0x10, 0x11)).heap(heap).end()
+					with hprof.parse(data, mode=mode) as hf:
+						self.assertEqual(hf.heaps[0].duplicate_arrays(), [])
+
+	def test_resolved_arrays(self):
+		def check(heap, idsize):
+			heap.resolve_references()
+			self.assertEqual(len(heap.duplicate_arrays()), 2)
+		self.each_heap(jdk8, (), check)
+
+	def test_strings(self):
+		instances = (
+			(0x50, (0x60, 0)),
+			(0x51, (0x61, 0)),
+			(0x52, (0x60, 0)), # shares its array with 0x50
+			(0x53, (0x62, 0)),
+			(0x54, (0, 0)),
+			(0x55, (0x67, 0)),
+		)
+		def check(heap, idsize):
+			groups = [(value, list(ids), wasted) for value, ids, wasted in heap.duplicate_strings()]
+			strsize = 8 if idsize == 4 else 16
+			arrsize = 16 if idsize == 4 else 24
+			self.assertEqual(groups, [('ab', [0x50, 0x51, 0x52], 2 * strsize + arrsize)])
+		self.each_heap(jdk8, instances, check)
+
+	def test_shared_strings(self):
+		# old JDKs share arrays between strings, using offset and count.
+		instances = (
+			(0x50, (0x68, 0, 2, 0)),
+			(0x51, (0x68, 2, 2, 0)),
+			(0x52, (0x60, 0, 2, 0)),
+			(0x53, (0x68, 1, 2, 0)),
+		)
+		def check(heap, idsize):
+			groups = [(value, list(ids), wasted) for value, ids, wasted in heap.duplicate_strings()]
+			strsize = 8 if idsize == 4 else 16
+			arrsize = 16 if idsize == 4 else 24
+			self.assertEqual(groups, [('ab', [0x50, 0x51, 0x52], 2 * strsize + arrsize)])
+		self.each_heap(jdk6, instances, check)
+
+	def test_none(self):
+		def check(heap, idsize):
+			self.assertEqual(heap.duplicate_strings(), [])
+		self.each_heap(jdk8, ((0x50, (0x60, 0)), (0x51, (0x62, 0))), check)
@@ -0,0 +1,287 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from hprof._index import ObjectIndex, ObjectTable
+
+from .util import hprofdata, varyingid, HeapRecordTest
+
+class TestObjectTable(unittest.TestCase):
+	def test_sorted_input(self):
+		t = ObjectTable()
+		t.append(10, 1, 0x21, 100, 5)
+		t.append(20, 2, 0x22, 200, 6)
+		t.finish()
+		self.assertEqual(len(t), 2)
+		self.assertEqual(t.find(10), 0)
+		self.assertEqual(t.find(20), 1)
+
+	def test_unsorted_input(self):
+		t = ObjectTable()
+		t.append(30, 3, 0x23, 300, 7)
+		t.append(10, 1, 0x21, 100, 5)
+		t.append(20, 2, 0x22, 200, 6)
+		t.finish()
+		self.assertEqual(list(t.ids),     [10, 20, 30])
+		self.assertEqual(list(t.clsids),  [1, 2, 3])
+		self.assertEqual(list(t.kinds),   [0x21, 0x22, 0x23])
+		self.assertEqual(list(t.offsets), [100, 200, 300])
+		self.assertEqual(list(t.lengths), [5, 6, 7])
+		self.assertEqual(t.find(30), 2)
+
+	def test_find_missing(self):
+		t = ObjectTable()
+		t.append(10, 1, 0x21, 100, 5)
+		t.append(20, 2, 0x22, 200, 6)
+		t.finish()
+		for objid in (0, 15, 25):
+			with self.subTest(objid=objid):
+				with self.assertRaises(KeyError):
+					t.find(objid)
+
+	def test_find_unfinished(self):
+		t = ObjectTable()
+		t.append(10, 1, 0x21, 100, 5)
+		with self.assertRaises(KeyError):
+			t.find(10)
+
+
+class TestObjectIndex(unittest.TestCase):
+	def test_sorted_input(self):
+		ix = ObjectIndex()
+		ix.add(10, 'a')
+		ix.add(20, 'b')
+		self.assertTrue(ix._sorted)
+		self.assertEqual(len(ix), 2)
+		self.assertEqual(ix.find(10), 'a')
+		self.assertEqual(ix.find(20), 'b')
+
+	def test_few_runs(self):
+		ix = ObjectIndex()
+		for objid in (10, 40, 50, 20, 30, 60, 5):
+			ix.add(objid, str(objid))
+		self.assertFalse(ix._sorted)
+		self.assertEqual(ix.find(30), '30')
+		self.assertTrue(ix._sorted)
+		self.assertEqual(list(ix.ids), [5, 10, 20, 30, 40, 50, 60])
+		self.assertEqual(ix.objs, ['5', '10', '20', '30', '40', '50', '60'])
+
+	def test_many_runs(self):
+		ix = ObjectIndex()
+		objids = [(i * 7919) % 1000 for i in range(1000)]
+		for objid in objids:
+			ix.add(objid, -objid)
+		self.assertEqual(ix.find(999), -999)
+		self.assertEqual(list(ix.ids), list(range(1000)))
+		self.assertEqual(ix.objs, [-i for i in range(1000)])
+
+	def test_missing(self):
+		ix = ObjectIndex()
+		ix.add(20, 'b')
+		ix.add(10, 'a')
+		for objid in (0, 15, 25):
+			with self.subTest(objid=objid):
+				with self.assertRaises(KeyError):
+					ix.find(objid)
+				self.assertNotIn(objid, ix)
+		self.assertIn(10, ix)
+
+
+class TestHeapMapping(unittest.TestCase):
+	def test_full_mode(self):
+		with hprof.parse(hprofdata(4)) as hf:
+			heap, = hf.heaps
+			self.assertEqual(dict.__len__(heap), 2) # only the classes
+			self.assertEqual(len(heap._objects), 2)
+			self.assertEqual(len(heap), 4)
+			self.assertCountEqual(heap, (0x0b1ec7, 0x9017, 0x50, 0x51))
+			self.assertCountEqual(heap.keys(), (0x0b1ec7, 0x9017, 0x50, 0x51))
+			self.assertCountEqual((o._hprof_id for o in heap.values() if 'Point' in str(type(o))), (0x50, 0x51))
+			items = dict(heap.items())
+			self.assertEqual(len(items), 4)
+			self.assertIs(items[0x50], heap[0x50])
+			self.assertIs(heap.get(0x51), heap[0x51])
+			self.assertIsNone(heap.get(0x52))
+			self.assertIn(0x50, heap)
+			self.assertIn(0x9017, heap)
+			self.assertNotIn(0x52, heap)
+			with self.assertRaises(KeyError):
+				heap[0x52]
+			self.check_views(heap)
+
+	def check_views(self, heap):
+		ids = (0x0b1ec7, 0x9017, 0x50, 0x51)
+		keys, values, items = heap.keys(), heap.values(), heap.items()
+		self.assertEqual((len(keys), len(values), len(items)), (4, 4, 4))
+		for view in (keys, values, items):
+			self.assertEqual(list(view), list(view)) # again
+		self.assertCountEqual(keys, ids)
+		self.assertEqual(set(keys) & {0x50, 0x52}, {0x50})
+		self.assertEqual(keys - {0x50, 0x51}, {0x0b1ec7, 0x9017})
+		self.assertIn(0x51, keys)
+		self.assertNotIn(0x52, keys)
+		self.assertIn(heap[0x50], values)
+		self.assertIn((0x50, heap[0x50]), items)
+		self.assertNotIn((0x50, heap[0x51]), items)
+		self.assertNotIn((0x52, None), items)
+		self.assertCountEqual((k for k, v in items), ids)
+
+	def test_index_mode(self):
+		with hprof.parse(hprofdata(4), mode='index') as hf:
+			heap, = hf.heaps
+			self.assertEqual(len(heap), 4)
+			self.assertCountEqual(heap, (0x0b1ec7, 0x9017, 0x50, 0x51))
+			self.assertEqual(len(list(heap.values())), 4)
+			self.assertEqual(dict.__len__(heap), 4) # values() created everything
+			items = dict(heap.items())
+			self.assertIs(items[0x50], heap[0x50])
+			self.assertIs(items[0x9017], heap[0x9017])
+			del items
+		with hprof.parse(hprofdata(4), mode='index') as hf:
+			heap, = hf.heaps
+			self.check_views(heap)
+			self.assertEqual(dict.__len__(heap), 4)
+
+
+@varyingid
+class TestIndexedHeap(HeapRecordTest):
+	def setUp(self):
+		super().setUp()
+		self.heap._table = ObjectTable()
+		for clsid, name in (
+				(0x0c1a55, 'java/lang/Class'),
+				(0x9017, 'com/example/Point'),
+				(0x1a77, '[I'),
+				(0x0a77, '[Ljava/lang/Object;')):
+			load = hprof._parsing.ClassLoad()
+			load.class_id = self.id(clsid)
+			load.class_name = name
+			self.hf.classloads_by_id[load.class_id] = load
+		self.hf.names[0xf00] = 'x'
+		self.hf.names[0xf01] = 'next'
+		self.hf.names[0xf02] = 'origin'
+
+	def cls(self, data, objid, superid, statics=(), fields=()):
+		return data.class_dump(objid, superid, 0, fields, statics)
+
+	def point(self, data, objid, x, nxt):
+		return data.instance(objid, 0x9017, self.build().i4(x).id(nxt))
+
+	def build_heap(self, with_intarray=True):
+		data = self.build()
+		self.cls(data, 0x0b1ec7, 0)
+		self.cls(data, 0x0c1a55, 0x0b1ec7)
+		self.cls(data, 0x9017, 0x0b1ec7, statics=((0xf02, 2, 0x50),), fields=((0xf00, 10), (0xf01, 2)))
+		if with_intarray:
+			self.cls(data, 0x1a77, 0x0b1ec7)
+		self.cls(data, 0x0a77, 0x0b1ec7)
+		self.point(data, 0x52, 7, 0x50)
+		self.point(data, 0x50, 0, 0)
+		self.point(data, 0x51, -1, 0x666)
+		data.object_array(0x60, 0x0a77, (0x50, 0, 0x52))
+		data.primitive_array(0x70, hprof.jtype.int, self.build().u4(1).u4(2).u4(3))
+		self.data = data
+		reader = hprof._parsing.PrimitiveReader(memoryview(data), self.idsize, 1000)
+		hprof._heap_parsing.parse_heap(self.hf, self.heap, reader, None)
+		self.assertEqual(len(self.heap.classes), 0) # not parsed until the scan is finished
+		filedata = memoryview(bytes(1000) + data)
+		hprof._heap_parsing.finish_scan(self.hf, self.heap, filedata, self.idsize)
+		hprof._heap_parsing.finish_index(self.heap, filedata, self.idsize)
+
+	def test_table(self):
+		self.build_heap()
+		table = self.heap._table
+		ids = [self.id(x) for x in (0x50, 0x51, 0x52, 0x60, 0x70, 0x0a77, 0x1a77, 0x9017, 0x0b1ec7, 0x0c1a55)]
+		self.assertCountEqual(table.ids, ids)
+		self.assertEqual(list(table.ids), sorted(table.ids))
+		kinds = dict(zip(table.ids, table.kinds))
+		self.assertEqual(kinds[self.id(0x50)], 0x21)
+		self.assertEqual(kinds[self.id(0x60)], 0x22)
+		self.assertEqual(kinds[self.id(0x70)], 0x23)
+		self.assertEqual(kinds[self.id(0x9017)], 0x20)
+		clsids = dict(zip(table.ids, table.clsids))
+		self.assertEqual(clsids[self.id(0x50)], self.id(0x9017))
+		self.assertEqual(clsids[self.id(0x60)], self.id(0x0a77))
+		self.assertEqual(clsids[self.id(0x70)], self.id(0x1a77))
+		row = table.find(self.id(0x70))
+		offset = table.offsets[row] - 1000
+		self.assertEqual(self.data[offset - 1], 0x23)
+		self.assertEqual(table.lengths[row], self.idsize + 4 + 4 + 1 + 12)
+
+	def test_lazy_creation(self):
+		self.build_heap()
+		self.assertEqual(len(self.heap), 10)
+		self.assertEqual(dict.__len__(self.heap), 5) # only the classes
+		self.assertIn(self.id(0x52), self.heap)
+		self.assertNotIn(self.id(0x53), self.heap)
+		self.assertEqual(dict.__len__(self.heap), 5)
+		p = self.heap[self.id(0x52)]
+		self.assertEqual(dict.__len__(self.heap), 6)
+		self.assertIs(self.heap[self.id(0x52)], p)
+		with self.assertRaises(KeyError):
+			self.heap[self.id(0x53)]
+
+	def test_instance(self):
+		self.build_heap()
+		p = self.heap[self.id(0x52)]
+		self.assertEqual(p._hprof_id, self.id(0x52))
+		self.assertIsInstance(p, self.heap.classes['com.example.Point'][0])
+		self.assertEqual(p.x, 7)
+		self.assertIs(p.next, self.heap[self.id(0x50)])
+		self.assertIs(p.next, p.next)
+		self.assertIsNone(p.next.next)
+
+	def test_missing_reference(self):
+		self.build_heap()
+		p = self.heap[self.id(0x51)]
+		self.assertEqual(p.x, -1)
+		with self.assertRaisesRegex(hprof.error.MissingObject, hex(self.id(0x666))):
+			p.next
+
+	def test_static_reference(self):
+		self.build_heap()
+		cls, = self.heap.classes['com.example.Point']
+		origin = self.heap[self.id(0x50)]
+		self.assertIs(cls.origin, origin)
+		self.assertIs(self.heap[self.id(0x52)].origin, origin)
+
+	def test_object_array(self):
+		self.build_heap()
+		arr = self.heap[self.id(0x60)]
+		self.assertEqual(len(arr), 3)
+		self.assertIs(arr[0], self.heap[self.id(0x50)])
+		self.assertIsNone(arr[1])
+		self.assertIs(arr[2], self.heap[self.id(0x52)])
+		self.assertEqual(arr[1:], (None, self.heap[self.id(0x52)]))
+
+	def test_primitive_array(self):
+		self.build_heap()
+		arr = self.heap[self.id(0x70)]
+		self.assertIsInstance(arr, self.heap.classes['int[]'][0])
+		self.assertEqual(len(arr), 3)
+		self.assertEqual(list(arr), [1, 2, 3])
+
+	def test_missing_primitive_array_class(self):
+		with self.assertRaisesRegex(hprof.error.FormatError, r'int\[\]'):
+			self.build_heap(with_intarray=False)
+
+	def test_instances(self):
+		self.build_heap()
+		ids = lambda objs: sorted(o._hprof_id for o in objs)
+		self.assertEqual(ids(self.heap.exact_instances('com.example.Point')),
+				[self.id(x) for x in (0x50, 0x51, 0x52)])
+		self.assertEqual(ids(self.heap.exact_instances('int[]')), [self.id(0x70)])
+		self.assertEqual(ids(self.heap.exact_instances('java.lang.Object[]')), [self.id(0x60)])
+		self.assertEqual(ids(self.heap.exact_instances('java.lang.Object')), [])
+		self.assertEqual(len(list(self.heap.all_instances('java.lang.Object'))), 10)
+		self.assertEqual(self.heap.instance_count('java.lang.Object'), 10)
+		self.assertEqual(self.heap.instance_count('com.example.Point', subclasses=False), 3)
+
+	def test_unknown_kind(self):
+		self.build_heap()
+		table = self.heap._table
+		row = table.find(self.id(0x9017))
+		with self.assertRaisesRegex(hprof.error.FormatError, 'record kind 0x20'):
+			hprof._heap_parsing.materialize(self.heap, row)
@@ -18,8 +18,15 @@ class TestObjectArray(HeapRecordTest):
 				.u4(0x0)      # length
 				.id(0x1010)   # class id
 		)
-		expected = [(self.id(0x0b1ec7), 0x57acc, self.id(0x1010), ())]
-		self.assertEqual(self.heap._deferred_objarrays, expected)
+		self.assertEqual(len(self.heap._deferred_objarrays), 1)
+		objid, strace, clsid, elems = self.heap._deferred_objarrays[0]
+		self.assertEqual(objid, self.id(0x0b1ec7))
+		self.assertEqual(strace, 0x57acc)
+		self.assertEqual(clsid, self.id(0x1010))
+		self.assertIs(type(elems), hprof.heap._DeferredArrayData)
+		self.assertIs(elems.jtype, hprof.jtype.object)
+		self.assertEqual(elems.bytes, b'')
+		self.assertEqual(tuple(elems.toarray()), ())
 
 	def test_small(self):
 		self.doit(0x22, self.build()
@@ -29,8 +36,15 @@ class TestObjectArray(HeapRecordTest):
 				.id(0x1010)   # class id
 				.id(0xf00baa) # element 0
 		)
-		expected = [(self.id(0x0b1ec7), 0x57acc, self.id(0x1010), (self.id(0xf00baa),))]
-		self.assertEqual(self.heap._deferred_objarrays, expected)
+		self.assertEqual(len(self.heap._deferred_objarrays), 1)
+		objid, strace, clsid, elems = self.heap._deferred_objarrays[0]
+		self.assertEqual(objid, self.id(0x0b1ec7))
+		self.assertEqual(strace, 0x57acc)
+		self.assertEqual(clsid, self.id(0x1010))
+		self.assertIs(type(elems), hprof.heap._DeferredArrayData)
+		self.assertIs(elems.jtype, hprof.jtype.object)
+		self.assertEqual(elems.bytes, self.build().id(0xf00baa))
+		self.assertEqual(tuple(elems.toarray()), (self.id(0xf00baa),))
 
 	def test_multi(self):
 		self.heap._deferred_objarrays.append('hello')
@@ -45,18 +59,28 @@ class TestObjectArray(HeapRecordTest):
 				.id(0xf00baa) # element 2
 				.id(0xbaaf00) # element 3
 		)
-		expected = [
-				'hello',
-				'world',
-				(self.id(0x0b1ec7), 0x57acc, self.id(0x1010), (self.id(0xbaabaa),self.id(0xf00f00),self.id(0xf00baa),self.id(0xbaaf00)))
-		]
-		self.assertEqual(self.heap._deferred_objarrays, expected)
+		self.assertEqual(len(self.heap._deferred_objarrays), 3)
+		self.assertEqual(self.heap._deferred_objarrays[0], 'hello')
+		self.assertEqual(self.heap._deferred_objarrays[1], 'world')
+		objid, strace, clsid, elems = self.heap._deferred_objarrays[2]
+		self.assertEqual(objid, self.id(0x0b1ec7))
+		self.assertEqual(strace, 0x57acc)
+		self.assertEqual(clsid, self.id(0x1010))
+		self.assertIs(type(elems), hprof.heap._DeferredArrayData)
+		self.assertIs(elems.jtype, hprof.jtype.object)
+		self.assertEqual(tuple(elems.toarray()),
+				(self.id(0xbaabaa),self.id(0xf00f00),self.id(0xf00baa),self.id(0xbaaf00)))
 
 	def test_create_objarrays(self):
+		def elems(*ids):
+			data = self.build()
+			for objid in ids:
+				data.id(objid)
+			return hprof.heap._DeferredArrayData(hprof.jtype.object, bytes(data), self.idsize)
 		fakes = (
-			(99, 55, 10, (11,12,13)),
-			(79, 45, 11, (22,21,20)),
-			(78, 55, 10, (12,13,14,15)),
+			(99, 55, 10, elems(11,12,13)),
+			(79, 45, 11, elems(22,21,20)),
+			(78, 55, 10, elems(12,13,14,15)),
 		)
 		out1 = MagicMock()
 		out2 = MagicMock()
@@ -66,6 +90,8 @@ class TestObjectArray(HeapRecordTest):
 		self.heap._deferred_objarrays.extend(fakes)
 		self.heap._instances[cls1] = []
 		self.heap._instances[cls2] = []
+		self.heap._array_nbytes[cls1] = []
+		self.heap._array_nbytes[cls2] = []
 		progress = MagicMock()
 
 		hprof._heap_parsing.create_objarrays(self.heap, progress)
@@ -78,21 +104,24 @@ class TestObjectArray(HeapRecordTest):
 		self.assertEqual(cls1.call_args_list[0][1], {})
 		self.assertIn(99, self.heap)
 		self.assertIs(self.heap[99], out1)
-		self.assertIs(self.heap[99]._hprof_array_data, fakes[0][3])
+		self.assertIs(self.heap[99]._hprof_array_data.ids, fakes[0][3])
+		self.assertIs(self.heap[99]._hprof_array_data.heap, self.heap)
 
 		self.assertEqual(cls1.call_args_list[1][0], (78,))
 		self.assertEqual(cls1.call_args_list[1][1], {})
 		self.assertIn(78, self.heap)
 		self.assertIs(self.heap[78], out2)
-		self.assertIs(self.heap[78]._hprof_array_data, fakes[2][3])
+		self.assertIs(self.heap[78]._hprof_array_data.ids, fakes[2][3])
 
 		self.assertEqual(cls2.call_args_list[0][0], (79,))
 		self.assertEqual(cls2.call_args_list[0][1], {})
 		self.assertIn(79, self.heap)
 		self.assertIs(self.heap[79], out3)
-		self.assertIs(self.heap[79]._hprof_array_data, fakes[1][3])
+		self.assertIs(self.heap[79]._hprof_array_data.ids, fakes[1][3])
 
 		self.assertCountEqual(self.heap._instances[cls1], (out1, out2))
 		self.assertCountEqual(self.heap._instances[cls2], (out3,))
+		self.assertEqual(self.heap._array_nbytes[cls1], [3 * self.idsize, 4 * self.idsize])
+		self.assertEqual(self.heap._array_nbytes[cls2], [3 * self.idsize])
 
 		progress.assert_called_once_with(0)
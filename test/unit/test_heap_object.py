@@ -4,7 +4,7 @@
 import unittest
 import hprof
 
-from unittest.mock import MagicMock, PropertyMock
+from unittest.mock import MagicMock
 
 from .util import varyingid, HeapRecordTest
 
@@ -51,22 +51,14 @@ class TestHeapObject(HeapRecordTest):
 		self.assertEqual(self.heap._deferred_objects, expected)
 
 	def test_create_objects(self):
-		cls0attr = MagicMock(
-				_hprof_ifieldvals=PropertyMock(),
-				__bases__ = (hprof.heap.JavaObject,))
-		cls1attr = MagicMock(
-				_hprof_ifieldix = {'blah': 0},
-				_hprof_ifields = {'blah': hprof.jtype.object},
-				_hprof_ifieldvals=PropertyMock(),
-				__bases__ = (hprof.heap.JavaObject,))
-		cls3attr = MagicMock(
-				_hprof_ifieldix = {'some': 0, 'thing': 1},
-				_hprof_ifields = {
-					'some':  hprof.jtype.int,
-					'thing': hprof.jtype.short,
-				},
-				_hprof_ifieldvals=PropertyMock(),
-				__bases__ = (cls1attr,)) # inherits from cls1attr
+		_, cls0attr = hprof.heap._create_class(self.heap.classtree, 'com/example/Zero', None, {}, {})
+		_, cls1attr = hprof.heap._create_class(self.heap.classtree, 'com/example/One', None, {}, {
+			'blah': hprof.jtype.object,
+		})
+		_, cls3attr = hprof.heap._create_class(self.heap.classtree, 'com/example/Three', cls1attr, {}, {
+			'some':  hprof.jtype.int,
+			'thing': hprof.jtype.short,
+		}) # inherits from cls1attr
 		self.heap[0x2020] = cls0attr
 		self.heap[0x2021] = cls1attr
 		self.heap[0x2022] = cls3attr
@@ -83,36 +75,91 @@ class TestHeapObject(HeapRecordTest):
 		progress = MagicMock()
 
 		hprof._heap_parsing.create_instances(self.heap, self.idsize, progress)
+		getvals = hprof.heap.JavaObject._hprof_ifieldvals.__get__
 
 		with self.subTest('0 attrs'):
-			self.assertEqual(cls0attr.call_count, 1)
-			self.assertEqual(cls0attr.call_args[0], (0x0b1ec7,))
-			self.assertEqual(cls0attr.call_args[1], {})
 			obj = self.heap[0x0b1ec7]
-			self.assertIs(obj, cls0attr.return_value)
-			cls0attr._hprof_ifieldvals.assert_called_once_with(())
+			self.assertIs(type(obj), cls0attr)
+			self.assertEqual(hprof.heap.JavaObject._hprof_id.__get__(obj), 0x0b1ec7)
+			self.assertEqual(getvals(obj), ())
 			self.assertCountEqual(self.heap._instances[cls0attr], (obj,))
 
 		with self.subTest('1 attr'):
-			self.assertEqual(cls1attr.call_count, 1)
-			self.assertEqual(cls1attr.call_args_list[0][0], (0x0b1ec6,))
-			self.assertEqual(cls1attr.call_args_list[0][1], {})
 			obj = self.heap[0x0b1ec6]
-			self.assertIs(obj, cls1attr.return_value)
-			self.assertGreaterEqual(cls1attr._hprof_ifieldvals.call_count, 1)
-			self.assertEqual(cls1attr._hprof_ifieldvals.call_args_list[0][0], ((self.id(0x12345678),),))
+			self.assertIs(type(obj), cls1attr)
+			self.assertEqual(hprof.heap.JavaObject._hprof_id.__get__(obj), 0x0b1ec6)
+			self.assertEqual(getvals(obj), (self.id(0x12345678),))
 			self.assertCountEqual(self.heap._instances[cls1attr], (obj,))
 
 		with self.subTest('3 attrs'):
-			self.assertEqual(cls3attr.call_count, 1)
-			self.assertEqual(cls3attr.call_args_list[0][0], (0x0b1ec5,))
-			self.assertEqual(cls3attr.call_args_list[0][1], {})
 			obj = self.heap[0x0b1ec5]
-			self.assertIs(obj, cls3attr.return_value)
-			cls3attr._hprof_ifieldvals.assert_called_once_with((0x98979695-0x100000000,0x1314))
-			self.assertEqual(cls1attr._hprof_ifieldvals.call_count, 2)
-			self.assertEqual(cls1attr._hprof_ifieldvals.call_args_list[1][0], ((self.id(0xabcd0123f),),))
+			self.assertIs(type(obj), cls3attr)
+			self.assertEqual(hprof.heap.JavaObject._hprof_id.__get__(obj), 0x0b1ec5)
+			# one flat tuple; the fields of the super class come last.
+			self.assertEqual(getvals(obj), (0x98979695-0x100000000, 0x1314, self.id(0xabcd0123f)))
 			self.assertCountEqual(self.heap._instances[cls3attr], (obj,))
 
 		self.assertEqual(len(self.heap._deferred_objects), 0)
 		progress.assert_called_once_with(0)
+
+	def test_create_objects_all_types(self):
+		_, objcls = hprof.heap._create_class(self.heap.classtree, 'java/lang/Object', None, {}, {
+			'ref': hprof.jtype.object,
+		})
+		_, subcls = hprof.heap._create_class(self.heap.classtree, 'com/example/Sub', objcls, {}, {
+			'z': hprof.jtype.boolean,
+			'c': hprof.jtype.char,
+			'f': hprof.jtype.float,
+			'd': hprof.jtype.double,
+			'b': hprof.jtype.byte,
+			's': hprof.jtype.short,
+			'i': hprof.jtype.int,
+			'j': hprof.jtype.long,
+		})
+		self.heap[0x2020] = subcls
+		self.heap._instances[subcls] = []
+		self.heap._deferred_objects.append((0x0b1ec7, 0x57acc, 0x2020, self.build()
+				.u1(7)                  # z
+				.u2(0xd801)             # c
+				.u4(0x3e800000)         # f
+				.u8(0x3ff8000000000000) # d
+				.u1(0xff)               # b
+				.u2(0x1234)             # s
+				.i4(-8)                 # i
+				.u8(0x123456789abcdef)  # j
+				.id(0xabcd0123f)        # ref
+		))
+		self.heap._deferred_objects.append((0x0b1ec8, 0x57acc, 0x2020, self.build()
+				.u1(0).u2(0x41).u4(0).u8(0).u1(1).u2(2).i4(3).u8(4).id(0)
+		))
+		hprof._heap_parsing.create_instances(self.heap, self.idsize, MagicMock())
+
+		obj = self.heap[0x0b1ec7]
+		self.assertIs(obj.z, True)
+		self.assertEqual(obj.c, '\ud801')
+		self.assertEqual(obj.f, 0.25)
+		self.assertEqual(obj.d, 1.5)
+		self.assertEqual(obj.b, -1)
+		self.assertEqual(obj.s, 0x1234)
+		self.assertEqual(obj.i, -8)
+		self.assertEqual(obj.j, 0x123456789abcdef)
+		self.assertEqual(obj.ref, self.id(0xabcd0123f))
+
+		obj = self.heap[0x0b1ec8]
+		self.assertIs(obj.z, False)
+		self.assertEqual(obj.c, 'A')
+		self.assertEqual(obj.i, 3)
+		self.assertEqual(obj.ref, 0)
+
+		# the layout is built once per class, and reused.
+		self.assertEqual(list(self.heap._layouts), [subcls])
+
+	def test_create_objects_bad_size(self):
+		_, objcls = hprof.heap._create_class(self.heap.classtree, 'java/lang/Object', None, {}, {
+			'i': hprof.jtype.int,
+		})
+		self.heap[0x2020] = objcls
+		self.heap._instances[objcls] = []
+		self.heap._deferred_objects.append((0x0b1ec7, 0x57acc, 0x2020, self.build().u4(1).u1(2)))
+		with self.assertRaisesRegex(hprof.error.FormatError, '0xb1ec7'):
+			hprof._heap_parsing.create_instances(self.heap, self.idsize, MagicMock())
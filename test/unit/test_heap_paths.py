@@ -0,0 +1,103 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from .util import refdump
+
+# 0x50 -> weak 0x52 -> 0x53, and 0x54 -> 0x55 -> 0x56 -> 0x53.
+# 0x58 is a weak reference to 0x59 that also refers to it strongly, and
+# 0x5b is a cleared weak reference.
+objects = (
+	(0x50, 'com/example/Node', (0x52, 0)),
+	(0x52, 'java/lang/ref/WeakReference', (0x53, 0)),
+	(0x53, 'com/example/Node', (0, 0)),
+	(0x54, 'com/example/Node', (0x55, 0)),
+	(0x55, 'com/example/Node', (0x56, 0x57)),
+	(0x56, 'com/example/Node', (0x53, 0)),
+	(0x57, 'com/example/Node', (0, 0)),
+	(0x58, 'java/lang/ref/WeakReference', (0x59, 0x59)),
+	(0x59, 'com/example/Node', (0, 0)),
+	(0x5a, 'com/example/Node', (0x57, 0)),
+	(0x5b, 'java/lang/ref/WeakReference', (0, 0)),
+)
+roots = (0x50, 0x54, 0x58, 0x50, 0x777)
+
+class TestPathToRoot(unittest.TestCase):
+	def each_heap(self, fn):
+		for mode in ('full', 'index'):
+			for idsize in (4, 8):
+				with self.subTest(mode=mode, idsize=idsize):
+					with hprof.parse(refdump(idsize, objects, roots), mode=mode) as hf:
+						fn(hf.heaps[0])
+
+	def ids(self, path):
+		if path is None:
+			return None
+		return [hprof.heap.JavaObject._hprof_id.__get__(obj) for obj in path]
+
+	def test_strong(self):
+		def check(heap):
+			self.assertEqual(self.ids(heap.path_to_root(heap[0x53])), [0x54, 0x55, 0x56, 0x53])
+			self.assertEqual(self.ids(heap.path_to_root(heap[0x57])), [0x54, 0x55, 0x57])
+			self.assertEqual(self.ids(heap.path_to_root(heap[0x59])), [0x58, 0x59])
+		self.each_heap(check)
+
+	def test_weak(self):
+		def check(heap):
+			self.assertEqual(self.ids(heap.path_to_root(heap[0x53], exclude_weak=False)), [0x50, 0x52, 0x53])
+			self.assertEqual(self.ids(heap.path_to_root(heap[0x59], exclude_weak=False)), [0x58, 0x59])
+		self.each_heap(check)
+
+	def test_root(self):
+		def check(heap):
+			self.assertEqual(self.ids(heap.path_to_root(heap[0x50])), [0x50])
+			obj = heap.classes['java.lang.Object'][0]
+			self.assertEqual(self.ids(heap.path_to_root(hprof.cast(heap[0x54], obj))), [0x54])
+		self.each_heap(check)
+
+	def test_class(self):
+		def check(heap):
+			node, = heap.classes['com.example.Node']
+			path = heap.path_to_root(node)
+			self.assertEqual(self.ids(path[:1]), [0x50])
+			self.assertIs(path[1], node)
+		self.each_heap(check)
+
+	def test_unreachable(self):
+		def check(heap):
+			self.assertIsNone(heap.path_to_root(heap[0x5a]))
+			self.assertIsNone(heap.path_to_root(heap[0x5a], exclude_weak=False))
+		self.each_heap(check)
+
+	def test_cleared_reference(self):
+		def check(heap):
+			weak = heap._weak_referents() # without 0x5b
+			index = heap._graph.index
+			self.assertEqual(weak, {index(0x52): index(0x53), index(0x58): index(0x59)})
+			self.assertIsNone(heap.path_to_root(heap[0x5b]))
+		self.each_heap(check)
+
+	def test_reference_without_referent(self):
+		def check(heap):
+			# a Reference class from some other class loader, without fields.
+			_, other = hprof.heap._create_class(heap.classtree, 'java.lang.ref.Reference', None, {}, {})
+			heap.classes['java.lang.ref.Reference'].append(other)
+			self.assertEqual(self.ids(heap.path_to_root(heap[0x53])), [0x54, 0x55, 0x56, 0x53])
+		self.each_heap(check)
+
+	def test_resolved(self):
+		def check(heap):
+			heap.resolve_references()
+			self.assertEqual(self.ids(heap.path_to_root(heap[0x53])), [0x54, 0x55, 0x56, 0x53])
+		self.each_heap(check)
+
+	def test_no_references(self):
+		data = refdump(4, [obj for obj in objects if 'Weak' not in obj[1]], roots)
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			self.assertEqual(heap._weak_referents(), {})
+			self.assertIsNone(heap.path_to_root(heap[0x59]))
+			self.assertEqual(self.ids(heap.path_to_root(heap[0x53])), [0x54, 0x55, 0x56, 0x53])
+			del heap
@@ -81,6 +81,8 @@ class TestPrimitiveArray(HeapRecordTest):
 		self.heap.classes['boolean[]'] =  boolmock, = (MagicMock(side_effect=(out3,)),)
 		self.heap._instances[shortmock] = []
 		self.heap._instances[ boolmock] = []
+		self.heap._array_nbytes[shortmock] = []
+		self.heap._array_nbytes[ boolmock] = []
 		self.heap._deferred_primarrays.extend(fakes)
 		progress = MagicMock()
 
@@ -110,5 +112,7 @@ class TestPrimitiveArray(HeapRecordTest):
 
 		self.assertCountEqual(self.heap._instances[shortmock], (self.heap[3], self.heap[1]))
 		self.assertCountEqual(self.heap._instances[ boolmock], (self.heap[5],))
+		self.assertEqual(self.heap._array_nbytes[shortmock], [6, 0])
+		self.assertEqual(self.heap._array_nbytes[ boolmock], [1])
 
 		progress.assert_called_once_with(0)
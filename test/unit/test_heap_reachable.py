@@ -0,0 +1,89 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from .util import refdump
+
+# 0x50 -> 0x51 -> weak 0x52 -> 0x53; 0x54 -> 0x55 is garbage, and so is
+# the weak reference 0x56.
+objects = (
+	(0x50, 'com/example/Node', (0x51, 0)),
+	(0x51, 'com/example/Node', (0x52, 0x50)),
+	(0x52, 'java/lang/ref/WeakReference', (0x53, 0)),
+	(0x53, 'com/example/Node', (0, 0)),
+	(0x54, 'com/example/Node', (0x55, 0x53)),
+	(0x55, 'com/example/Node', (0, 0)),
+	(0x56, 'java/lang/ref/WeakReference', (0x50, 0)),
+)
+roots = (0x50, 0x777)
+
+def objid(obj):
+	return hprof.heap.JavaObject._hprof_id.__get__(obj)
+
+class TestReachable(unittest.TestCase):
+	def each_heap(self, fn):
+		for mode in ('full', 'index'):
+			with self.subTest(mode=mode):
+				with hprof.parse(refdump(4, objects, roots), mode=mode) as hf:
+					fn(hf.heaps[0])
+
+	def test_is_reachable(self):
+		def check(heap):
+			for objid in (0x50, 0x51, 0x52, 0x53):
+				self.assertTrue(heap.is_reachable(heap[objid]), hex(objid))
+			for objid in (0x54, 0x55, 0x56):
+				self.assertFalse(heap.is_reachable(heap[objid]), hex(objid))
+			for cls in heap.values():
+				if isinstance(cls, hprof.heap.JavaClass):
+					self.assertTrue(heap.is_reachable(cls), cls)
+			obj, = heap.classes['java.lang.Object']
+			self.assertFalse(heap.is_reachable(hprof.cast(heap[0x55], obj)))
+		self.each_heap(check)
+
+	def test_instances(self):
+		def check(heap):
+			ids = lambda objs: sorted(map(objid, objs))
+			self.assertEqual(ids(heap.exact_instances('com.example.Node', True)), [0x50, 0x51, 0x53])
+			self.assertEqual(ids(heap.exact_instances('com.example.Node', reachable=False)), [0x54, 0x55])
+			self.assertEqual(len(list(heap.exact_instances('com.example.Node'))), 5)
+			self.assertEqual(ids(heap.all_instances('java.lang.Object', False)), [0x54, 0x55, 0x56])
+			self.assertEqual(len(list(heap.all_instances('java.lang.Object', True))), 4)
+		self.each_heap(check)
+
+	def test_by_class(self):
+		def check(heap):
+			bycls = lambda reachable: {
+				str(cls): counts
+				for cls, counts in heap.shallow_size_by_class(reachable).items()
+			}
+			self.assertEqual(bycls(True), {
+				'com.example.Node': (3, 48),
+				'java.lang.ref.WeakReference': (1, 16),
+			})
+			self.assertEqual(bycls(False), {
+				'com.example.Node': (2, 32),
+				'java.lang.ref.WeakReference': (1, 16),
+			})
+			self.assertEqual(bycls(None), {
+				'com.example.Node': (5, 80),
+				'java.lang.ref.WeakReference': (2, 32),
+			})
+		self.each_heap(check)
+
+	def test_progress(self):
+		def check(heap):
+			calls = []
+			marks = heap.compute_reachable(lambda *args: calls.append(args))
+			self.assertIs(heap.compute_reachable(), marks)
+			self.assertEqual(calls[-2:], [('marking reachable objects', 0, 1), ('marking reachable objects', 1, 1)])
+			self.assertEqual(sum(marks), 4 + 4) # 4 objects, 4 classes
+		self.each_heap(check)
+
+	def test_no_roots(self):
+		with hprof.parse(refdump(4, objects, ())) as hf:
+			heap, = hf.heaps
+			self.assertFalse(heap.is_reachable(heap[0x50]))
+			self.assertEqual(list(heap.all_instances('java.lang.Object', True)), [])
+			del heap
@@ -6,7 +6,10 @@ import unittest
 
 from unittest.mock import MagicMock
 
-resolve = hprof._heap_parsing.resolve_heap_references
+from .util import hprofdata
+
+getvals = hprof.heap.JavaObject._hprof_ifieldvals.__get__
+setvals = hprof.heap.JavaObject._hprof_ifieldvals.__set__
 
 class TestHeapRefResolution(unittest.TestCase):
 
@@ -43,6 +46,9 @@ class TestHeapRefResolution(unittest.TestCase):
 				self.heap.classtree, '[I', self.ObjectCls, {}, {}
 		)
 
+		for cls in (self.ObjectCls, self.ObjectArrayCls, self.StringCls, self.IntArrayCls):
+			cls._hprof_heap = self.heap
+
 		self.heap[0x0c]  = self.ObjectCls
 		self.heap[0x0ac] = self.ObjectArrayCls
 		self.heap[0x5c]  = self.StringCls
@@ -54,24 +60,21 @@ class TestHeapRefResolution(unittest.TestCase):
 		self.heap.classes['int[]']              = [self.IntArrayCls]
 
 		self.f00d = self.heap[0xf00d] = self.StringCls(0xf00d)
-		self.ObjectCls._hprof_ifieldvals.__set__(self.f00d, (10, 0xfade, 20, 0xf00d))
-		self.StringCls._hprof_ifieldvals.__set__(self.f00d, (0xdead,))
+		setvals(self.f00d, (0xdead, 10, 0xfade, 20, 0xf00d))
 
 		self.fade = self.heap[0xfade] = self.ObjectCls(0xfade)
-		self.ObjectCls._hprof_ifieldvals.__set__(self.fade, (1, 0xdead, 2, 0xdead))
+		setvals(self.fade, (1, 0xdead, 2, 0xdead))
 
 		self.dead = self.heap[0xdead] = self.StringCls(0xdead)
-		self.ObjectCls._hprof_ifieldvals.__set__(self.dead, (11, 0x0000, 20, 0xfade))
-		self.StringCls._hprof_ifieldvals.__set__(self.dead, (0xbeef,))
+		setvals(self.dead, (0xbeef, 11, 0x0000, 20, 0xfade))
 
 		self.beef = self.heap[0xbeef] = self.ObjectArrayCls(0xbeef)
-		self.beef._hprof_array_data = (0xf00d, 0xdead, 0xfade, 0xf00d, 0xfade)
+		self.beef._hprof_array_data = hprof.heap._RefArrayData(self.heap, (0xf00d, 0xdead, 0xfade, 0xf00d, 0xfade))
 
 		self.ints = self.heap[0x1111] = self.IntArrayCls(0x1111)
 		self.ints._hprof_array_data = hprof.heap._DeferredArrayData(hprof.jtype.int, b'abcdefgh')
 
 	def test_objarray_resolution(self):
-		resolve(self.heap, None)
 		self.assertEqual(len(self.beef), 5)
 		self.assertIs(self.beef[0], self.f00d)
 		self.assertIs(self.beef[1], self.dead)
@@ -79,14 +82,20 @@ class TestHeapRefResolution(unittest.TestCase):
 		self.assertIs(self.beef[3], self.f00d)
 		self.assertIs(self.beef[4], self.fade)
 
+	def test_deferred_objarray_resolution(self):
+		raw = b'\x00\x00\xde\xad\x00\x00\x00\x00\x00\x00\xfa\xde'
+		self.beef._hprof_array_data = hprof.heap._RefArrayData(self.heap, hprof.heap._DeferredArrayData(hprof.jtype.object, raw, 4))
+		self.assertEqual(len(self.beef), 3)
+		self.assertIs(self.beef[0], self.dead)
+		self.assertIsNone(self.beef[1])
+		self.assertIs(self.beef[2], self.fade)
+
 	def test_primarray_no_resolution(self):
-		resolve(self.heap, None)
 		self.assertEqual(len(self.ints), 2)
 		self.assertEqual(self.ints[0], 0x61626364)
 		self.assertEqual(self.ints[1], 0x65666768)
 
 	def test_obj_instance_resolution(self):
-		resolve(self.heap, None)
 		self.assertEqual(self.fade.il, 1)
 		self.assertIs(self.fade.io, self.dead)
 		self.assertEqual(self.fade.ii, 2)
@@ -97,14 +106,12 @@ class TestHeapRefResolution(unittest.TestCase):
 		self.assertIs(self.fade.cp, self.fade)
 
 	def test_obj_class_resolution(self):
-		resolve(self.heap, None)
 		self.assertEqual(self.ObjectCls.cl, 8010)
 		self.assertIs(self.ObjectCls.co, self.f00d)
 		self.assertEqual(self.ObjectCls.ci, 7)
 		self.assertIs(self.ObjectCls.cp, self.fade)
 
 	def test_string_instance_resolution(self):
-		resolve(self.heap, None)
 		with self.subTest('0xf00d'):
 			self.assertEqual(self.f00d.il, 10)
 			self.assertIs(self.f00d.io, self.fade)
@@ -127,7 +134,6 @@ class TestHeapRefResolution(unittest.TestCase):
 			self.assertIs(self.dead.cp, self.fade)
 
 	def test_string_class_resolution(self):
-		resolve(self.heap, None)
 		self.assertEqual(self.StringCls.cl, 8010)
 		self.assertIs(self.StringCls.co, self.f00d)
 		self.assertEqual(self.StringCls.ci, 7)
@@ -135,43 +141,88 @@ class TestHeapRefResolution(unittest.TestCase):
 		self.assertIs(self.StringCls.dummy, self.dead)
 
 	def test_dangling_ref_iattr(self):
-		self.StringCls._hprof_ifieldvals.__set__(self.dead, (0xbadf00d,))
+		setvals(self.dead, (0xbadf00d, 11, 0x0000, 20, 0xfade))
+		self.assertEqual(self.dead.il, 11) # other fields still work
 		with self.assertRaisesRegex(hprof.error.MissingObject, '0xbadf00d'):
-			resolve(self.heap, None)
+			self.dead.iattr
 
 	def test_dangling_ref_sattr(self):
 		self.ObjectCls._hprof_sfields['co'] = hprof._heap_parsing.DeferredRef(0xdeadbeef)
 		with self.assertRaisesRegex(hprof.error.MissingObject, '0xdeadbeef'):
-			resolve(self.heap, None)
+			self.StringCls.co
 
 	def test_dangling_ref_array(self):
-		self.beef._hprof_array_data = (0xf00d, 0xdead, 0xca7f00d, 0xf00d, 0xfade)
+		self.beef._hprof_array_data = hprof.heap._RefArrayData(self.heap, (0xf00d, 0xdead, 0xca7f00d, 0xf00d, 0xfade))
+		self.assertIs(self.beef[1], self.dead)
 		with self.assertRaisesRegex(hprof.error.MissingObject, '0xca7f00d'):
-			resolve(self.heap, None)
+			self.beef[2]
 
-	def test_progress_callback(self):
-		cb = MagicMock()
-		resolve(self.heap, cb)
-		self.assertEqual(cb.call_count, 2)
-		self.assertEqual(cb.call_args_list[0][0], (0,))
-		self.assertEqual(cb.call_args_list[1][0], (9,))
+	def test_no_cache(self):
+		self.assertIs(self.f00d.io, self.fade)
+		self.assertIs(self.beef[0], self.f00d)
+		self.assertEqual(getvals(self.f00d), (0xdead, 10, 0xfade, 20, 0xf00d))
+		self.assertIsNone(self.beef._hprof_array_data.objs)
+
+	def test_cache_iattr(self):
+		self.heap.cache_references = True
+		self.assertIs(self.f00d.io, self.fade)
+		self.assertEqual(getvals(self.f00d), (0xdead, 10, self.fade, 20, 0xf00d))
+		self.assertIs(self.f00d.io, self.fade)
+		self.assertIs(self.f00d.ip, self.f00d)
+		self.assertEqual(getvals(self.f00d), (0xdead, 10, self.fade, 20, self.f00d))
+		self.assertIsNone(self.dead.io)
+		self.assertIsNone(self.dead.io)
+
+	def test_cache_array(self):
+		self.heap.cache_references = True
+		self.assertIs(self.beef[3], self.f00d)
+		data = self.beef._hprof_array_data
+		self.assertEqual(data.objs, (self.f00d, self.dead, self.fade, self.f00d, self.fade))
+		self.assertIsNone(data.ids)
+		self.assertEqual(len(self.beef), 5)
+		self.assertEqual(self.beef[1:3], (self.dead, self.fade))
+		self.heap.cache_references = False
+		self.assertIs(self.beef[4], self.fade)
 
-	def test_progress_callback_no_objs(self):
-		heap = hprof.heap.Heap()
+	def test_resolve_references(self):
+		self.heap._instances = {
+			self.ObjectCls: [self.fade],
+			self.StringCls: [self.f00d, self.dead],
+			self.ObjectArrayCls: [self.beef],
+			self.IntArrayCls: [self.ints],
+		}
+		self.assertIs(self.f00d.iattr, self.dead) # not cached
 		cb = MagicMock()
-		resolve(heap, cb)
-		self.assertEqual(cb.call_count, 2)
-		self.assertEqual(cb.call_args_list[0][0], (0,))
-		self.assertEqual(cb.call_args_list[1][0], (0,))
-
-	def test_progress_callback_many_objs(self):
-		heap = MagicMock()
-		heap._deferred_classes = []
-		heap.values.return_value = (self.ObjectCls for i in range(10009))
-		heap.__len__.return_value = 10009
-		cb = MagicMock()
-		resolve(heap, cb)
-		self.assertEqual(cb.call_count, 3)
-		self.assertEqual(cb.call_args_list[0][0], (0,))
-		self.assertEqual(cb.call_args_list[1][0], (10000,))
-		self.assertEqual(cb.call_args_list[2][0], (10009,))
+		self.heap.resolve_references(cb)
+		self.assertTrue(self.heap.cache_references)
+		self.assertEqual(getvals(self.fade), (1, self.dead, 2, self.dead))
+		self.assertEqual(getvals(self.f00d), (self.dead, 10, self.fade, 20, self.f00d))
+		self.assertEqual(getvals(self.dead), (self.beef, 11, None, 20, self.fade))
+		self.assertEqual(self.beef._hprof_array_data.objs, (self.f00d, self.dead, self.fade, self.f00d, self.fade))
+		self.assertIs(self.ObjectCls._hprof_sfields['co'], self.f00d)
+		self.assertIs(self.StringCls._hprof_sfields['dummy'], self.dead)
+		self.assertEqual(self.ints[1], 0x65666768)
+		calls = [args for args, kwargs in cb.call_args_list]
+		self.assertEqual(calls[0], ('resolving heap', 0, 9))
+		self.assertEqual(calls[-1], ('resolving heap', 9, 9))
+		self.assertEqual(len(calls), 6)
+
+		# again; nothing left to do.
+		self.heap.resolve_references()
+		self.assertEqual(getvals(self.dead), (self.beef, 11, None, 20, self.fade))
+
+	def test_resolve_references_dangling(self):
+		self.heap._instances = {self.StringCls: [self.dead]}
+		setvals(self.dead, (0xbadf00d, 11, 0x0000, 20, 0xfade))
+		with self.assertRaisesRegex(hprof.error.MissingObject, '0xbadf00d'):
+			self.heap.resolve_references()
+
+	def test_resolve_references_index_mode(self):
+		with hprof.parse(hprofdata(4), mode='index') as hf:
+			heap, = hf.heaps
+			self.assertEqual(dict.__len__(heap), 2)
+			heap.resolve_references()
+			self.assertEqual(dict.__len__(heap), 4)
+			p = heap[0x50]
+			self.assertEqual(getvals(p), (7, heap[0x51]))
+			self.assertEqual(getvals(heap[0x51]), (8, None))
@@ -0,0 +1,67 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from .util import sizedump
+
+class TestReferrers(unittest.TestCase):
+	def each_heap(self, fn):
+		for mode in ('full', 'index'):
+			for idsize in (4, 8):
+				with self.subTest(mode=mode, idsize=idsize):
+					with hprof.parse(sizedump(idsize), mode=mode) as hf:
+						fn(hf.heaps[0])
+
+	def test_referrers(self):
+		def check(heap):
+			p50, p51, arr = heap[0x50], heap[0x51], heap[0x60]
+			point, = heap.classes['com.example.Point']
+			obj, = heap.classes['java.lang.Object']
+			self.assertEqual(heap.referrers(p50), [arr])
+			self.assertEqual(heap.referrers(p51), [p50, arr])
+			self.assertEqual(heap.referrers(hprof.cast(p51, obj)), [p50, arr])
+			self.assertEqual(heap.referrers(arr), [])
+			self.assertEqual(heap.referrers(point), [p50, p51])
+			self.assertEqual(len(heap.referrers(obj)), 4) # the other classes
+			del p50, p51, arr
+		self.each_heap(check)
+
+	def test_resolved(self):
+		def check(heap):
+			heap.resolve_references()
+			self.assertEqual(heap.referrers(heap[0x51]), [heap[0x50], heap[0x60]])
+		self.each_heap(check)
+
+	def test_duplicates(self):
+		def check(heap):
+			# an array that refers to the same object twice
+			offsets, sources = heap.compute_referrers()
+			ix = heap._graph.index(0x50)
+			sources.insert(offsets[ix], heap._graph.index(0x60))
+			for i in range(ix + 1, len(offsets)):
+				offsets[i] += 1
+			self.assertEqual(heap.referrers(heap[0x50]), [heap[0x60]])
+		self.each_heap(check)
+
+	def test_index(self):
+		def check(heap):
+			calls = []
+			offsets, sources = heap.compute_referrers(lambda *args: calls.append(args))
+			self.assertIs(heap.compute_referrers(), heap._referrers)
+			self.assertEqual(calls[0], ('building object graph', 0, 11))
+			self.assertEqual(calls[-1], ('indexing referrers', 2, 2))
+			self.assertEqual(len(offsets), len(heap._graph) + 1)
+			self.assertEqual(len(sources), len(heap._graph.targets))
+			del offsets, sources
+		self.each_heap(check)
+
+	def test_not_in_heap(self):
+		def check(heap):
+			other = hprof.heap._create_class(heap.classtree, 'Other', None, {}, {})[1]
+			with self.assertRaises(KeyError):
+				heap.referrers(other)
+			with self.assertRaises(KeyError):
+				heap.referrers(other(0x52))
+		self.each_heap(check)
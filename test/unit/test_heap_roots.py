@@ -4,72 +4,101 @@
 import unittest
 import hprof
 
-from .util import varyingid, HeapRecordTest
+from .util import varyingid, hprofdata, HeapRecordTest
+
+R = hprof.RootKind
 
 @varyingid
 class TestGcRoots(HeapRecordTest):
 
+	def check(self, kind, thread, frame):
+		root = (kind, self.id(0xbadf00d), thread, frame)
+		self.assertEqual(list(self.heap.roots()), [root])
+		self.assertEqual(list(self.heap.roots_of_kind(kind)), [root[1:]])
+		self.assertEqual(len(self.heap), 0) # not an object
+
 	def test_unknown_root(self):
 		self.doit(0xff, self.build().id(0xbadf00d))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.unknown, 0, -1)
 
 	def test_global_jni_root(self):
 		self.doit(0x01, self.build().id(0xbadf00d).id(0x5ef1d))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.jni_global, 0, -1)
 
 	def test_local_jni_root(self):
 		self.doit(0x02, self.build().id(0xbadf00d).u4(0x752ead).i4(3))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.jni_local, 0x752ead, 3)
 
 	def test_java_stack_root(self):
 		self.doit(0x03, self.build().id(0xbadf00d).u4(0x752ead).i4(-1))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.java_frame, 0x752ead, -1)
 
 	def test_native_stack_root(self):
 		self.doit(0x04, self.build().id(0xbadf00d).u4(0x752ead))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.native_stack, 0x752ead, -1)
 
 	def test_sticky_class_root(self):
 		self.doit(0x05, self.build().id(0xbadf00d))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.sticky_class, 0, -1)
 
 	def test_thread_block_root(self):
 		self.doit(0x06, self.build().id(0xbadf00d).u4(0x752ead))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.thread_block, 0x752ead, -1)
 
 	def test_monitor_root(self):
 		self.doit(0x07, self.build().id(0xbadf00d))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.monitor_used, 0, -1)
 
 	def test_thread_object_root(self):
 		self.doit(0x08, self.build().id(0xbadf00d).u4(0x752ead).u4(0x57acc))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.thread_object, 0x752ead, -1)
 
 	def test_interned_str_root(self):
 		self.doit(0x89, self.build().id(0xbadf00d))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.interned_string, 0, -1)
 
 	def test_debugger_root(self):
 		self.doit(0x8b, self.build().id(0xbadf00d))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.debugger, 0, -1)
 
 	def test_vm_internal_root(self):
 		self.doit(0x8d, self.build().id(0xbadf00d))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.vm_internal, 0, -1)
 
 	def test_jni_monitor_root(self):
 		self.doit(0x8e, self.build().id(0xbadf00d).u4(0x752ead).u4(48))
-		# TODO: check added root's attributes
-		# TODO: do reference resolution, check results
+		self.check(R.jni_monitor, 0x752ead, 48)
+
+
+class TestRootTable(unittest.TestCase):
+	expected = [
+		(R.sticky_class, 0x0b1ec7, 0, -1),
+		(R.java_frame, 0x50, 1, 2),
+		(R.thread_object, 0x51, 1, -1),
+	]
+
+	def test_parse(self):
+		for mode in ('full', 'index'):
+			for workers in (None, 2):
+				with self.subTest(mode=mode, workers=workers):
+					with hprof.parse(hprofdata(4, 3, roots=True), mode=mode, workers=workers) as hf:
+						heap, = hf.heaps
+						self.assertCountEqual(heap.roots(), self.expected)
+						del heap
+
+	def test_roots_of_kind(self):
+		with hprof.parse(hprofdata(4, roots=True)) as hf:
+			heap, = hf.heaps
+			self.assertEqual(list(heap.roots_of_kind(R.java_frame)), [(0x50, 1, 2)])
+			self.assertEqual(list(heap.roots_of_kind(0x08)), [(0x51, 1, -1)])
+			self.assertEqual(list(heap.roots_of_kind(R.jni_global)), [])
+			with self.assertRaises(ValueError):
+				heap.roots_of_kind(0x47)
+			del heap
+
+	def test_no_roots(self):
+		with hprof.parse(hprofdata(4)) as hf:
+			heap, = hf.heaps
+			self.assertEqual(list(heap.roots()), [])
+			self.assertEqual(list(heap.roots_of_kind(R.unknown)), [])
+			del heap
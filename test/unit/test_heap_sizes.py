@@ -0,0 +1,110 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from .util import sizedump
+
+class TestShallowSize(unittest.TestCase):
+	expected = {
+		4: {0x50: 16, 0x51: 16, 0x60: 24, 0x70: 24, 0x71: 16, 0x72: 24},
+		8: {0x50: 32, 0x51: 32, 0x60: 48, 0x70: 32, 0x71: 24, 0x72: 32},
+	}
+
+	def each_heap(self, fn, **flags):
+		for mode in ('full', 'index'):
+			for idsize in (4, 8):
+				with self.subTest(mode=mode, idsize=idsize, **flags):
+					with hprof.parse(sizedump(idsize, **flags), mode=mode) as hf:
+						fn(hf.heaps[0], idsize)
+
+	def test_shallow_size(self):
+		def check(heap, idsize):
+			for objid, size in self.expected[idsize].items():
+				self.assertEqual(heap.shallow_size(heap[objid]), size, hex(objid))
+			self.assertEqual(heap.shallow_size(heap[0x11]), 0) # a class
+			obj, = heap.classes['java.lang.Object']
+			self.assertEqual(heap.shallow_size(hprof.cast(heap[0x50], obj)), self.expected[idsize][0x50])
+		self.each_heap(check)
+
+	def test_resolved_array(self):
+		def check(heap, idsize):
+			heap.resolve_references()
+			self.assertEqual(heap.shallow_size(heap[0x60]), self.expected[idsize][0x60])
+		self.each_heap(check)
+
+	def test_alignment(self):
+		def check(heap, idsize):
+			heap.object_alignment = 16
+			self.assertEqual(heap.shallow_size(heap[0x71]), 16 if idsize == 4 else 32)
+			heap.object_alignment = 1
+			self.assertEqual(heap.shallow_size(heap[0x72]), 2 * idsize + 9)
+		self.each_heap(check)
+
+	def test_unrecorded_instance_size(self):
+		def check(heap, idsize):
+			point, = heap.classes['com.example.Point']
+			point._hprof_objsize = None # computed from the fields instead
+			self.assertEqual(heap.shallow_size(heap[0x50]), self.expected[idsize][0x50])
+			point._hprof_objsize = 100
+			self.assertEqual(heap.shallow_size(heap[0x50]), 112 if idsize == 4 else 120)
+		self.each_heap(check)
+
+	def test_android(self):
+		# ART class dumps already include the object header in the instance size.
+		def check(heap, idsize):
+			for objid, size in self.expected[idsize].items():
+				self.assertEqual(heap.shallow_size(heap[objid]), size, hex(objid))
+			heap.object_alignment = 1
+			self.assertEqual(heap.shallow_size(heap[0x50]), 2 * idsize + 4 + idsize)
+			point, = heap.classes['com.example.Point']
+			self.assertEqual(heap.shallow_size_by_class()[point], (2, 2 * (2 * idsize + 4 + idsize)))
+			point._hprof_objsize = None # computed from the fields, plus the header
+			self.assertEqual(heap.shallow_size(heap[0x50]), 2 * idsize + 4 + idsize)
+		self.each_heap(check, dotted=True)
+		self.each_heap(check, heapinfo=True)
+
+	def test_hotspot_header(self):
+		def check(heap, idsize):
+			heap.object_alignment = 1
+			self.assertEqual(heap.shallow_size(heap[0x50]), 2 * idsize + 4 + idsize)
+			self.assertEqual(heap.shallow_size(heap[0x60]), 2 * idsize + 4 + 3 * idsize)
+		self.each_heap(check)
+
+	def by_class(self, idsize):
+		sizes = self.expected[idsize]
+		return {
+			'com.example.Point': (2, sizes[0x50] + sizes[0x51]),
+			'java.lang.Object[]': (1, sizes[0x60]),
+			'int[]': (1, sizes[0x70]),
+			'byte[]': (2, sizes[0x71] + sizes[0x72]),
+		}
+
+	def test_by_class(self):
+		def check(heap, idsize):
+			bycls = {str(cls): counts for cls, counts in heap.shallow_size_by_class().items()}
+			self.assertEqual(bycls, self.by_class(idsize))
+		self.each_heap(check)
+
+	def test_by_class_reachable(self):
+		# there are no GC roots, so every instance and array is garbage.
+		def check(heap, idsize):
+			self.assertEqual(heap.shallow_size_by_class(reachable=True), {})
+			bycls = {str(cls): counts for cls, counts in heap.shallow_size_by_class(reachable=False).items()}
+			self.assertEqual(bycls, self.by_class(idsize))
+		self.each_heap(check)
+
+	def test_by_class_unparsed_array(self):
+		# arrays that the parser did not create are looked at one by one.
+		for idsize in (4, 8):
+			with self.subTest(idsize=idsize):
+				with hprof.parse(sizedump(idsize), mode='full') as hf:
+					heap, = hf.heaps
+					bytecls, = heap.classes['byte[]']
+					arr = bytecls(0x73)
+					arr._hprof_array_data = hprof.heap._DeferredArrayData(hprof.jtype.byte, b'abc')
+					heap._instances[bytecls].append(arr)
+					sizes = self.expected[idsize]
+					self.assertEqual(heap.shallow_size_by_class()[bytecls], (3, sizes[0x71] + sizes[0x72] + heap.shallow_size(arr)))
+					del heap, arr
@@ -0,0 +1,118 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from .util import stringdump
+
+jdk8 = (('value', hprof.jtype.object), ('hash', hprof.jtype.int))
+jdk6 = (('value', hprof.jtype.object), ('offset', hprof.jtype.int), ('count', hprof.jtype.int), ('hash', hprof.jtype.int))
+jdk9 = (('value', hprof.jtype.object), ('hash', hprof.jtype.int), ('coder', hprof.jtype.byte))
+art  = (('count', hprof.jtype.int), ('hash', hprof.jtype.int), ('value', hprof.jtype.object))
+
+chars = ('😀 Fånark!\udc00'.encode('utf-16-be', 'surrogatepass'))
+
+class TestStringValue(unittest.TestCase):
+	def check(self, fields, instances, arrays, expected):
+		for mode in ('full', 'index'):
+			for idsize in (4, 8):
+				with self.subTest(mode=mode, idsize=idsize):
+					data = stringdump(idsize, fields, instances, arrays)
+					with hprof.parse(data, mode=mode) as hf:
+						heap, = hf.heaps
+						for objid, value in expected.items():
+							self.assertEqual(heap.string_value(heap[objid]), value)
+						self.assertCountEqual(
+								((hprof.heap.JavaObject._hprof_id.__get__(s), v) for s, v in heap.iter_strings()),
+								expected.items())
+						del heap
+
+	def test_jdk8(self):
+		self.check(jdk8,
+			((0x50, (0x60, 0)), (0x51, (0x61, 0)), (0x52, (0, 0))),
+			((0x60, hprof.jtype.char, chars), (0x61, hprof.jtype.char, b'')),
+			{0x50: '\U0001f600 Fånark!\udc00', 0x51: '', 0x52: None})
+
+	def test_jdk6(self):
+		self.check(jdk6,
+			((0x50, (0x60, 0, 11, 0)), (0x51, (0x60, 3, 6, 0)), (0x52, (0x60, 10, 0, 0))),
+			((0x60, hprof.jtype.char, chars),),
+			{0x50: '\U0001f600 Fånark!\udc00', 0x51: 'Fånark', 0x52: ''})
+
+	def test_jdk9(self):
+		self.check(jdk9,
+			((0x50, (0x60, 0, 0)), (0x51, (0x61, 0, 1))),
+			((0x60, hprof.jtype.byte, 'Fånark'.encode('latin-1')),
+			 (0x61, hprof.jtype.byte, 'Tōkyō \U0001f600'.encode('utf-16-le'))),
+			{0x50: 'Fånark', 0x51: 'Tōkyō \U0001f600'})
+
+	def test_art(self):
+		self.check(art,
+			((0x50, (13, 0, 0x60)), (0x51, (6, 0, 0x61))),
+			((0x60, hprof.jtype.byte, b'Fa\xe5nark'), (0x61, hprof.jtype.char, 'Tōkyō'.encode('utf-16-be'))),
+			{0x50: 'Fa\xe5nark', 0x51: 'Tōkyō'})
+
+	def test_bad_value_type(self):
+		data = stringdump(4, jdk8, ((0x50, (0x60, 0)),), ((0x60, hprof.jtype.int, b'\0\0\0\1'),))
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			with self.assertRaisesRegex(hprof.error.FormatError, 'int\\[\\]'):
+				heap.string_value(heap[0x50])
+			del heap
+
+	def test_dangling_value(self):
+		for mode in ('full', 'index'):
+			with self.subTest(mode):
+				data = stringdump(4, jdk8, ((0x50, (0x60, 0)),), ())
+				with hprof.parse(data, mode=mode) as hf:
+					heap, = hf.heaps
+					with self.assertRaisesRegex(hprof.error.MissingObject, '0x60'):
+						heap.string_value(heap[0x50])
+					del heap
+
+	def test_not_a_string(self):
+		data = stringdump(4, jdk8, ((0x50, (0x51, 0)), (0x51, (0x60, 0))), ((0x60, hprof.jtype.char, b'\0a'),))
+		with hprof.parse(data, mode='index') as hf:
+			heap, = hf.heaps
+			with self.assertRaisesRegex(TypeError, 'not java.lang.String'):
+				heap.string_value(heap[0x60])
+			with self.assertRaisesRegex(TypeError, 'not a primitive array'):
+				heap.string_value(heap[0x50]) # value is a String
+			del heap
+
+	def test_no_value_field(self):
+		data = stringdump(4, (('hash', hprof.jtype.int),), ((0x50, (0,)),), ())
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			with self.assertRaisesRegex(hprof.error.FormatError, 'no value field'):
+				heap.string_value(heap[0x50])
+			del heap
+
+	def test_resolved_value(self):
+		data = stringdump(4, jdk8, ((0x50, (0x60, 0)), (0x51, (0, 0))), ((0x60, hprof.jtype.char, b'\0a'),))
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			heap.resolve_references()
+			self.assertEqual(heap.string_value(heap[0x50]), 'a')
+			self.assertIsNone(heap.string_value(heap[0x51]))
+			del heap
+
+	def test_cache(self):
+		arrays = [(0x1000 + ix, hprof.jtype.char, str(ix).encode('utf-16-be')) for ix in range(4)]
+		instances = [(0x50 + ix, (0x1000 + ix, 0)) for ix in range(4)]
+		data = stringdump(4, jdk8, instances, arrays)
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			heap.string_cache_size = 2
+			s0, s1, s2, s3 = (heap[0x50 + ix] for ix in range(4))
+			self.assertEqual(heap.string_value(s0), '0')
+			self.assertEqual(heap.string_value(hprof.cast(s1, s1.__class__.__bases__[0])), '1')
+			self.assertEqual(list(heap._string_cache.items()), [(0x50, '0'), (0x51, '1')])
+			heap._string_cache[0x50] = 'cached'
+			self.assertEqual(heap.string_value(s0), 'cached')
+			self.assertEqual(heap.string_value(s2), '2') # evicts s1
+			self.assertEqual(list(heap._string_cache.items()), [(0x50, 'cached'), (0x52, '2')])
+			self.assertEqual(dict(heap.iter_strings())[s3], '3') # not cached
+			self.assertEqual(list(heap._string_cache.items()), [(0x50, 'cached'), (0x52, '2')])
+			del heap, s0, s1, s2, s3
@@ -0,0 +1,155 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import os
+import tempfile
+import unittest
+import hprof
+
+from .util import Builder, Dump, hprofdata, refdump, sizedump
+
+class TestHistogram(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def write(self, data):
+		path = os.path.join(self.tmpdir.name, 'dump.hprof')
+		with open(path, 'wb') as f:
+			f.write(data)
+		return path
+
+	def test_sizes(self):
+		self.assertEqual(hprof.histogram(self.write(sizedump(4))), [
+			('byte[]', 2, 40),
+			('com.example.Point', 2, 32),
+			('int[]', 1, 24),
+			('java.lang.Object[]', 1, 24),
+		])
+
+	def test_android(self):
+		# ART class dumps already include the object header in the instance size.
+		expected = hprof.histogram(self.write(sizedump(4)))
+		self.assertEqual(hprof.histogram(self.write(sizedump(4, dotted=True))), expected)
+		self.assertEqual(hprof.histogram(self.write(sizedump(4, heapinfo=True))), expected)
+
+	def test_same_as_heap(self):
+		for idsize in (3, 4, 8):
+			for data in (sizedump(idsize), sizedump(idsize, dotted=True), sizedump(idsize, heapinfo=True), hprofdata(idsize, 3, roots=True)):
+				with self.subTest(idsize=idsize):
+					hist = hprof.histogram(self.write(data))
+					with hprof.parse(data) as hf:
+						heap, = hf.heaps
+						expected = sorted(
+							(str(cls), count, size)
+							for cls, (count, size) in heap.shallow_size_by_class().items()
+						)
+						del heap
+					self.assertCountEqual(hist, expected)
+
+	def test_nested_class_name(self):
+		data = hprofdata(4).replace(b'com/example/Point', b'com/example$Point')
+		self.assertEqual(hprof.histogram(self.write(data)), [('com.example.Point', 2, 32)])
+
+	def test_progress(self):
+		calls = []
+		path = self.write(sizedump(4))
+		hprof.histogram(path, lambda *args: calls.append(args))
+		size = os.stat(path).st_size
+		self.assertEqual(calls[:2], [('opening', None, None), ('scanning', 0, size)])
+		self.assertEqual(calls[-1], ('scanning', size, size))
+
+	def dump(self, idsize, *heaprecords):
+		return self.write(Dump(idsize).heap(b''.join(heaprecords)))
+
+	def test_unknown_record(self):
+		path = self.dump(4, Builder(4).u1(0x42).id(0x50))
+		with self.assertRaisesRegex(hprof.error.FormatError, '0x42'):
+			hprof.histogram(path)
+
+	def test_unknown_array_type(self):
+		path = self.dump(4, Builder(4).u1(0x23).id(0x50).u4(0).u4(0).u1(0x02))
+		with self.assertRaisesRegex(hprof.error.FormatError, 'array type 0x2'):
+			hprof.histogram(path)
+
+	def test_truncated(self):
+		path = self.dump(4, Builder(4).u1(0x23).id(0x50).u4(0).u4(3).u1(8).add(b'ab'))
+		with self.assertRaises(hprof.error.UnexpectedEof):
+			hprof.histogram(path)
+		path = self.dump(4, Builder(4).u1(0x21).id(0x50).u4(0))
+		with self.assertRaises(hprof.error.UnexpectedEof):
+			hprof.histogram(path)
+
+	def test_missing_class(self):
+		path = self.dump(4, Builder(4).u1(0x21).id(0x50).u4(0).id(0x11).u4(0))
+		with self.assertRaisesRegex(hprof.error.MissingObject, 'class dump for class 0x11'):
+			hprof.histogram(path)
+		path = self.dump(4, Builder(4).u1(0x22).id(0x50).u4(0).u4(0).id(0x11))
+		with self.assertRaisesRegex(hprof.error.MissingObject, 'class load record for class 0x11'):
+			hprof.histogram(path)
+
+
+class TestDiff(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def write(self, name, data):
+		path = os.path.join(self.tmpdir.name, name)
+		with open(path, 'wb') as f:
+			f.write(data)
+		return path
+
+	def test_diff(self):
+		a = self.write('a.hprof', refdump(4, (
+			(0x53, 'com/example/Node', (0, 0)),
+			(0x50, 'com/example/Node', (0, 0)),
+			(0x51, 'java/lang/ref/WeakReference', (0x50, 0)),
+			(0x58, 'java/lang/ref/WeakReference', (0, 0)),
+		), ()))
+		b = self.write('b.hprof', refdump(4, (
+			(0x50, 'com/example/Node', (0, 0)),
+			(0x52, 'com/example/Node', (0, 0)),
+			(0x54, 'com/example/Node', (0, 0)),
+			(0x58, 'java/lang/ref/WeakReference', (0, 0)),
+			(0x59, 'java/lang/ref/WeakReference', (0, 0)),
+		), ()))
+		d = hprof.diff(a, b)
+		self.assertEqual(d.classes, [
+			('com.example.Node', 2, 32, 3, 48),
+			('java.lang.ref.WeakReference', 2, 32, 2, 32),
+		])
+		self.assertEqual(list(d.new), [0x52, 0x54, 0x59])
+		self.assertEqual(list(d.removed), [0x51, 0x53])
+
+		d = hprof.diff(b, a)
+		self.assertEqual(d.classes[-1], ('com.example.Node', 3, 48, 2, 32))
+		self.assertEqual(list(d.new), [0x51, 0x53])
+		self.assertEqual(list(d.removed), [0x52, 0x54, 0x59])
+
+	def test_classes_only_in_one(self):
+		a = self.write('a.hprof', sizedump(4))
+		b = self.write('b.hprof', hprofdata(4))
+		d = hprof.diff(a, b)
+		self.assertEqual(d.classes, [
+			('com.example.Point', 2, 32, 2, 32),
+			('int[]', 1, 24, 0, 0),
+			('java.lang.Object[]', 1, 24, 0, 0),
+			('byte[]', 2, 40, 0, 0),
+		])
+		self.assertEqual(list(d.new), [])
+		self.assertEqual(list(d.removed), [0x60, 0x70, 0x71, 0x72])
+
+	def test_same(self):
+		a = self.write('a.hprof', sizedump(8))
+		calls = []
+		d = hprof.diff(a, a, lambda *args: calls.append(args))
+		self.assertCountEqual([(name, ca, sa) for name, ca, sa, cb, sb in d.classes], hprof.histogram(a))
+		self.assertTrue(all(row[1:3] == row[3:5] for row in d.classes))
+		self.assertEqual((len(d.new), len(d.removed)), (0, 0))
+		self.assertEqual(calls[-1], ('comparing', None, None))
+		self.assertEqual(sum(1 for call in calls if call[0] == 'opening'), 2)
@@ -3,20 +3,29 @@
 
 import unittest
 
+from array import array
+from unittest.mock import MagicMock, patch
+
 import hprof
 from hprof import heap
 
+setvals = heap.JavaObject._hprof_ifieldvals.__set__
+
+def ifields(*names):
+	''' instance fields with the given names, all ints. '''
+	return dict.fromkeys(names, hprof.jtype.int)
+
 class CommonClassTests(object):
 	def setUp(self):
-		_, self.obj = heap._create_class(self, self.names['obj'], None, {}, ('shadow',))
-		_, self.cls = heap._create_class(self, self.names['cls'], self.obj, {}, ('secret',))
-		_, self.lst = heap._create_class(self, self.names['lst'], self.obj, {}, ('next',))
-		_, self.inr = heap._create_class(self, self.names['inn'], self.obj, {}, ('this$0',))
-		_, self.shd = heap._create_class(self, self.names['shd'], self.lst, {}, ('shadow','unique'))
+		_, self.obj = heap._create_class(self, self.names['obj'], None, {}, ifields('shadow'))
+		_, self.cls = heap._create_class(self, self.names['cls'], self.obj, {}, ifields('secret'))
+		_, self.lst = heap._create_class(self, self.names['lst'], self.obj, {}, ifields('next'))
+		_, self.inr = heap._create_class(self, self.names['inn'], self.obj, {}, ifields('this$0'))
+		_, self.shd = heap._create_class(self, self.names['shd'], self.lst, {}, ifields('shadow', 'unique'))
 
 	def test_duplicate_class(self):
 		old = self.java.lang.Class
-		_, newcls = heap._create_class(self, self.names['cls'], self.obj, {}, ('secret',))
+		_, newcls = heap._create_class(self, self.names['cls'], self.obj, {}, ifields('secret'))
 		self.assertIs(old, self.java.lang.Class) # same name object
 		self.assertIsNot(newcls, self.cls)
 
@@ -113,7 +122,7 @@ class CommonClassTests(object):
 		o = self.obj(0xf00d)
 		with self.assertRaises(AttributeError):
 			o.blah = 3
-		self.obj._hprof_ifieldvals.__set__(o, (3,))
+		setvals(o, (3,))
 		self.assertEqual(o.shadow, 3)
 		self.assertIsInstance(o, heap.JavaObject)
 		self.assertIsInstance(o, self.obj)
@@ -132,8 +141,7 @@ class CommonClassTests(object):
 		c = self.cls(0xdead)
 		with self.assertRaises(AttributeError):
 			c.next = 3
-		self.obj._hprof_ifieldvals.__set__(c, (72,))
-		self.cls._hprof_ifieldvals.__set__(c, (78,))
+		setvals(c, (78, 72))
 		self.assertEqual(c.shadow, 72)
 		self.assertEqual(c.secret, 78)
 		self.assertIsInstance(c, heap.JavaObject)
@@ -148,8 +156,7 @@ class CommonClassTests(object):
 		i = self.inr(0x1)
 		with self.assertRaises(AttributeError):
 			i.missing
-		self.obj._hprof_ifieldvals.__set__(i, (101,))
-		self.inr._hprof_ifieldvals.__set__(i, (102,))
+		setvals(i, (102, 101))
 		self.assertEqual(i.shadow, 101)
 		self.assertEqual(getattr(i, 'this$0'), 102)
 		self.assertIsInstance(i, heap.JavaObject)
@@ -162,11 +169,10 @@ class CommonClassTests(object):
 
 
 	def test_double_dollar(self):
-		_, lambdacls = heap._create_class(self, self.names['lam'], self.obj, {'line': 79}, ('closure_x', 'closure_y'))
+		_, lambdacls = heap._create_class(self, self.names['lam'], self.obj, {'line': 79}, ifields('closure_x', 'closure_y'))
 		self.assertEqual(str(lambdacls), 'com.example.Vehicle$$Lambda$1/455659002')
 		lambdaobj = lambdacls(33)
-		self.obj._hprof_ifieldvals.__set__(lambdaobj, (11,))
-		lambdacls._hprof_ifieldvals.__set__(lambdaobj, (10, 20))
+		setvals(lambdaobj, (10, 20, 11))
 		with self.assertRaises(AttributeError):
 			lambdaobj.missing
 		with self.assertRaises(AttributeError):
@@ -186,7 +192,7 @@ class CommonClassTests(object):
 
 	def test_obj_array(self):
 		# the base array class...
-		_, oacls = heap._create_class(self, self.names['oar'], self.obj, {}, ('extrastuff',))
+		_, oacls = heap._create_class(self, self.names['oar'], self.obj, {}, ifields('extrastuff'))
 		self.assertEqual(str(oacls), 'java.lang.Object[]')
 		self.assertEqual(repr(oacls), "<JavaClass 'java.lang.Object[]'>")
 		self.assertTrue(isinstance(oacls, heap.JavaClass))
@@ -196,8 +202,7 @@ class CommonClassTests(object):
 		self.assertTrue(issubclass(oacls, self.obj))
 
 		oarr = oacls(73)
-		self.obj._hprof_ifieldvals.__set__(oarr, (0xbeef,))
-		oarr._hprof_ifieldvals = (49,)
+		oarr._hprof_ifieldvals = (49, 0xbeef)
 		oarr._hprof_array_data = (10, 55, 33)
 		self.assertEqual(len(oarr), 3)
 		self.assertEqual(oarr[0], 10)
@@ -234,7 +239,7 @@ class CommonClassTests(object):
 		self.assertEqual(oarr.extrastuff, 49)
 
 		# ...and a subclass
-		_, lacls = heap._create_class(self, self.names['lar'], oacls, {}, ('more',))
+		_, lacls = heap._create_class(self, self.names['lar'], oacls, {}, ifields('more'))
 		self.assertEqual(str(lacls), 'List$$lambda[]')
 		self.assertEqual(repr(lacls), "<JavaClass 'List$$lambda[]'>")
 		self.assertTrue(isinstance(lacls, heap.JavaClass))
@@ -244,8 +249,7 @@ class CommonClassTests(object):
 		self.assertTrue(issubclass(lacls, oacls))
 
 		larr = lacls(97)
-		oacls._hprof_ifieldvals.__set__(larr, (56,))
-		lacls._hprof_ifieldvals.__set__(larr, (99,))
+		setvals(larr, (99, 56, 0xbeef))
 		larr._hprof_array_data = (1, 3, 5, 7, 9)
 		self.assertEqual(len(larr), 5)
 		self.assertEqual(larr[0], 1)
@@ -290,7 +294,7 @@ class CommonClassTests(object):
 
 	def test_prim_array_types(self):
 		def check(name, expected):
-			clsname, cls = heap._create_class(self, name, self.obj, {}, ())
+			clsname, cls = heap._create_class(self, name, self.obj, {}, {})
 			self.assertIsNone(cls.__module__)
 			self.assertEqual(clsname, expected)
 			self.assertEqual(str(cls), expected)
@@ -324,7 +328,7 @@ class CommonClassTests(object):
 		check(self.names['Jararar'], 'long[][][]')
 
 	def test_prim_array(self):
-		_, sacls = heap._create_class(self, self.names['Sar'], self.obj, {}, ())
+		_, sacls = heap._create_class(self, self.names['Sar'], self.obj, {}, {})
 		self.assertEqual(str(sacls), 'short[]')
 		self.assertEqual(repr(sacls), "<JavaClass 'short[]'>")
 		self.assertTrue(isinstance(sacls, heap.JavaClass))
@@ -334,7 +338,7 @@ class CommonClassTests(object):
 		self.assertTrue(issubclass(sacls, self.obj))
 
 		sarr = sacls(1)
-		self.obj._hprof_ifieldvals.__set__(sarr, (0xf00d,))
+		setvals(sarr, (0xf00d,))
 		sarr._hprof_array_data = (1,2,9)
 
 		self.assertCountEqual(dir(sarr), ('shadow',))
@@ -373,7 +377,7 @@ class CommonClassTests(object):
 
 
 	def test_prim_array_deferred_bool(self):
-		_, acls = heap._create_class(self, self.names['Zar'], self.obj, {}, ())
+		_, acls = heap._create_class(self, self.names['Zar'], self.obj, {}, {})
 		arr = acls(1)
 		data = hprof.heap._DeferredArrayData(hprof.jtype.boolean, b'\x23\x10\xff\x10\x00\x00\x21\x78')
 
@@ -391,7 +395,7 @@ class CommonClassTests(object):
 			arr[8]
 
 	def test_prim_array_deferred_char(self):
-		_, acls = heap._create_class(self, self.names['Car'], self.obj, {}, ())
+		_, acls = heap._create_class(self, self.names['Car'], self.obj, {}, {})
 		arr = acls(1)
 		data = hprof.heap._DeferredArrayData(hprof.jtype.char, b'\0\x57\0\xf6\0\x72\0\x6c\xd8\x01\xdc\x00\0\x21')
 
@@ -407,8 +411,26 @@ class CommonClassTests(object):
 		with self.assertRaises(IndexError):
 			arr[7]
 
+	def test_prim_array_char_surrogates(self):
+		_, acls = heap._create_class(self, self.names['Car'], self.obj, {}, {})
+		for raw, expected in (
+				(b'', ''),
+				(b'\0\x57\0\xf6', 'Wö'),
+				(b'\xd8\x01', '\ud801'),
+				(b'\xdc\x00\xd8\x01', '\udc00\ud801'),
+				(b'\xdc\x00\xd8\x01\xdc\x00\0\x61', '\udc00\ud801\udc00a'),
+				(b'\xd8\x01\0\x61\xd8\x01', '\ud801a\ud801'),
+				(b'\xdb\xff\xdf\xff\xd8\x00\xdc\x00', '\udbff\udfff\ud800\udc00'),
+				(b'\xd8\x3d\xde\x00\0\x21', '\ud83d\ude00!')):
+			with self.subTest(raw):
+				arr = acls(1)
+				arr._hprof_array_data = hprof.heap._DeferredArrayData(hprof.jtype.char, memoryview(raw))
+				self.assertEqual(len(arr), len(raw) // 2)
+				self.assertEqual(arr[:], expected)
+				self.assertEqual(list(arr), list(expected))
+
 	def test_prim_array_deferred_byte(self):
-		_, acls = heap._create_class(self, self.names['Bar'], self.obj, {}, ())
+		_, acls = heap._create_class(self, self.names['Bar'], self.obj, {}, {})
 		arr = acls(1)
 		data = hprof.heap._DeferredArrayData(hprof.jtype.byte, b'\x23\x10\xff\x80\x00\x00\x7f\x78\x84')
 
@@ -427,7 +449,7 @@ class CommonClassTests(object):
 			arr[9]
 
 	def test_prim_array_deferred_short(self):
-		_, sacls = heap._create_class(self, self.names['Sar'], self.obj, {}, ())
+		_, sacls = heap._create_class(self, self.names['Sar'], self.obj, {}, {})
 		sarr = sacls(1)
 		data = hprof.heap._DeferredArrayData(hprof.jtype.short, b'\x23\x10\xff\x10\x00\x00\x21\x78')
 
@@ -449,7 +471,7 @@ class CommonClassTests(object):
 			sarr[4]
 
 	def test_prim_array_deferred_int(self):
-		_, acls = heap._create_class(self, self.names['Iar'], self.obj, {}, ())
+		_, acls = heap._create_class(self, self.names['Iar'], self.obj, {}, {})
 		arr = acls(1)
 		data = hprof.heap._DeferredArrayData(hprof.jtype.int, b'\x23\x10\xff\x80\x00\x00\x7f\x78\x84\x25\x66\x76')
 
@@ -462,7 +484,7 @@ class CommonClassTests(object):
 			arr[3]
 
 	def test_prim_array_deferred_long(self):
-		_, acls = heap._create_class(self, self.names['Jar'], self.obj, {}, ())
+		_, acls = heap._create_class(self, self.names['Jar'], self.obj, {}, {})
 		arr = acls(1)
 		data = hprof.heap._DeferredArrayData(hprof.jtype.long, b'\x23\x10\xff\x80\x00\x00\x7f\x78\x84\x25\x66\x76\x12\x34\x56\x78')
 
@@ -474,7 +496,7 @@ class CommonClassTests(object):
 			arr[2]
 
 	def test_prim_array_deferred_float(self):
-		_, acls = heap._create_class(self, self.names['Far'], self.obj, {}, ())
+		_, acls = heap._create_class(self, self.names['Far'], self.obj, {}, {})
 		arr = acls(1)
 		data = hprof.heap._DeferredArrayData(hprof.jtype.float, b'\x23\x10\xff\x80\x00\x00\x7f\x78\x84\x25\x66\x76')
 
@@ -487,7 +509,7 @@ class CommonClassTests(object):
 			arr[3]
 
 	def test_prim_array_deferred_double(self):
-		_, acls = heap._create_class(self, self.names['Dar'], self.obj, {}, ())
+		_, acls = heap._create_class(self, self.names['Dar'], self.obj, {}, {})
 		arr = acls(1)
 		data = hprof.heap._DeferredArrayData(hprof.jtype.double, b'\x23\x10\xff\x80\x00\x00\x7f\x78\x84\x25\x66\x76\x12\x34\x56\x78')
 
@@ -498,12 +520,131 @@ class CommonClassTests(object):
 		with self.assertRaises(IndexError):
 			arr[2]
 
+	def test_prim_array_bulk_decoding(self):
+		_, acls = heap._create_class(self, self.names['Iar'], self.obj, {}, {})
+		arr = acls(1)
+		data = hprof.heap._DeferredArrayData(hprof.jtype.int, b'\x23\x10\xff\x80\x00\x00\x7f\x78\x84\x25\x66\x76')
+		arr._hprof_array_data = data
+		self.assertEqual(len(arr), 3)
+		self.assertEqual(arr[1], 0x7f78)
+		self.assertEqual(arr[-1], 0x84256676 - 0x100000000)
+		self.assertIsNone(data._decoded) # len() and single elements don't decode it all
+		with self.assertRaises(IndexError):
+			arr[3]
+		with self.assertRaises(IndexError):
+			arr[-4]
+		self.assertEqual(arr[1:], (0x7f78, 0x84256676 - 0x100000000))
+		self.assertIs(arr._hprof_array_data, data)
+		self.assertIsInstance(data._decoded, array)
+		self.assertEqual(data._decoded.typecode, 'i')
+		self.assertEqual(arr[0], 0x2310ff80)
+		self.assertEqual(list(arr), [0x2310ff80, 0x7f78, 0x84256676 - 0x100000000])
+
+	def test_prim_array_iteration(self):
+		_, acls = heap._create_class(self, self.names['Sar'], self.obj, {}, {})
+		arr = acls(1)
+		data = hprof.heap._DeferredArrayData(hprof.jtype.short, b'\x23\x10\xff\x10')
+		arr._hprof_array_data = data
+		self.assertEqual(list(arr), [0x2310, -0xf0])
+		self.assertIsInstance(data._decoded, array)
+
+	def test_prim_array_single_elements(self):
+		raw = b'\x23\x10\xff\x80\x00\x00\x7f\x78\x84\x25\x66\x76\x00\x01\xd8\x3d'
+		for name, t in (
+				('Zar', hprof.jtype.boolean),
+				('Car', hprof.jtype.char),
+				('Bar', hprof.jtype.byte),
+				('Sar', hprof.jtype.short),
+				('Iar', hprof.jtype.int),
+				('Jar', hprof.jtype.long),
+				('Far', hprof.jtype.float),
+				('Dar', hprof.jtype.double)):
+			with self.subTest(name):
+				_, acls = heap._create_class(self, self.names[name], self.obj, {}, {})
+				arr = acls(1)
+				arr._hprof_array_data = hprof.heap._DeferredArrayData(t, raw)
+				singles = [arr[ix] for ix in range(len(arr))]
+				self.assertIsNone(arr._hprof_array_data._decoded)
+				self.assertEqual(singles, list(arr[:]))
+				self.assertEqual([type(v) for v in singles], [type(v) for v in arr[:]])
+		data = hprof.heap._DeferredArrayData(hprof.jtype.object, raw, 4)
+		singles = [data[ix] for ix in range(len(data))]
+		self.assertEqual(data[-1], 0x0001d83d)
+		self.assertIsNone(data._decoded)
+		self.assertEqual(singles, list(data[:]))
+
+	def test_prim_array_big_endian_host(self):
+		_, acls = heap._create_class(self, self.names['Sar'], self.obj, {}, {})
+		arr = acls(1)
+		raw = b'\x23\x10\xff\x10'
+		arr._hprof_array_data = hprof.heap._DeferredArrayData(hprof.jtype.short, raw)
+		with patch('sys.byteorder', 'big'):
+			arr[:]
+		view = arr._hprof_array_data._decoded
+		self.assertIsInstance(view, memoryview) # no copy
+		self.assertEqual(view.format, 'h')
+		self.assertEqual(view.tobytes(), raw)
+
+	def test_as_ndarray(self):
+		numpy = MagicMock()
+		raw = b'\x23\x10\xff\x10\x00\x00\x21\x78'
+		with patch.dict('sys.modules', numpy=numpy):
+			for name, t, dtype in (
+					('Zar', hprof.jtype.boolean, '?'),
+					('Car', hprof.jtype.char, '>u2'),
+					('Bar', hprof.jtype.byte, 'i1'),
+					('Sar', hprof.jtype.short, '>i2'),
+					('Iar', hprof.jtype.int, '>i4'),
+					('Jar', hprof.jtype.long, '>i8'),
+					('Far', hprof.jtype.float, '>f4'),
+					('Dar', hprof.jtype.double, '>f8')):
+				with self.subTest(name):
+					_, acls = heap._create_class(self, self.names[name], self.obj, {}, {})
+					arr = acls(1)
+					arr._hprof_array_data = hprof.heap._DeferredArrayData(t, raw)
+					numpy.reset_mock()
+					self.assertIs(hprof.as_ndarray(arr), numpy.frombuffer.return_value)
+					numpy.frombuffer.assert_called_once_with(raw, dtype=dtype)
+					arr[:] # decoding doesn't change anything
+					self.assertIs(hprof.as_ndarray(hprof.cast(arr, self.obj)), numpy.frombuffer.return_value)
+
+	def test_as_ndarray_not_primitive(self):
+		_, oacls = heap._create_class(self, self.names['oar'], self.obj, {}, {})
+		arr = oacls(1)
+		arr._hprof_array_data = hprof.heap._DeferredArrayData(hprof.jtype.object, b'\0\0\0\1', 4)
+		with patch.dict('sys.modules', numpy=MagicMock()):
+			with self.assertRaisesRegex(TypeError, 'not a primitive array'):
+				hprof.as_ndarray(arr)
+			with self.assertRaisesRegex(TypeError, 'not a primitive array'):
+				hprof.as_ndarray(self.obj(2))
+
+
+	def test_obj_array_deferred(self):
+		_, oacls = heap._create_class(self, self.names['oar'], self.obj, {}, {})
+		raw = b'\x00\x00\x00\x00\x00\x00\x00\x20\x00\x00\x00\x00\x01\x02\x03\x04\xf0\x00\x00\x00\x00\x00\x00\x02'
+		for idsize, expected in (
+			(3, (0x000000, 0x000000, 0x002000, 0x000000, 0x010203, 0x04f000, 0x000000, 0x000002)),
+			(4, (0x00000000, 0x00000020, 0x00000000, 0x01020304, 0xf0000000, 0x00000002)),
+			(8, (0x0000000000000020, 0x0000000001020304, 0xf000000000000002)),
+		):
+			with self.subTest(idsize=idsize):
+				arr = oacls(1)
+				arr._hprof_array_data = hprof.heap._DeferredArrayData(hprof.jtype.object, raw, idsize)
+				self.assertEqual(len(arr), len(expected))
+				for ix, val in enumerate(expected):
+					self.assertEqual(arr[ix], val)
+				with self.assertRaises(IndexError):
+					arr[len(expected)]
+
 
 	def test_static_vars(self):
 		c = self.cls(11)
 		l = self.lst(22)
+		_, acls = heap._create_class(self, self.names['Iar'], self.obj, {}, {})
+		a = acls(33)
 		self.obj._hprof_sfields['sGlobalLock'] = 10
 		self.assertEqual(self.obj.sGlobalLock, 10)
+		self.assertEqual(a.sGlobalLock, 10) # through the array class
 		self.assertEqual(self.cls.sGlobalLock, 10)
 		self.assertEqual(self.lst.sGlobalLock, 10)
 		self.assertEqual(c.sGlobalLock, 10)
@@ -524,14 +665,26 @@ class CommonClassTests(object):
 			self.c.sMissing
 		with self.assertRaises(AttributeError):
 			self.l.sMissing
+		with self.assertRaises(AttributeError):
+			a.sMissing
+
+	def test_static_and_instance_vars(self):
+		_, base = heap._create_class(self, self.names['ext'], self.shd, {'unique': 1, 'sOnly': 2}, ifields('next'))
+		_, sub = heap._create_class(self, self.names['str'], base, {'next': 3}, {})
+		e = sub(0xbadf00d)
+		setvals(e, (709, 2223, 33, 708, 1111))
+		self.assertEqual(e.next, 3)     # sub's static shadows base's field
+		self.assertEqual(e.unique, 1)   # base's static shadows shd's field
+		self.assertEqual(e.sOnly, 2)
+		self.assertEqual(e.shadow, 2223)
+		self.assertEqual(hprof.cast(e, base).next, 709)
+		self.assertEqual(hprof.cast(e, self.shd).unique, 33)
+		self.assertEqual(hprof.cast(e, self.shd).next, 708)
 
 	def test_refs(self):
-		_, extraclass = heap._create_class(self, self.names['ext'], self.shd, {}, ('shadow',))
+		_, extraclass = heap._create_class(self, self.names['ext'], self.shd, {}, ifields('shadow'))
 		e = extraclass(0xbadf00d)
-		self.obj._hprof_ifieldvals.__set__(e, (1111,))
-		self.lst._hprof_ifieldvals.__set__(e, (708,))
-		self.shd._hprof_ifieldvals.__set__(e, (2223, 33))
-		extraclass._hprof_ifieldvals.__set__(e, (10,))
+		setvals(e, (10, 2223, 33, 708, 1111))
 
 		self.assertEqual(e.shadow, 10)
 		self.assertEqual(e.unique, 33)
@@ -618,7 +771,7 @@ class CommonClassTests(object):
 		self.assertIs(hprof.cast(o), s)
 
 	def test_refs_to_class(self):
-		_, string = heap._create_class(self, self.names['str'], self.obj, {}, ('chars',))
+		_, string = heap._create_class(self, self.names['str'], self.obj, {}, ifields('chars'))
 		o = hprof.cast(string, self.obj)
 		c = hprof.cast(string, self.cls)
 		self.assertIs(o, string)
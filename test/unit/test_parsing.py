@@ -14,12 +14,13 @@ class TestOpen(unittest.TestCase):
 		for ext in ('txt', 'txt.bz2', 'txt.gz', 'txt.xz'):
 			with self.subTest(ext):
 				@contextmanager
-				def checkf(hf, f, cb):
+				def checkf(hf, f, cb, parsefn=None):
 					self.assertIs(type(hf), hprof._parsing.HprofFile)
 					self.assertIsInstance(f, IOBase)
 					self.assertEqual(f.read(), b'Hello World!\n')
 					self.assertEqual(f.read(), b'')
 					self.assertIs(cb, progress)
+					self.assertIsNone(parsefn)
 					yield
 					cleanup()
 				for progress in (None, MagicMock()):
@@ -109,6 +110,12 @@ class TestPublicParseErrors(unittest.TestCase):
 						with self.assertRaises(errtype, msg='boo'):
 							hprof.parse(indata)
 
+	def test_bad_mode(self):
+		with self.assertRaisesRegex(ValueError, 'lazy'):
+			hprof.parse(b'Hello World!\n', mode='lazy')
+		with self.assertRaisesRegex(ValueError, 'lazy'):
+			hprof.open('testdata/helloworld.txt', mode='lazy')
+
 	def test_keep_mview_gz(self):
 		import gzip
 		with patch('hprof._parsing._parse', side_effect=lambda hf, mview, cb: setattr(hf, 'val', mview[1:])):
@@ -184,7 +191,7 @@ class TestParseHprof(unittest.TestCase):
 			with self.subTest(n):
 				progress = MagicMock()
 				with self.assertRaises(hprof.error.UnexpectedEof):
-					hprof._parsing._parse_hprof(sentinel.hf, indata[:n], progress)
+					hprof._parsing._parse_hprof(hprof._parsing.HprofFile(), indata[:n], progress)
 				self.assertEqual(progress.call_count, 1 if n < 31 else 2)
 				self.assertEqual(progress.call_args_list[0][0], ('parsing', 0, n))
 				self.assertEqual(progress.call_args_list[0][1], {})
@@ -232,9 +239,9 @@ class TestParseHprof(unittest.TestCase):
 	def test_one_record_no_progress(self):
 		indata = b'JAVA PROFILE 1.0.1\0\0\0\0\4\0\1\2\3\4\5\6\7\x50\0\0\0\0\0\0\0\2\x33\x44'
 		mock_parsers = { 0x50: unittest.mock.MagicMock() }
-		hf = sentinel.hf
+		hf = hprof._parsing.HprofFile()
 		with patch('hprof._parsing.record_parsers', mock_parsers), patch('hprof._parsing._resolve_references') as resolve, patch('hprof._parsing._instantiate') as instantiate:
-			hprof._parsing._parse_hprof(sentinel.hf, indata, None)
+			hprof._parsing._parse_hprof(hf, indata, None)
 		self.assertEqual(mock_parsers[0x50].call_count, 1)
 		self.assertIs(mock_parsers[0x50].call_args[0][0], hf)
 		self.assertIsInstance(mock_parsers[0x50].call_args[0][1], hprof._parsing.PrimitiveReader)
@@ -307,7 +314,7 @@ class TestParseHprof(unittest.TestCase):
 class TestInstantiate(unittest.TestCase):
 	def test_instantiates_one_heap(self):
 		hf = MagicMock(_pending_heap=None)
-		heap1 = MagicMock(_deferred_classes=[])
+		heap1 = MagicMock(_deferred_classes=[], _table=None)
 		hf.heaps = [heap1]
 		idsize = MagicMock()
 		with patch('hprof._heap_parsing.create_primarrays') as prims, patch('hprof._heap_parsing.create_objarrays') as oarrs, patch('hprof._heap_parsing.create_instances') as objs:
@@ -333,19 +340,19 @@ class TestInstantiate(unittest.TestCase):
 			self.assertTrue(callable(objs.call_args[0][2]))
 
 	def test_instantiates_three_heaps(self):
-		heap1 = MagicMock(_deferred_classes=[])
+		heap1 = MagicMock(_deferred_classes=[], _table=None)
 		heap1.__len__.return_value = 20
 		heap1._deferred_objects = ['a']
 		heap1._deferred_primarrays = ['b', 'c']
 		heap1._deferred_objarrays = ['d']
 
-		heap2 = MagicMock(_deferred_classes=[])
+		heap2 = MagicMock(_deferred_classes=[], _table=None)
 		heap2.__len__.return_value = 10
 		heap2._deferred_objects = []
 		heap2._deferred_primarrays = ['e', 'f', 'g']
 		heap2._deferred_objarrays = []
 
-		heap3 = MagicMock(_deferred_classes=[])
+		heap3 = MagicMock(_deferred_classes=[], _table=None)
 		heap3.__len__.return_value = 30
 		heap3._deferred_objects = ['i', 'j', 'k']
 		heap3._deferred_primarrays = ['l', 'm', 'n']
@@ -432,51 +439,46 @@ class TestInstantiate(unittest.TestCase):
 			self.assertEqual(callback.call_args_list[1][0], ('instantiating heap 2/3', 3, 3))
 			self.assertEqual(callback.call_args_list[2][0], ('instantiating heap 3/3', 9, 9))
 
-class TestResolveReferences(unittest.TestCase):
-	def test_resolves_one_heap(self):
-		hf = MagicMock(_pending_heap=None)
-		heap1 = MagicMock()
-		hf.heaps = [heap1]
-		with patch('hprof._heap_parsing.resolve_heap_references') as rhr:
-			hprof._parsing._resolve_references(hf, None)
-			self.assertEqual(rhr.call_count, 1)
-			self.assertEqual(rhr.call_args[1], {})
-			self.assertEqual(len(rhr.call_args[0]), 2)
-			self.assertIs(rhr.call_args[0][0], heap1)
-			self.assertIsNone(rhr.call_args[0][1])
-
-	def test_resolves_three_heaps(self):
+	def test_indexes_heaps(self):
+		heap1 = MagicMock(_deferred_classes=[])
+		heap2 = MagicMock(_deferred_classes=[])
 		callback = MagicMock()
-		heap1 = MagicMock()
-		heap1.__len__.return_value = 20
-		heap2 = MagicMock()
-		heap2.__len__.return_value = 10
-		heap3 = MagicMock()
-		heap3.__len__.return_value = 30
-		hf = MagicMock(_pending_heap=None)
-		hf.heaps = [heap1, heap2, heap3]
-		rhr = MagicMock(side_effect=lambda h,cb: cb(h))
-		with patch('hprof._heap_parsing.resolve_heap_references', rhr):
-			hprof._parsing._resolve_references(hf, callback)
-			self.assertEqual(rhr.call_count, 3)
-			self.assertEqual(callback.call_count, 4)
-
-			self.assertEqual(rhr.call_args_list[0][1], {})
-			self.assertEqual(len(rhr.call_args_list[0][0]), 2)
-			self.assertIs(rhr.call_args_list[0][0][0], heap1)
-			self.assertIsNotNone(rhr.call_args_list[0][0][1])
-
-			self.assertEqual(rhr.call_args_list[1][1], {})
-			self.assertEqual(len(rhr.call_args_list[1][0]), 2)
-			self.assertIs(rhr.call_args_list[1][0][0], heap2)
-			self.assertIsNotNone(rhr.call_args_list[1][0][1])
-
-			self.assertEqual(rhr.call_args_list[2][1], {})
-			self.assertEqual(len(rhr.call_args_list[2][0]), 2)
-			self.assertIs(rhr.call_args_list[2][0][0], heap3)
-			self.assertIsNotNone(rhr.call_args_list[2][0][1])
-
-			self.assertEqual(callback.call_args_list[0][0], ('resolving stacktraces', None, None))
-			self.assertEqual(callback.call_args_list[1][0], ('resolving heap 1/3', heap1, 20))
-			self.assertEqual(callback.call_args_list[2][0], ('resolving heap 2/3', heap2, 10))
-			self.assertEqual(callback.call_args_list[3][0], ('resolving heap 3/3', heap3, 30))
+		hf = MagicMock(_pending_heap=None, _mode='index')
+		hf.heaps = [heap1, heap2]
+		idsize = MagicMock()
+		with patch('hprof._heap_parsing.finish_scan') as scan, patch('hprof._heap_parsing.finish_index') as finish, patch('hprof._heap_parsing.create_instances') as objs:
+			hprof._parsing._instantiate(hf, idsize, callback)
+		self.assertEqual(objs.call_count, 0)
+		self.assertEqual(scan.call_args_list, [((hf, heap1, hf._data, idsize), {}), ((hf, heap2, hf._data, idsize), {})])
+		self.assertEqual(finish.call_args_list, [((heap1, hf._data, idsize), {}), ((heap2, hf._data, idsize), {})])
+		self.assertEqual(callback.call_count, 2)
+		self.assertEqual(callback.call_args_list[0][0], ('indexing heap 1/2', None, None))
+		self.assertEqual(callback.call_args_list[1][0], ('indexing heap 2/2', None, None))
+
+	def test_scanned_heap_full_mode(self):
+		heap = MagicMock(_deferred_classes=[], _deferred_objects=[], _deferred_objarrays=[], _deferred_primarrays=[])
+		hf = MagicMock(_pending_heap=None, _mode='full')
+		hf.heaps = [heap]
+		idsize = MagicMock()
+		with patch('hprof._heap_parsing.finish_scan') as scan, \
+				patch('hprof._heap_parsing.finish_index') as finish, \
+				patch('hprof._heap_parsing.defer_scanned') as defer, \
+				patch('hprof._heap_parsing.create_instances') as objs:
+			hprof._parsing._instantiate(hf, idsize, None)
+		self.assertEqual(scan.call_args_list, [((hf, heap, hf._data, idsize), {})])
+		self.assertEqual(finish.call_count, 0)
+		self.assertEqual(defer.call_args_list, [((heap, hf._data, idsize), {})])
+		self.assertEqual(objs.call_count, 1)
+
+class TestResolveReferences(unittest.TestCase):
+	def test_heaps_untouched(self):
+		for mode in ('full', 'index'):
+			with self.subTest(mode):
+				callback = MagicMock()
+				heap = MagicMock()
+				hf = MagicMock(_pending_heap=None, _mode=mode)
+				hf.classloads = {}
+				hf.heaps = [heap]
+				hprof._parsing._resolve_references(hf, callback)
+				self.assertEqual(callback.call_args_list, [(('resolving stacktraces', None, None), {})])
+				self.assertEqual(heap.mock_calls, [])
@@ -54,6 +54,16 @@ class TestPrimitiveReader(unittest.TestCase):
 		with self.assertRaises(hprof.error.UnexpectedEof):
 			self.r.bytes(1)
 
+	def test_skip(self):
+		self.r.skip(3)
+		self.assertEqual(self.r.bytes(2), b'yo')
+		self.r.skip(0)
+		with self.assertRaises(hprof.error.UnexpectedEof):
+			self.r.skip(7)
+		self.r.skip(6)
+		with self.assertRaises(hprof.error.UnexpectedEof):
+			self.r.skip(1)
+
 	def test_ascii(self):
 		self.assertEqual(self.r.ascii(), 'hi you')
 		self.assertEqual(self.r.bytes(4), b'\xc3\x9czx')
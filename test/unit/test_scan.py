@@ -0,0 +1,238 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import os
+import tempfile
+import unittest
+import hprof
+
+from unittest.mock import MagicMock, patch
+
+from .util import Builder, Dump, hprofdata
+
+class Recorder(hprof.Visitor):
+	def __init__(self):
+		self.calls = []
+
+	def __getattribute__(self, name):
+		fn = super().__getattribute__(name)
+		if callable(fn) and not name.startswith('_') and name not in self.__dict__:
+			def record(*args):
+				# memoryviews are only valid during the call
+				args = tuple(bytes(a) if isinstance(a, memoryview) else a for a in args)
+				self.calls.append((name,) + args)
+			return record
+		return fn
+
+class Everything(Recorder):
+	pass
+
+for _name in dir(hprof.Visitor):
+	if not _name.startswith('_'):
+		setattr(Everything, _name, lambda self, *args: None)
+
+class Instances(hprof.Visitor):
+	def __init__(self):
+		self.instances = []
+
+	def instance(self, objid, strace, clsid, data):
+		self.instances.append((objid, clsid, bytes(data)))
+
+
+class TestScan(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def write(self, data):
+		path = os.path.join(self.tmpdir.name, 'dump.hprof')
+		with open(path, 'wb') as f:
+			f.write(data)
+		return path
+
+	def test_overridden_only(self):
+		for idsize in (4, 8):
+			with self.subTest(idsize):
+				path = self.write(hprofdata(idsize, 3))
+				v = Instances()
+				self.assertIs(hprof.scan(path, v), v)
+				self.assertCountEqual(v.instances, [
+					(0x50, 0x9017, bytes(Builder(idsize).u4(7).id(0x51))),
+					(0x51, 0x9017, bytes(Builder(idsize).u4(8).id(0))),
+				])
+
+	def test_all_records(self):
+		v = Everything()
+		hprof.scan(self.write(hprofdata(4, 2)), v)
+		self.assertEqual(v.calls[0][:3], ('header', 'JAVA PROFILE 1.0.2', 4))
+		calls = v.calls[1:]
+		names = [c[0] for c in calls]
+		self.assertEqual(names[:6], ['name'] * 5 + ['stack_trace'])
+		self.assertEqual(calls[4], ('name', 0x104, 'unused \U0001f600'))
+		self.assertEqual(calls[5], ('stack_trace', 0, 0, ()))
+		self.assertEqual(calls[6], ('class_load', 1, 0x0b1ec7, 0, 0x100))
+		self.assertEqual(calls[7], ('class_load', 2, 0x9017, 0, 0x101))
+		self.assertEqual(names[8:], [
+			'heap_segment', 'class_dump', 'instance',
+			'heap_segment', 'class_dump', 'instance',
+			'heap_end',
+		])
+		self.assertEqual(calls[12], ('class_dump', 0x9017, 0, 0x0b1ec7, 0, 8, (), (), ((0x102, hprof.jtype.int), (0x103, hprof.jtype.object))))
+
+	def test_nothing_overridden(self):
+		v = Recorder()
+		hprof.scan(self.write(hprofdata(4)), v)
+		self.assertEqual(v.calls, [])
+		hprof.scan(self.write(hprofdata(4)), object())
+
+	def test_other_records(self):
+		data = Dump(4)
+		data.record(0x03, Builder(4).u4(17))
+		data.record(0x04, Builder(4).id(1).id(2).id(3).id(4).u4(5).i4(-1))
+		data.record(0x0e, Builder(4).u4(1).u4(2))
+		data.record(0x0c, b'')
+		v = Everything()
+		hprof.scan(self.write(data), v)
+		self.assertEqual(v.calls, [
+			('header', 'JAVA PROFILE 1.0.2', 4, 0),
+			('class_unload', 17),
+			('stack_frame', 1, 2, 3, 4, 5, -1),
+			('other_record', 0x0e, bytes(Builder(4).u4(1).u4(2))),
+			('heap_segment',),
+			('heap_end',),
+		])
+
+	def heap_records(self, idsize):
+		heap = Builder(idsize)
+		heap.u1(0x20).id(0x10).u4(3).id(0x11).id(0x12).id(0).id(0).id(0).id(0).u4(12)
+		heap.u2(1).u2(5).u1(10).i4(-2)
+		heap.u2(2).id(0x100).u1(2).id(0x50).id(0x101).u1(8).u1(0xff)
+		heap.u2(0)
+		heap.u1(0x22).id(0x60).u4(4).u4(3).id(0x0a77).id(0x50).id(0).id(0x52)
+		heap.u1(0x23).id(0x70).u4(5).u4(3).u1(9).u2(1).u2(2).u2(0xffff)
+		heap.u1(0xfe).u4(1).id(0x200)
+		heap.u1(0xff).id(1)
+		heap.u1(0x01).id(2).id(3)
+		heap.u1(0x02).id(4).u4(5).i4(-1)
+		heap.u1(0x03).id(7).u4(8).u4(9)
+		heap.u1(0x04).id(10).u4(11)
+		heap.u1(0x05).id(12)
+		heap.u1(0x06).id(13).u4(14)
+		heap.u1(0x07).id(15)
+		heap.u1(0x08).id(16).u4(17).u4(18)
+		heap.u1(0x89).id(19)
+		heap.u1(0x8b).id(20)
+		heap.u1(0x8d).id(21)
+		heap.u1(0x8e).id(22).u4(23).i4(-1)
+		heap.instance(0x50, 0x10, Builder(idsize).u4(1).u4(2).u4(3))
+		return heap
+
+	def test_heap_records(self):
+		for idsize in (4, 8):
+			with self.subTest(idsize):
+				heap = self.heap_records(idsize)
+				v = Everything()
+				elements = []
+				def keep(name, objid, strace, t, elems):
+					elements.append((name, objid, strace, t, len(elems), list(elems), elems[-1]))
+				v.object_array = lambda *args: keep('object_array', *args)
+				v.primitive_array = lambda *args: keep('primitive_array', *args)
+				hprof.scan(self.write(Dump(idsize).heap(heap)), v)
+				self.assertEqual(elements, [
+					('object_array', 0x60, 4, 0x0a77, 3, [0x50, 0, 0x52], 0x52),
+					('primitive_array', 0x70, 5, hprof.jtype.short, 3, [1, 2, -1], -1),
+				])
+				self.assertEqual(v.calls, [
+					('header', 'JAVA PROFILE 1.0.2', idsize, 0),
+					('heap_segment',),
+					('class_dump', 0x10, 3, 0x11, 0x12, 12,
+						((5, hprof.jtype.int, -2),),
+						((0x100, hprof.jtype.object, 0x50), (0x101, hprof.jtype.byte, -1)),
+						()),
+					('heap_info', 1, 0x200),
+					('root_unknown', 1),
+					('root_jni_global', 2, 3),
+					('root_jni_local', 4, 5, -1),
+					('root_java_frame', 7, 8, 9),
+					('root_native_stack', 10, 11),
+					('root_sticky_class', 12),
+					('root_thread_block', 13, 14),
+					('root_monitor_used', 15),
+					('root_thread_object', 16, 17, 18),
+					('root_interned_string', 19),
+					('root_debugger', 20),
+					('root_vm_internal', 21),
+					('root_jni_monitor', 22, 23, -1),
+					('instance', 0x50, 0, 0x10, bytes(Builder(idsize).u4(1).u4(2).u4(3))),
+				])
+
+	def test_frames_like_heap_roots(self):
+		# frame numbers are signed; -1 means there is no frame.
+		class Frames(hprof.Visitor):
+			def __init__(self):
+				self.frames = []
+			def root_jni_local(self, objid, thread, frame):
+				self.frames.append((objid, thread, frame))
+			def root_java_frame(self, objid, thread, frame):
+				self.frames.append((objid, thread, frame))
+			def root_jni_monitor(self, objid, thread, frame):
+				self.frames.append((objid, thread, frame))
+		roots = Builder(4)
+		roots.u1(0x02).id(4).u4(5).i4(-1)
+		roots.u1(0x03).id(7).u4(8).u4(9)
+		roots.u1(0x8e).id(22).u4(23).i4(-1)
+		data = Dump(4).heap(roots).end()
+		v = hprof.scan(self.write(data), Frames())
+		self.assertEqual(v.frames, [(4, 5, -1), (7, 8, 9), (22, 23, -1)])
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			self.assertEqual([root[1:] for root in heap.roots()], v.frames)
+			del heap
+
+	def test_unused_records_skipped(self):
+		# records without an overridden method are skipped without decoding them.
+		for idsize in (4, 8):
+			with self.subTest(idsize):
+				data = Dump(idsize).heap(self.heap_records(idsize))
+				v = Instances()
+				with patch('hprof._scan.Elements') as elements, patch('hprof._scan._read_class_dump') as classdump:
+					hprof.scan(self.write(data), v)
+				self.assertEqual(v.instances, [(0x50, 0x10, bytes(Builder(idsize).u4(1).u4(2).u4(3)))])
+				self.assertEqual((elements.call_count, classdump.call_count), (0, 0))
+
+	def test_visitor_defaults(self):
+		v = hprof.Visitor()
+		for name in dir(hprof.Visitor):
+			if not name.startswith('_'):
+				fn = getattr(v, name)
+				nargs = fn.__code__.co_argcount - 1
+				self.assertIsNone(fn(*(None,) * nargs), name)
+
+	def test_bad_heap_record(self):
+		data = Dump(4).heap(Builder(4).u1(0x67).id(0x50))
+		with self.assertRaisesRegex(hprof.error.FormatError, 'unrecognized heap record type 0x67'):
+			hprof.scan(self.write(data), hprof.Visitor())
+
+	def test_bad_header(self):
+		data = Dump(4, 'JAVA PROFILE 6.0.1')
+		with self.assertRaisesRegex(hprof.error.FormatError, 'header'):
+			hprof.scan(self.write(data), hprof.Visitor())
+
+	def test_visitor_error(self):
+		class Failing(hprof.Visitor):
+			def name(self, nameid, name):
+				raise ZeroDivisionError()
+		with self.assertRaises(hprof.error.UnhandledError) as e:
+			hprof.scan(self.write(hprofdata(4)), Failing())
+		self.assertIsInstance(e.exception.__cause__, ZeroDivisionError)
+
+	def test_progress(self):
+		data = hprofdata(4)
+		progress = MagicMock()
+		hprof.scan(self.write(data), hprof.Visitor(), progress)
+		calls = [args for args, kwargs in progress.call_args_list]
+		self.assertEqual(calls[0], ('opening', None, None))
+		self.assertIn(('scanning', 0, len(data)), calls)
+		self.assertEqual(calls[-1], ('scanning', len(data), len(data)))
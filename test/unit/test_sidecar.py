@@ -0,0 +1,149 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import os
+import tempfile
+import unittest
+import hprof
+
+from unittest.mock import MagicMock, patch
+
+from .util import hprofdata
+
+class TestSidecar(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.tmpdir.name, 'dump.hprof')
+		self.idxpath = self.path + '.pyhprof-idx'
+		with open(self.path, 'wb') as f:
+			f.write(hprofdata(4))
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def check(self, hf):
+		self.assertEqual(hf.names[0x104], 'unused \U0001f600')
+		self.assertIsNone(hf.names[0])
+		self.assertEqual(len(hf.classloads), 2)
+		heap, = hf.heaps
+		self.assertEqual(len(heap), 4)
+		p = heap[0x50]
+		self.assertEqual(p.x, 7)
+		self.assertEqual(p.next.x, 8)
+		self.assertIsNone(p.next.next)
+		self.assertCountEqual((o._hprof_id for o in heap.all_instances('com.example.Point')), (0x50, 0x51))
+
+	def test_roundtrip(self):
+		self.assertFalse(os.path.exists(self.idxpath))
+		with hprof.open(self.path, mode='index', sidecar=True) as hf:
+			self.check(hf)
+		self.assertTrue(os.path.exists(self.idxpath))
+		names = MagicMock(wraps=hprof._parsing.parse_name_record)
+		with patch.dict('hprof._parsing.record_parsers', {0x01: names}):
+			with hprof.open(self.path, mode='index', sidecar=True) as hf:
+				self.check(hf)
+		self.assertEqual(names.call_count, 0)
+
+	def test_roots(self):
+		with open(self.path, 'wb') as f:
+			f.write(hprofdata(4, roots=True))
+		for i in range(2):
+			with hprof.open(self.path, mode='index', sidecar=True) as hf:
+				heap, = hf.heaps
+				self.assertCountEqual(heap.roots(), [
+					(hprof.RootKind.sticky_class, 0x0b1ec7, 0, -1),
+					(hprof.RootKind.java_frame, 0x50, 1, 2),
+					(hprof.RootKind.thread_object, 0x51, 1, -1),
+				])
+				del heap
+			self.assertTrue(os.path.exists(self.idxpath))
+
+	def test_progress(self):
+		size = os.stat(self.path).st_size
+		for i in range(2):
+			progress = MagicMock()
+			with hprof.open(self.path, progress, mode='index', sidecar=True):
+				pass
+			calls = [args for args, kwargs in progress.call_args_list]
+			self.assertIn(('loading index', None, None), calls)
+			if i:
+				self.assertNotIn(('parsing', size, size), calls)
+			else:
+				self.assertIn(('parsing', size, size), calls)
+
+	def test_stale(self):
+		with hprof.open(self.path, mode='index', sidecar=True):
+			pass
+		st = os.stat(self.path)
+		os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+		names = MagicMock(wraps=hprof._parsing.parse_name_record)
+		with patch.dict('hprof._parsing.record_parsers', {0x01: names}):
+			with hprof.open(self.path, mode='index', sidecar=True) as hf:
+				self.check(hf)
+				self.assertEqual(names.call_count, 5)
+				names.reset_mock() # drop its references into the file
+
+	def test_changed_contents(self):
+		with hprof.open(self.path, mode='index', sidecar=True):
+			pass
+		data = hprofdata(4)
+		data[-30] ^= 1 # same size, different content
+		st = os.stat(self.path)
+		with open(self.path, 'wb') as f:
+			f.write(data)
+		os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns))
+		mview = memoryview(data)
+		self.assertIsNone(hprof._index.read_sidecar(self.path, mview))
+
+	def test_truncated(self):
+		with hprof.open(self.path, mode='index', sidecar=True):
+			pass
+		with open(self.idxpath, 'rb') as f:
+			full = f.read()
+		mview = memoryview(hprofdata(4))
+		self.assertIsNotNone(hprof._index.read_sidecar(self.path, mview))
+		for n in (0, 10, 72, 80, 100, len(full) - 1):
+			with self.subTest(n):
+				with open(self.idxpath, 'wb') as f:
+					f.write(full[:n])
+				self.assertIsNone(hprof._index.read_sidecar(self.path, mview))
+
+	def test_corrupt_names(self):
+		with hprof.open(self.path, mode='index', sidecar=True):
+			pass
+		with open(self.idxpath, 'rb') as f:
+			full = f.read()
+		mview = memoryview(hprofdata(4))
+		idx = hprof._index
+		pos = idx._header.size
+		n, = idx._count.unpack_from(full, pos)
+		pos += idx._count.size
+		ids = pos # the name id column
+		for col in range(2): # the ids and the lengths
+			_, itemsize = idx._column.unpack_from(full, pos)
+			pos += idx._column.size + n * itemsize
+		blob = pos + idx._count.size
+		bad = bytearray(full)
+		bad[ids + 1] += 1 # item size
+		for data in (full[:blob + 1], bad):
+			with self.subTest(data=len(data)):
+				with open(self.idxpath, 'wb') as f:
+					f.write(data)
+				self.assertIsNone(hprof._index.read_sidecar(self.path, mview))
+
+	def test_missing(self):
+		self.assertIsNone(hprof._index.read_sidecar(self.path, memoryview(hprofdata(4))))
+
+	def test_unwritable(self):
+		def fail(*args):
+			raise PermissionError('nope')
+		with patch('hprof._index.write_sidecar', side_effect=fail) as write:
+			with hprof.open(self.path, mode='index', sidecar=True) as hf:
+				self.check(hf)
+		self.assertEqual(write.call_count, 1)
+		self.assertFalse(os.path.exists(self.idxpath))
+
+	def test_requires_index_mode(self):
+		with self.assertRaisesRegex(ValueError, 'index mode'):
+			hprof.open(self.path, sidecar=True)
+		self.assertFalse(os.path.exists(self.idxpath))
@@ -0,0 +1,132 @@
+# Copyright (C) 2019 Snild Dolkow
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from unittest.mock import MagicMock, patch
+
+from .util import Builder, hprofdata
+
+class TestWorkers(unittest.TestCase):
+	def check(self, hf, arrays=False):
+		heap, = hf.heaps
+		self.assertEqual(len(heap), 8 if arrays else 4)
+		p = heap[0x50]
+		self.assertEqual(p.x, 7)
+		self.assertEqual(p.next.x, 8)
+		self.assertIsNone(p.next.next)
+		self.assertCountEqual((o._hprof_id for o in heap.all_instances('com.example.Point')), (0x50, 0x51))
+		if arrays:
+			self.assertEqual([o and o._hprof_id for o in heap[0x60]], [0x50, None, 0x51])
+			self.assertEqual(list(heap[0x70]), [1, 2, 3])
+			self.assertEqual(heap.instance_count('int[]'), 1)
+		self.assertFalse(heap._scans)
+
+	def test_parallel(self):
+		for mode in ('full', 'index'):
+			for segments in (1, 3):
+				with self.subTest(mode=mode, segments=segments):
+					with hprof.parse(hprofdata(4, segments, arrays=True), mode=mode, workers=2) as hf:
+						self.check(hf, True)
+						self.assertIsNone(hf._pool)
+						if mode == 'full':
+							self.assertIsNone(hf.heaps[0]._table)
+
+	def test_no_fork(self):
+		with patch('multiprocessing.get_context', side_effect=ValueError('no fork')):
+			with patch('hprof._heap_parsing.scan_in_worker') as scan:
+				with hprof.parse(hprofdata(4, 3), workers=2) as hf:
+					self.check(hf)
+		self.assertEqual(scan.call_count, 0)
+
+	def test_one_worker(self):
+		with patch('hprof._heap_parsing.worker_pool') as pool:
+			with hprof.parse(hprofdata(4, 3), mode='index', workers=1) as hf:
+				self.check(hf)
+		self.assertEqual(pool.call_count, 0)
+
+	def test_bad_worker_count(self):
+		for workers in (0, -1):
+			with self.subTest(workers):
+				with self.assertRaisesRegex(ValueError, 'worker'):
+					hprof.parse(hprofdata(4), workers=workers)
+				with self.assertRaisesRegex(ValueError, 'worker'):
+					hprof.open('testdata/helloworld.txt', workers=workers)
+
+	def test_worker_error(self):
+		data = hprofdata(4, 3)
+		data[-9-25] = 0x67 # type of the instance record in the last segment
+		with self.assertRaisesRegex(hprof.error.FormatError, 'unrecognized heap record type 0x67'):
+			hprof.parse(data, workers=2)
+
+	def test_scan_segment(self):
+		for idsize in (4, 8):
+			with self.subTest(idsize=idsize):
+				data = hprofdata(idsize, roots=True, arrays=True)
+				offset, length = self.segment(data, idsize)
+				columns, rootcolumns, android = hprof._heap_parsing.scan_segment(memoryview(data), offset, length, idsize)
+				ids, clsids, kinds, offsets, lengths = columns
+				self.assertEqual(list(ids), [0x0b1ec7, 0x9017, 0x50, 0x51, 0x0a77, 0x1a77, 0x60, 0x70])
+				self.assertEqual(list(kinds), [0x20, 0x20, 0x21, 0x21, 0x20, 0x20, 0x22, 0x23])
+				self.assertEqual(list(clsids)[2:4] + list(clsids)[6:], [0x9017, 0x9017, 0x0a77, hprof.jtype.int.value])
+				for offset, length in zip(offsets, lengths):
+					self.assertIn(data[offset - 1], (0x20, 0x21, 0x22, 0x23))
+				self.assertEqual(list(rootcolumns[1]), [0x0b1ec7, 0x50, 0x51])
+				self.assertFalse(android)
+
+	def test_worker_scan(self):
+		data = memoryview(hprofdata(4, arrays=True))
+		offset, length = self.segment(data, 4)
+		with patch('hprof._heap_parsing._worker_data', data):
+			self.assertEqual(
+				hprof._heap_parsing._worker_scan(offset, length, 4),
+				hprof._heap_parsing.scan_segment(data, offset, length, 4),
+			)
+
+	def test_defer_scanned(self):
+		for idsize in (4, 8):
+			with self.subTest(idsize=idsize):
+				data = memoryview(hprofdata(idsize, arrays=True))
+				heap = hprof.heap.Heap()
+				heap._table = hprof._index.ObjectTable()
+				offset, length = self.segment(data, idsize)
+				columns, rootcolumns, android = hprof._heap_parsing.scan_segment(data, offset, length, idsize)
+				heap._table.extend(columns)
+				hprof._heap_parsing.defer_scanned(heap, data, idsize)
+				self.assertIsNone(heap._table)
+				objects = [(objid, clsid, bytes(vals)) for objid, strace, clsid, vals in heap._deferred_objects]
+				self.assertEqual(objects, [
+					(0x50, 0x9017, bytes(Builder(idsize).u4(7).id(0x51))),
+					(0x51, 0x9017, bytes(Builder(idsize).u4(8).id(0))),
+				])
+				(objid, strace, clsid, elems), = heap._deferred_objarrays
+				self.assertEqual((objid, clsid, list(elems.toarray())), (0x60, 0x0a77, [0x50, 0, 0x51]))
+				(objid, strace, elems), = heap._deferred_primarrays
+				self.assertEqual((objid, elems.jtype, list(elems.toarray())), (0x70, hprof.jtype.int, [1, 2, 3]))
+				del objects, elems
+
+	def segment(self, data, idsize):
+		''' the offset and length of the only heap segment in data. '''
+		reader = hprof._parsing.PrimitiveReader(memoryview(data), idsize)
+		reader.ascii()
+		reader.skip(12)
+		while True:
+			rtype = reader.u1()
+			reader.u4()
+			length = reader.u4()
+			if rtype == 0x1c:
+				return reader._pos, length
+			reader.skip(length)
+
+	def test_segment_to_worker(self):
+		hf = hprof._parsing.HprofFile()
+		hf._pool = MagicMock()
+		reader = hprof._parsing.PrimitiveReader(memoryview(b'abcdef'), 4, 1234)
+		hprof._parsing.record_parsers[0x1c](hf, reader, None)
+		heap = hf._pending_heap
+		self.assertIsInstance(heap._table, hprof._index.ObjectTable)
+		self.assertEqual(len(heap._table), 0)
+		self.assertEqual(hf._pool.apply_async.call_count, 1)
+		self.assertEqual(hf._pool.apply_async.call_args[0][1], (1234, 6, 4))
+		self.assertEqual(heap._scans, [hf._pool.apply_async.return_value])
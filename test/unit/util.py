@@ -94,6 +94,211 @@ class Builder(bytearray):
 		self.extend(bytelike)
 		return self
 
+	def class_dump(self, clsid, superid, objsize, fields, statics=(), constants=()):
+		''' appends a class dump heap record. fields holds (name id, type)
+		pairs, statics (name id, type, value) triples and constants (index,
+		type, value) triples; the values are references or 4-byte values. '''
+		self.u1(0x20).id(clsid).u4(0).id(superid).id(0).id(0).id(0).id(0).id(0).u4(objsize)
+		for entries in (constants, statics):
+			self.u2(len(entries))
+			for key, vtype, val in entries:
+				if entries is constants:
+					self.u2(key)
+				else:
+					self.id(key)
+				self.u1(vtype)
+				if vtype == 2:
+					self.id(val)
+				else:
+					self.u4(val)
+		self.u2(len(fields))
+		for nameid, vtype in fields:
+			self.id(nameid).u1(vtype)
+		return self
+
+	def instance(self, objid, clsid, body):
+		''' appends an instance dump heap record with the encoded field values. '''
+		return self.u1(0x21).id(objid).u4(0).id(clsid).u4(len(body)).add(body)
+
+	def object_array(self, objid, clsid, elems):
+		''' appends an object array dump heap record. '''
+		self.u1(0x22).id(objid).u4(0).u4(len(elems)).id(clsid)
+		for elem in elems:
+			self.id(elem)
+		return self
+
+	def primitive_array(self, objid, t, data):
+		''' appends a primitive array dump heap record with the encoded elements. '''
+		return self.u1(0x23).id(objid).u4(0).u4(len(data) // t.size).u1(t.value).add(data)
+
+
+class Dump(Builder):
+	''' builds a whole hprof file, one record at a time. '''
+	def __init__(self, idsize, header='JAVA PROFILE 1.0.2'):
+		super().__init__(idsize)
+		self.utf8(header + '\0').u4(idsize).u8(0)
+
+	def record(self, rtype, body):
+		return self.u1(rtype).u4(0).u4(len(body)).add(body)
+
+	def names(self, names, first=0x100):
+		''' adds a name record for each string, with consecutive ids. '''
+		for ix, name in enumerate(names):
+			self.record(0x01, Builder(self.idsize).id(first + ix).utf8(name))
+		return self
+
+	def stack_trace(self):
+		''' adds an empty stack trace, serial 0. '''
+		return self.record(0x05, Builder(self.idsize).u4(0).u4(0).u4(0))
+
+	def load(self, serial, clsid, nameid):
+		return self.record(0x02, Builder(self.idsize).u4(serial).id(clsid).u4(0).id(nameid))
+
+	def loads(self, clsids, first=0x100):
+		''' adds a class load record for each class id, with consecutive name
+		ids and serials from 1. '''
+		for ix, clsid in enumerate(clsids):
+			self.load(ix + 1, clsid, first + ix)
+		return self
+
+	def heap(self, body):
+		return self.record(0x1c, body)
+
+	def end(self):
+		return self.record(0x2c, b'')
+
+
+def hprofdata(idsize, segments=1, roots=False, arrays=False):
+	''' a small but complete hprof file, with the heap split into segments,
+	optionally with a few GC roots, and with an Object[] and an int[]. '''
+	heaprecords = (
+		Builder(idsize).class_dump(0x0b1ec7, 0, 0, ()),
+		Builder(idsize).class_dump(0x9017, 0x0b1ec7, 4 + idsize, ((0x102, 10), (0x103, 2))),
+		Builder(idsize).instance(0x50, 0x9017, Builder(idsize).u4(7).id(0x51)),
+		Builder(idsize).instance(0x51, 0x9017, Builder(idsize).u4(8).id(0)),
+	)
+	if roots:
+		heaprecords += (
+			Builder(idsize).u1(0x05).id(0x0b1ec7),
+			Builder(idsize).u1(0x03).id(0x50).u4(1).i4(2),
+			Builder(idsize).u1(0x08).id(0x51).u4(1).u4(0),
+		)
+	if arrays:
+		heaprecords += (
+			Builder(idsize).class_dump(0x0a77, 0x0b1ec7, 0, (), constants=((1, 10, 17),)),
+			Builder(idsize).class_dump(0x1a77, 0x0b1ec7, 0, ()),
+			Builder(idsize).object_array(0x60, 0x0a77, (0x50, 0, 0x51)),
+			Builder(idsize).primitive_array(0x70, hprof.jtype.int, Builder(idsize).u4(1).u4(2).u4(3)),
+		)
+
+	out = Dump(idsize)
+	out.names(('java/lang/Object', 'com/example/Point', 'x', 'next', 'unused \U0001f600'))
+	if arrays:
+		out.names(('[Ljava/lang/Object;', '[I'), 0x105)
+	out.stack_trace()
+	out.load(1, 0x0b1ec7, 0x100)
+	out.load(2, 0x9017, 0x101)
+	if arrays:
+		out.load(3, 0x0a77, 0x105)
+		out.load(4, 0x1a77, 0x106)
+	for i in range(segments):
+		out.heap(b''.join(heaprecords[i::segments]))
+	return out.end()
+
+
+def sizedump(idsize, dotted=False, heapinfo=False):
+	''' an hprof file with a few instances and arrays of different sizes.
+
+	With dotted or heapinfo, it looks like an ART dump: the class names are
+	dotted or there is a heap info record, and the instance size in the class
+	dump includes the object header. '''
+	if dotted:
+		names = ['java.lang.Object', 'com.example.Point', 'java.lang.Object[]', 'int[]', 'byte[]', 'x', 'next']
+	else:
+		names = ['java/lang/Object', 'com/example/Point', '[Ljava/lang/Object;', '[I', '[B', 'x', 'next']
+	hdrsize = 2 * idsize if dotted or heapinfo else 0
+	out = Dump(idsize).names(names).stack_trace().loads(range(0x10, 0x15))
+
+	heap = Builder(idsize)
+	if heapinfo:
+		heap.u1(0xfe).u4(0x41).id(0x100) # 'A'pp heap; any name will do
+	heap.class_dump(0x10, 0, 0, ())
+	heap.class_dump(0x11, 0x10, hdrsize + 4 + idsize, ((0x105, 10), (0x106, 2)))
+	for ix in range(3):
+		heap.class_dump(0x12 + ix, 0x10, 0, ())
+	heap.instance(0x50, 0x11, Builder(idsize).u4(7).id(0x51))
+	heap.instance(0x51, 0x11, Builder(idsize).u4(8).id(0))
+	heap.object_array(0x60, 0x12, (0x50, 0, 0x51))
+	heap.primitive_array(0x70, hprof.jtype.int, Builder(idsize).u4(1).u4(2).u4(3))
+	heap.primitive_array(0x71, hprof.jtype.byte, b'')
+	heap.primitive_array(0x72, hprof.jtype.byte, b'hello')
+	return out.heap(heap).end()
+
+
+def stringdump(idsize, fields, instances, arrays):
+	''' an hprof file with a java.lang.String class with the given instance
+	fields, String instances with the given field values, and (objid, type,
+	elements) primitive arrays. '''
+	names = ['java/lang/Object', 'java/lang/String', '[C', '[B', '[I'] + [name for name, t in fields]
+	out = Dump(idsize).names(names).stack_trace().loads(range(0x10, 0x15))
+
+	heap = Builder(idsize)
+	heap.class_dump(0x10, 0, 0, ())
+	heap.class_dump(0x11, 0x10, 0, [(0x105 + ix, t.value) for ix, (name, t) in enumerate(fields)])
+	heap.class_dump(0x12, 0x10, 0, ())
+	heap.class_dump(0x13, 0x10, 0, ())
+	heap.class_dump(0x14, 0x10, 0, ())
+	for objid, vals in instances:
+		body = Builder(idsize)
+		for (name, t), val in zip(fields, vals):
+			if t is hprof.jtype.object:
+				body.id(val)
+			elif t is hprof.jtype.byte:
+				body.u1(val)
+			else:
+				body.u4(val)
+		heap.instance(objid, 0x11, body)
+	for objid, t, elems in arrays:
+		heap.primitive_array(objid, t, elems)
+	return out.heap(heap).end()
+
+
+refclasses = {
+	'java/lang/Object': (0x10, 0, ()),
+	'java/lang/ref/Reference': (0x11, 0x10, ('referent', 'queue')),
+	'java/lang/ref/WeakReference': (0x12, 0x11, ()),
+	'com/example/Node': (0x13, 0x10, ('next', 'other')),
+}
+
+def refdump(idsize, objects, roots):
+	''' an hprof file with the classes in refclasses, whose fields are all
+	references. objects holds (objid, class name, field values) tuples, with
+	the values in the order of the instance dump record. Each id in roots
+	gets a java frame root. '''
+	names = list(refclasses)
+	fieldnames = [f for clsid, superid, fields in refclasses.values() for f in fields]
+	out = Dump(idsize).names(names + fieldnames).stack_trace()
+	out.loads(refclasses[name][0] for name in names)
+
+	heap = Builder(idsize)
+	def nfields(clsid):
+		for cid, superid, fields in refclasses.values():
+			if cid == clsid:
+				return len(fields) + nfields(superid)
+		return 0
+	for clsid, superid, fields in refclasses.values():
+		# the instance size includes the fields of the super classes.
+		fieldids = [0x100 + len(names) + fieldnames.index(name) for name in fields]
+		heap.class_dump(clsid, superid, nfields(clsid) * idsize, [(nameid, 2) for nameid in fieldids])
+	for objid, clsname, vals in objects:
+		body = Builder(idsize)
+		for val in vals:
+			body.id(val)
+		heap.instance(objid, refclasses[clsname][0], body)
+	for objid in roots:
+		heap.u1(0x03).id(objid).u4(1).i4(0)
+	return out.heap(heap).end()
+
 
 class HeapRecordTest(unittest.TestCase):
 	def setUp(self):